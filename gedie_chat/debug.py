@@ -6,19 +6,45 @@ Monitoramento em tempo real dos estados
 
 import sys
 import os
+import json
+import socket
 import time
 
 # Adicionar src ao path
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
 from config.logging_config import setup_logging
-from config.database_config import SessionLocal
+from config.database_config import ReadSessionLocal
 from models.user_model import User
 from models.category_model import Category
 from models.expense_model import Expense
-from utils.state_manager import state_manager
+from services.introspection_service import parse_address
+from decouple import config
 from loguru import logger
 
+# Endpoint de introspecção do bot em execução (ver services/introspection_service.py)
+INTROSPECTION_ADDRESS = config('INTROSPECTION_ADDRESS', default='gedie_introspection.sock')
+
+def _connect_bot():
+    """Conectar ao endpoint de introspecção do processo do bot"""
+    target = parse_address(INTROSPECTION_ADDRESS)
+    if isinstance(target, tuple):
+        return socket.create_connection(target)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.connect(target)
+    return sock
+
+def _bot_request(cmd, **params):
+    """Enviar comando ao bot e ler a resposta (uma linha JSON)"""
+    with _connect_bot() as sock:
+        sock.sendall(json.dumps({'cmd': cmd, **params}).encode('utf-8') + b'\n')
+        return json.loads(sock.makefile('rb').readline())
+
+def _format_state(event):
+    if not event.get('state'):
+        return f"User {event['user_id']}: (sem estado)"
+    return f"User {event['user_id']}: {event['state']} - {event['data']}"
+
 def debug_user_complete(telegram_id):
     """Debug completo de um usuário específico"""
     
@@ -26,23 +52,22 @@ def debug_user_complete(telegram_id):
     logger.info(f"🔍 DEBUG COMPLETO do usuário {telegram_id}")
     
     try:
-        # Estado na memória
-        print(f"\n📊 ESTADO NA MEMÓRIA:")
-        state = state_manager.get_state(telegram_id)
-        data = state_manager.get_data(telegram_id)
-        print(f"   Estado: {state}")
-        print(f"   Dados: {data}")
+        # Estado no processo do bot
+        print(f"\n📊 ESTADO NO BOT:")
+        event = _bot_request('user', user_id=telegram_id)
+        print(f"   Estado: {event['state']}")
+        print(f"   Dados: {event['data']}")
         
         # Verificar no banco de dados
         print(f"\n🗄️ DADOS NO BANCO:")
-        db = SessionLocal()
+        db = ReadSessionLocal()
         
         user = User.get_by_telegram_id(db, telegram_id)
         if user:
             print(f"   👤 Usuário: {user.nome} (ID: {user.id})")
             
             # Categorias
-            categories = Category.get_user_categories(db, user.id)
+            categories = Category.get_user_categories_cached(db, user.id)
             print(f"   🏷️ Categorias ({len(categories)}):")
             for cat in categories:
                 print(f"      • {cat.icone} {cat.nome} (ID: {cat.id})")
@@ -59,109 +84,82 @@ def debug_user_complete(telegram_id):
         
         # Estados de todos os usuários
         print(f"\n👥 TODOS OS ESTADOS ATIVOS:")
-        all_states = state_manager.list_all_states()
+        all_states = _bot_request('states')['states']
         if all_states:
-            for user_id, state_info in all_states.items():
-                print(f"   • User {user_id}: {state_info}")
+            for event in all_states:
+                print(f"   • {_format_state(event)}")
         else:
             print("   (Nenhum estado ativo)")
         
     except Exception as e:
         logger.error(f"Erro no debug: {e}")
 
-def monitor_user_real_time(telegram_id, interval=2):
-    """Monitorar usuário em tempo real"""
+def monitor_user_real_time(telegram_id=None):
+    """Acompanhar alterações de estado no bot em execução (eventos em push)"""
     
     setup_logging()
-    logger.info(f"🔄 MONITORAMENTO em tempo real do usuário {telegram_id}")
-    print(f"⏰ Atualizando a cada {interval} segundos (Ctrl+C para parar)\n")
+    alvo = f"do usuário {telegram_id}" if telegram_id else "de todos os usuários"
+    logger.info(f"🔄 MONITORAMENTO em tempo real {alvo}")
+    print("(Ctrl+C para parar)\n")
+    
+    request = {'cmd': 'watch'}
+    if telegram_id:
+        request['user_id'] = telegram_id
     
     try:
-        while True:
-            # Limpar tela (funciona no Windows e Linux)
-            os.system('cls' if os.name == 'nt' else 'clear')
-            
-            print(f"🔄 MONITORAMENTO TEMPO REAL - Usuário {telegram_id}")
-            print(f"⏰ {time.strftime('%H:%M:%S')}")
-            print("=" * 50)
-            
-            # Estado atual
-            state = state_manager.get_state(telegram_id)
-            data = state_manager.get_data(telegram_id)
-            
-            print(f"📊 Estado: {state}")
-            print(f"📋 Dados: {data}")
-            
-            # Verificar se há dados críticos
-            if data:
-                category_id = data.get('category_id')
-                amount = data.get('amount')
-                description = data.get('description')
-                
-                print(f"\n🔍 ANÁLISE:")
-                print(f"   Category ID: {category_id} {'✅' if category_id else '❌'}")
-                print(f"   Amount: {amount} {'✅' if amount else '❌'}")
-                print(f"   Description: {description if description else '(não definido)'}")
-            
-            time.sleep(interval)
+        with _connect_bot() as sock:
+            sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+            for line in sock.makefile('rb'):
+                event = json.loads(line)
+                print(f"[{time.strftime('%H:%M:%S', time.localtime(event['at']))}] {_format_state(event)}")
             
     except KeyboardInterrupt:
         print(f"\n🛑 Monitoramento interrompido")
 
 def clear_user_state(telegram_id):
-    """Limpar estado de um usuário"""
-    state_manager.clear_state(telegram_id)
+    """Limpar estado de um usuário no bot em execução"""
+    _bot_request('clear', user_id=telegram_id)
     print(f"🧹 Estado do usuário {telegram_id} limpo")
 
 def simulate_expense_flow(telegram_id, category_id, amount):
-    """Simular fluxo de despesa para teste"""
+    """Simular fluxo de despesa no bot em execução (visível no monitor)"""
     
     setup_logging()
     logger.info(f"🧪 SIMULANDO fluxo de despesa")
     
-    print(f"1. Limpando estado...")
-    state_manager.clear_state(telegram_id)
-    
-    print(f"2. Definindo SELECTING_CATEGORY...")
-    state_manager.set_state(telegram_id, state_manager.ConversationState.SELECTING_CATEGORY)
-    
-    print(f"3. Salvando category_id = {category_id}...")
-    state_manager.set_state(
-        telegram_id, 
-        state_manager.ConversationState.WAITING_AMOUNT,
-        {'category_id': category_id}
-    )
-    
-    print(f"4. Salvando amount = {amount}...")
-    state_manager.update_data(telegram_id, 'amount', amount)
-    
-    print(f"5. Mudando para CONFIRMING_EXPENSE...")
-    current_data = state_manager.get_data(telegram_id)
-    state_manager.set_state(
-        telegram_id,
-        state_manager.ConversationState.CONFIRMING_EXPENSE,
-        current_data
-    )
+    print(f"Limpar → SELECTING_CATEGORY → category_id={category_id} → amount={amount}...")
+    event = _bot_request('simulate', user_id=telegram_id, category_id=category_id, amount=amount)
     
     print(f"\n✅ RESULTADO FINAL:")
-    final_state = state_manager.get_state(telegram_id)
-    final_data = state_manager.get_data(telegram_id)
-    print(f"   Estado: {final_state}")
-    print(f"   Dados: {final_data}")
+    print(f"   Estado: {event['state']}")
+    print(f"   Dados: {event['data']}")
 
 def list_all_states():
-    """Listar todos os estados ativos"""
+    """Listar todos os estados ativos no bot em execução"""
     setup_logging()
     
     print("📋 TODOS OS ESTADOS ATIVOS:")
-    all_states = state_manager.list_all_states()
+    all_states = _bot_request('states')['states']
     
     if all_states:
-        for user_id, state_info in all_states.items():
-            print(f"   • User {user_id}: {state_info}")
+        for event in all_states:
+            print(f"   • {_format_state(event)}")
     else:
         print("   (Nenhum estado ativo)")
 
+def show_stats():
+    """Estatísticas de estados e caches do bot em execução"""
+    print(json.dumps(_bot_request('stats'), indent=2, ensure_ascii=False))
+
+def show_metrics(arg=None):
+    """Métricas das análises de comprovantes (geral, de um usuário ou no formato Prometheus)"""
+    if arg == "--prometheus":
+        print(_bot_request('metrics', format='prometheus')['text'], end='')
+        return
+    
+    params = {'user_id': int(arg)} if arg else {}
+    print(json.dumps(_bot_request('metrics', **params), indent=2, ensure_ascii=False))
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("📖 USO DO SCRIPT DE DEBUG:")
@@ -169,8 +167,8 @@ if __name__ == "__main__":
         print("  python debug.py debug <telegram_id>")
         print("    • Debug completo de um usuário")
         print("")
-        print("  python debug.py monitor <telegram_id> [intervalo]")
-        print("    • Monitorar usuário em tempo real")
+        print("  python debug.py monitor [telegram_id]")
+        print("    • Acompanhar alterações de estado em tempo real")
         print("")
         print("  python debug.py clear <telegram_id>") 
         print("    • Limpar estado de um usuário")
@@ -181,6 +179,12 @@ if __name__ == "__main__":
         print("  python debug.py list")
         print("    • Listar todos os estados ativos")
         print("")
+        print("  python debug.py stats")
+        print("    • Estatísticas de estados e caches")
+        print("")
+        print("  python debug.py metrics [telegram_id | --prometheus]")
+        print("    • Métricas das análises de comprovantes (tempos, bytes, tokens)")
+        print("")
         sys.exit(1)
     
     command = sys.argv[1]
@@ -189,10 +193,9 @@ if __name__ == "__main__":
         telegram_id = int(sys.argv[2])
         debug_user_complete(telegram_id)
         
-    elif command == "monitor" and len(sys.argv) > 2:
-        telegram_id = int(sys.argv[2])
-        interval = int(sys.argv[3]) if len(sys.argv) > 3 else 2
-        monitor_user_real_time(telegram_id, interval)
+    elif command == "monitor":
+        telegram_id = int(sys.argv[2]) if len(sys.argv) > 2 else None
+        monitor_user_real_time(telegram_id)
         
     elif command == "clear" and len(sys.argv) > 2:
         telegram_id = int(sys.argv[2])
@@ -207,5 +210,11 @@ if __name__ == "__main__":
     elif command == "list":
         list_all_states()
         
+    elif command == "stats":
+        show_stats()
+        
+    elif command == "metrics":
+        show_metrics(sys.argv[2] if len(sys.argv) > 2 else None)
+        
     else:
         print("❌ Comando inválido ou parâmetros insuficientes!")
\ No newline at end of file
@@ -19,9 +19,49 @@ from decouple import config
 from loguru import logger
 
 from src.config.logging_config import setup_logging
-from src.config.database_config import test_connection, create_tables
+from src.config.database_config import test_connection
+from src.migrations.migration_runner import run_migrations
 from src.controllers.bot_controller import BotController
 
+async def post_init(application: Application):
+    """Tarefas em background iniciadas junto com o bot"""
+    from services.category_sync_service import CategorySyncService
+    from services.state_snapshot_service import StateSnapshotService
+    from services.introspection_service import IntrospectionServer
+    from services.metrics_service import receipt_metrics
+    application.create_task(CategorySyncService().run())
+    application.create_task(receipt_metrics.run())
+    
+    # Endpoint local de introspecção (python debug.py monitor/list/stats)
+    introspection = IntrospectionServer()
+    await introspection.start()
+    application.bot_data['introspection'] = introspection
+    
+    # Estados da execução anterior voltam antes do polling começar
+    snapshot_service = StateSnapshotService()
+    if snapshot_service.enabled:
+        snapshot_service.restore()
+        application.create_task(snapshot_service.run())
+
+async def post_shutdown(application: Application):
+    """Fechar introspecção, álbuns em coleta e fila de análises e gravar snapshot final dos estados"""
+    from services.state_snapshot_service import StateSnapshotService
+    from services.image_preprocessing import shutdown_pool
+    from services.analysis_queue import analysis_queue
+    introspection = application.bot_data.get('introspection')
+    if introspection is not None:
+        await introspection.stop()
+    photo_controller = application.bot_data.get('photo_controller')
+    if photo_controller is not None:
+        await photo_controller.stop()
+    await analysis_queue.stop()
+    shutdown_pool()
+    
+    snapshot_service = StateSnapshotService()
+    if snapshot_service.enabled:
+        saved = snapshot_service.write()
+        logger.info(f"💾 {saved} estado(s) salvos para o próximo início")
+
 def main():
     """Função principal da aplicação"""
     
@@ -50,8 +90,10 @@ def main():
         logger.error("❌ Falha na conexão com o banco!")
         return
     
-    # Criar tabelas se necessário
-    create_tables()
+    # Aplicar migrações pendentes (só consulta a versão se o schema estiver em dia)
+    if not run_migrations():
+        logger.error("❌ Falha ao migrar o schema do banco!")
+        return
     
     # Mostrar informações de debug
     if debug_mode:
@@ -61,11 +103,19 @@ def main():
         logger.info(f"🤖 Token do Bot: {bot_token[:10]}...{bot_token[-10:]}")
     
     try:
-        # Criar aplicação do bot
-        application = Application.builder().token(bot_token).build()
+        # Criar aplicação do bot (updates em paralelo; mesmo usuário serializado pelo StateManager)
+        application = (
+            Application.builder()
+            .token(bot_token)
+            .concurrent_updates(config('BOT_CONCURRENT_UPDATES', default=64, cast=int))
+            .post_init(post_init)
+            .post_shutdown(post_shutdown)
+            .build()
+        )
         
         # Configurar controladores
         bot_controller = BotController()
+        application.bot_data['photo_controller'] = bot_controller.photo_controller
         
         # Registrar handlers
         handlers = bot_controller.get_handlers()
@@ -100,7 +150,9 @@ def main():
         
         # Mostrar estados ativos ao parar (se debug ativado)
         if debug_mode:
-            from src.utils.state_manager import state_manager
+            # Mesmo módulo usado pelos controllers (src/ está no sys.path)
+            from utils.state_manager import state_manager
+            logger.info(f"📊 Estados: {state_manager.stats()}")
             active_states = state_manager.list_all_states()
             if active_states:
                 logger.info("📊 Estados ativos ao parar:")
@@ -3,6 +3,7 @@ Configuração do banco de dados MySQL
 """
 
 from sqlalchemy import create_engine, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from decouple import config
@@ -22,6 +23,32 @@ DATABASE_URL = (
     f"?charset=utf8mb4"
 )
 
+# URL de conexão assíncrona (usada pelos handlers do bot)
+ASYNC_DATABASE_URL = (
+    f"mysql+aiomysql://{MYSQL_USER}:{MYSQL_PASSWORD}"
+    f"@{MYSQL_HOST}:{MYSQL_PORT}/{MYSQL_DATABASE}"
+    f"?charset=utf8mb4"
+)
+
+# Réplica de leitura (opcional): sem MYSQL_REPLICA_HOST tudo vai para o primário
+MYSQL_REPLICA_HOST = config('MYSQL_REPLICA_HOST', default='')
+MYSQL_REPLICA_PORT = config('MYSQL_REPLICA_PORT', default=MYSQL_PORT, cast=int)
+
+# Janela (segundos) em que as leituras de quem acabou de escrever ficam no primário
+READ_STICKINESS_SECONDS = config('READ_STICKINESS_SECONDS', default=5, cast=float)
+
+REPLICA_DATABASE_URL = (
+    f"mysql+pymysql://{MYSQL_USER}:{MYSQL_PASSWORD}"
+    f"@{MYSQL_REPLICA_HOST}:{MYSQL_REPLICA_PORT}/{MYSQL_DATABASE}"
+    f"?charset=utf8mb4"
+)
+
+ASYNC_REPLICA_DATABASE_URL = (
+    f"mysql+aiomysql://{MYSQL_USER}:{MYSQL_PASSWORD}"
+    f"@{MYSQL_REPLICA_HOST}:{MYSQL_REPLICA_PORT}/{MYSQL_DATABASE}"
+    f"?charset=utf8mb4"
+)
+
 # Engine do SQLAlchemy
 engine = create_engine(
     DATABASE_URL,
@@ -32,9 +59,50 @@ engine = create_engine(
     echo=config('DEBUG', default=False, cast=bool)
 )
 
+# Engine assíncrono - não bloqueia o event loop do bot
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_pre_ping=True,
+    pool_recycle=300,
+    pool_size=10,
+    max_overflow=20,
+    echo=config('DEBUG', default=False, cast=bool)
+)
+
+# Engines de leitura: réplica se configurada, senão o próprio primário
+REPLICA_ENABLED = bool(MYSQL_REPLICA_HOST)
+
+if REPLICA_ENABLED:
+    read_engine = create_engine(
+        REPLICA_DATABASE_URL,
+        pool_pre_ping=True,
+        pool_recycle=300,
+        pool_size=10,
+        max_overflow=20,
+        echo=config('DEBUG', default=False, cast=bool)
+    )
+    async_read_engine = create_async_engine(
+        ASYNC_REPLICA_DATABASE_URL,
+        pool_pre_ping=True,
+        pool_recycle=300,
+        pool_size=10,
+        max_overflow=20,
+        echo=config('DEBUG', default=False, cast=bool)
+    )
+else:
+    read_engine = engine
+    async_read_engine = async_engine
+
 # Session factory
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Session factory assíncrona (sem expirar objetos no commit: não há lazy load em async)
+AsyncSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False, bind=async_engine)
+
+# Session factories de leitura (relatórios, listagens, debug)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+AsyncReadSessionLocal = async_sessionmaker(autoflush=False, expire_on_commit=False, bind=async_read_engine)
+
 # Base para os models
 Base = declarative_base()
 
@@ -46,6 +114,11 @@ def get_db_session():
     finally:
         db.close()
 
+async def get_async_db_session():
+    """Criar nova sessão assíncrona do banco de dados"""
+    async with AsyncSessionLocal() as db:
+        yield db
+
 def test_connection():
     """Testar conexão com o banco"""
     try:
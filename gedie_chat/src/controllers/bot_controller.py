@@ -15,6 +15,8 @@ from views.keyboards.main_keyboard import MainKeyboard
 from views.messages.expense_messages import ExpenseMessages
 from views.messages.settings_messages import SettingsMessages  # NOVO
 from utils.state_manager import state_manager, ConversationState
+from middlewares.db_session_middleware import with_db_session
+from middlewares.state_middleware import with_user_state
 
 class BotController:
     """Controlador principal do bot"""
@@ -195,11 +197,13 @@ Escolha uma opção para começar:"""
             pass
     
     def get_handlers(self):
-        """Retornar handlers"""
+        """Retornar handlers (cada update usa uma única sessão do banco e uma leitura de estado)"""
         return [
-            CommandHandler("start", self.start_command),
+            CommandHandler("start", with_user_state(with_db_session(self.start_command))),
             CommandHandler("id", self.id_command),  # NOVO
-            CallbackQueryHandler(self.callback_router),
-            MessageHandler(filters.PHOTO, self.photo_controller.handle_photo),
-            MessageHandler(filters.TEXT & ~filters.COMMAND, self.message_handler)
+            # Cancelar análise em andamento não espera a vez do usuário
+            CallbackQueryHandler(self.photo_controller.abort_analysis, pattern=r"^photo:abort$"),
+            CallbackQueryHandler(with_user_state(with_db_session(self.callback_router))),
+            MessageHandler(filters.PHOTO, with_user_state(with_db_session(self.photo_controller.handle_photo))),
+            MessageHandler(filters.TEXT & ~filters.COMMAND, with_user_state(with_db_session(self.message_handler)))
         ]
\ No newline at end of file
@@ -3,7 +3,7 @@ Controlador de categorias - VERSÃO CORRIGIDA
 """
 
 from loguru import logger
-from config.database_config import SessionLocal
+from middlewares.db_session_middleware import db_session_scope, db_read_scope
 from models.category_model import Category
 from models.user_model import User
 from views.keyboards.main_keyboard import CategoryKeyboard
@@ -13,12 +13,11 @@ class CategoryController:
     """Controlador de categorias"""
     
     def _debug_user_state(self, user_id, action=""):
-        """Debug do estado do usuário"""
-        state = state_manager.get_state(user_id)
-        data = state_manager.get_data(user_id)
-        logger.info(f"🔍 CATEGORY DEBUG {action} - User: {user_id}")
-        logger.info(f"    Estado: {state}")
-        logger.info(f"    Dados: {data}")
+        """Debug do estado do usuário (só monta a mensagem com DEBUG ativo)"""
+        logger.opt(lazy=True).debug(
+            "🔍 CATEGORY DEBUG {} - User: {} | {}", lambda: action, lambda: user_id,
+            lambda: state_manager.debug_user(user_id)
+        )
     
     async def handle_callback(self, query, parts):
         """Manipular callbacks de categorias"""
@@ -48,48 +47,24 @@ class CategoryController:
         try:
             logger.info(f"Selecionando categoria {category_id} para usuário {user_id}")
             
-            # Buscar categoria
-            db = SessionLocal()
-            category = db.query(Category).filter(Category.id == category_id).first()
-            
-            if not category:
-                logger.error(f"Categoria {category_id} não encontrada")
-                await query.edit_message_text("❌ Categoria não encontrada.")
-                db.close()
-                return
-            
-            logger.info(f"Categoria encontrada: {category.nome} ({category.icone})")
-            
-            # Verificar se categoria pertence ao usuário
-            user = User.get_by_telegram_id(db, user_id)
-            if not user or category.user_id != user.id:
-                logger.error(f"Categoria {category_id} não pertence ao usuário {user_id}")
-                await query.edit_message_text("❌ Categoria inválida.")
-                db.close()
-                return
-            
-            db.close()
-            
-            # IMPORTANTE: Preservar dados existentes ao definir novo estado
-            current_data = state_manager.get_data(user_id)
-            logger.info(f"Dados existentes antes de salvar categoria: {current_data}")
-            
-            # Adicionar category_id aos dados existentes
-            state_manager.set_state(
-                user_id, 
-                ConversationState.WAITING_AMOUNT,
-                {'category_id': category_id}  # Dados novos serão mesclados com existentes
-            )
-            
-            # Verificar se dados foram salvos corretamente
-            updated_data = state_manager.get_data(user_id)
-            logger.info(f"Dados após salvar categoria: {updated_data}")
-            
-            if updated_data.get('category_id') != category_id:
-                logger.error(f"ERRO: category_id não foi salvo corretamente!")
-                logger.error(f"Esperado: {category_id}, Obtido: {updated_data.get('category_id')}")
-                await query.edit_message_text("❌ Erro interno. Tente novamente.")
-                return
+            async with db_session_scope() as db:
+                user = await User.get_cached_async(db, user_id)
+                if not user:
+                    await query.edit_message_text("❌ Usuário não encontrado.")
+                    return
+                
+                # Buscar entre as categorias do usuário (garante que pertence a ele)
+                category = await Category.find_user_category_async(db, user.id, category_id)
+                
+                if not category:
+                    logger.error(f"Categoria {category_id} não encontrada para o usuário {user_id}")
+                    await query.edit_message_text("❌ Categoria inválida.")
+                    return
+                
+                logger.info(f"Categoria encontrada: {category.nome} ({category.icone})")
+            
+            # Categoria escolhida: aguardar valor (dados existentes preservados)
+            state_manager.select_category(user_id, category_id)
             
             self._debug_user_state(user_id, "APÓS SELECIONAR CATEGORIA")
             
@@ -120,16 +95,14 @@ class CategoryController:
         user_id = query.from_user.id
         
         try:
-            db = SessionLocal()
-            user = User.get_by_telegram_id(db, user_id)
-            
-            if not user:
-                await query.edit_message_text("❌ Usuário não encontrado.")
-                db.close()
-                return
-            
-            categories = Category.get_user_categories(db, user.id)
-            db.close()
+            async with db_read_scope(user_id) as db:
+                user = await User.get_cached_async(db, user_id)
+                
+                if not user:
+                    await query.edit_message_text("❌ Usuário não encontrado.")
+                    return
+                
+                categories = await Category.get_user_categories_cached_async(db, user.id)
             
             if not categories:
                 message = "😴 Você não possui categorias cadastradas."
@@ -9,28 +9,31 @@ from telegram import Update
 from telegram.ext import ContextTypes
 from loguru import logger
 
-from config.database_config import SessionLocal
+from middlewares.db_session_middleware import db_session_scope, db_read_scope
 from models.expense_model import Expense
 from models.category_model import Category
 from models.user_model import User
 from views.keyboards.main_keyboard import MainKeyboard, ExpenseKeyboard, CategoryKeyboard
 from views.messages.expense_messages import ExpenseMessages
 from utils.state_manager import state_manager, ConversationState
+from utils.pagination import encode_expense_cursor, decode_expense_cursor
 from controllers.user_controller import UserController
 
 class ExpenseController:
     """Controlador de gastos"""
     
+    # Gastos exibidos por mensagem
+    PAGE_SIZE = 10
+    
     def __init__(self):
         self.user_controller = UserController()
     
     def _debug_user_state(self, user_id, action=""):
-        """Debug do estado do usuário"""
-        state = state_manager.get_state(user_id)
-        data = state_manager.get_data(user_id)
-        logger.info(f"🔍 DEBUG {action} - User: {user_id}")
-        logger.info(f"    Estado: {state}")
-        logger.info(f"    Dados: {data}")
+        """Debug do estado do usuário (só monta a mensagem com DEBUG ativo)"""
+        logger.opt(lazy=True).debug(
+            "🔍 DEBUG {} - User: {} | {}", lambda: action, lambda: user_id,
+            lambda: state_manager.debug_user(user_id)
+        )
     
     async def handle_callback(self, query, parts):
         """Manipular callbacks relacionados a gastos"""
@@ -50,7 +53,10 @@ class ExpenseController:
         elif subaction == "view":
             if len(parts) > 2:
                 period = parts[2]
-                await self._show_expenses_by_period(query, period)
+                # expense:view:<período>[:o|n:<cursor>] (o = mais antigos, n = mais recentes)
+                direction = parts[3] if len(parts) > 4 else None
+                cursor = parts[4] if len(parts) > 4 else None
+                await self._show_expenses_by_period(query, period, direction, cursor)
         elif subaction == "confirm":
             await self._confirm_expense_callback(query)
         elif subaction == "cancel":
@@ -69,16 +75,14 @@ class ExpenseController:
             state_manager.clear_state(user_id)
             
             # Buscar usuário e suas categorias
-            db = SessionLocal()
-            user = User.get_by_telegram_id(db, user_id)
-            
-            if not user:
-                await query.edit_message_text("❌ Usuário não encontrado.")
-                db.close()
-                return
-            
-            categories = Category.get_user_categories(db, user.id)
-            db.close()
+            async with db_session_scope() as db:
+                user = await User.get_cached_async(db, user_id)
+                
+                if not user:
+                    await query.edit_message_text("❌ Usuário não encontrado.")
+                    return
+                
+                categories = await Category.get_user_categories_cached_async(db, user.id)
             
             if not categories:
                 await query.edit_message_text(
@@ -116,19 +120,11 @@ class ExpenseController:
             parse_mode='Markdown'
         )
     
-    async def _show_expenses_by_period(self, query, period):
-        """Mostrar gastos por período"""
+    async def _show_expenses_by_period(self, query, period, direction=None, cursor=None):
+        """Mostrar uma página de gastos do período (paginação keyset)"""
         user_id = query.from_user.id
         
         try:
-            db = SessionLocal()
-            user = User.get_by_telegram_id(db, user_id)
-            
-            if not user:
-                await query.edit_message_text("❌ Usuário não encontrado.")
-                db.close()
-                return
-            
             # Definir período
             today = date.today()
             start_date = end_date = None
@@ -146,27 +142,46 @@ class ExpenseController:
                 end_date = today
                 period_title = "Gastos deste Mês"
             
-            # Buscar gastos
-            expenses = Expense.get_user_expenses(db, user.id, start_date, end_date)
-            
-            # IMPORTANTE: Carregar dados relacionados antes de fechar sessão
-            expenses_data = []
-            for expense in expenses:
-                category = expense.category  # Força carregamento
-                expenses_data.append({
-                    'id': expense.id,
-                    'valor': float(expense.valor),
-                    'descricao': expense.descricao,
-                    'data_gasto': expense.data_gasto,
-                    'category_nome': category.nome,
-                    'category_icone': category.icone
-                })
-            
-            db.close()
-            
-            # Formatar mensagem usando dados carregados
-            message = ExpenseMessages.expenses_list_message_from_data(expenses_data, period_title)
-            keyboard = MainKeyboard.get_back_to_main()
+            async with db_read_scope(user_id) as db:
+                user = await User.get_cached_async(db, user_id)
+                
+                if not user:
+                    await query.edit_message_text("❌ Usuário não encontrado.")
+                    return
+                
+                position = decode_expense_cursor(cursor) if cursor else None
+                after = position if direction == "o" else None
+                before = position if direction == "n" else None
+                
+                # Uma linha a mais indica se existe página seguinte
+                rows = await Expense.list_rows_async(
+                    db, user.id, start_date, end_date, limit=self.PAGE_SIZE + 1,
+                    after=after, before=before
+                )
+                
+                # Total/quantidade do período só na primeira página
+                stats = None
+                if position is None:
+                    stats = await Expense.get_period_stats_async(db, user.id, start_date, end_date)
+            
+            has_more = len(rows) > self.PAGE_SIZE
+            if before is not None:
+                rows = rows[1:] if has_more else rows
+                has_newer, has_older = has_more, True
+            else:
+                rows = rows[:self.PAGE_SIZE]
+                has_newer, has_older = after is not None, has_more
+            
+            if stats is not None:
+                message = ExpenseMessages.expenses_rows_message(rows, period_title, stats.total, stats.count)
+            else:
+                message = ExpenseMessages.expenses_page_message(rows, period_title)
+            
+            keyboard = ExpenseKeyboard.get_page_navigation(
+                period,
+                newer_cursor=encode_expense_cursor(rows[0]) if rows and has_newer else None,
+                older_cursor=encode_expense_cursor(rows[-1]) if rows and has_older else None
+            )
             
             await query.edit_message_text(
                 message,
@@ -208,28 +223,21 @@ class ExpenseController:
             if amount <= 0:
                 raise ValueError("Valor deve ser positivo")
             
-            # Obter dados atuais do estado
-            current_data = state_manager.get_data(user_id)
-            category_id = current_data.get('category_id')
-            
-            logger.info(f"Dados atuais antes de salvar valor: {current_data}")
+            # Registro do estado (sem cópia dos dados)
+            record = state_manager.get_record(user_id)
+            category_id = record.category_id if record is not None else None
             
             if not category_id:
                 logger.error("Category_id não encontrado no estado!")
                 await update.message.reply_text("❌ Erro: categoria perdida. Tente novamente.")
                 return
             
-            # Atualizar dados do estado COM PRESERVAÇÃO
-            state_manager.update_data(user_id, 'amount', amount)
-            
-            # Verificar se dados foram salvos
-            updated_data = state_manager.get_data(user_id)
-            logger.info(f"Dados após salvar valor: {updated_data}")
-            
-            # Buscar categoria para confirmação
-            db = SessionLocal()
-            category = db.query(Category).filter(Category.id == category_id).first()
-            db.close()
+            # Buscar categoria para confirmação (cache do usuário)
+            async with db_session_scope() as db:
+                user = await User.get_cached_async(db, user_id)
+                category = None
+                if user:
+                    category = await Category.find_user_category_async(db, user.id, category_id)
             
             if not category:
                 await update.message.reply_text("❌ Categoria não encontrada.")
@@ -241,12 +249,8 @@ class ExpenseController:
             )
             keyboard = ExpenseKeyboard.get_description_options()
             
-            # IMPORTANTE: Manter dados ao mudar estado
-            state_manager.set_state(
-                user_id, 
-                ConversationState.CONFIRMING_EXPENSE,
-                updated_data  # Passar dados existentes
-            )
+            # Valor guardado e estado de confirmação (demais dados preservados)
+            state_manager.set_amount(user_id, amount)
             
             self._debug_user_state(user_id, "APÓS CONFIRMAR VALOR")
             
@@ -282,8 +286,7 @@ class ExpenseController:
         message = ExpenseMessages.enter_description_message()
         
         # Manter dados ao mudar estado
-        current_data = state_manager.get_data(user_id)
-        state_manager.set_state(user_id, ConversationState.WAITING_DESCRIPTION, current_data)
+        state_manager.request_description(user_id)
         
         self._debug_user_state(user_id, "APÓS SOLICITAR DESCRIÇÃO")
         
@@ -308,9 +311,7 @@ class ExpenseController:
             amount = data.get('amount')
             description = data.get('description')
             
-            logger.info(f"Salvando gasto via callback - User: {user_id}")
-            logger.info(f"    Dados completos: {data}")
-            logger.info(f"    Category: {category_id}, Amount: {amount}")
+            logger.info(f"Salvando gasto via callback - User: {user_id}, Category: {category_id}, Amount: {amount}")
             
             if not category_id or not amount:
                 logger.error(f"Dados incompletos - Category: {category_id}, Amount: {amount}")
@@ -324,29 +325,32 @@ class ExpenseController:
                 )
                 return
             
-            # Buscar usuário
-            db = SessionLocal()
-            user = User.get_by_telegram_id(db, user_id)
-            
-            if not user:
-                await query.edit_message_text("❌ Usuário não encontrado.")
-                db.close()
-                return
-            
-            # Criar gasto
-            logger.info(f"Criando gasto: user_id={user.id}, category_id={category_id}, amount={amount}")
-            expense = Expense.create_expense(
-                db, user.id, category_id, amount, description
-            )
-            
-            if not expense:
-                logger.error("Falha ao criar expense no banco")
-                await query.edit_message_text("❌ Erro ao salvar gasto.")
-                db.close()
-                return
+            async with db_session_scope() as db:
+                # Buscar usuário
+                user = await User.get_cached_async(db, user_id)
+                
+                if not user:
+                    await query.edit_message_text("❌ Usuário não encontrado.")
+                    return
+                
+                # Carregar categoria antes do insert (usada na mensagem, sem lazy load)
+                category = await Category.find_user_category_async(db, user.id, category_id)
+                
+                if not category:
+                    await query.edit_message_text("❌ Categoria não encontrada.")
+                    return
+                
+                # Criar gasto
+                logger.info(f"Criando gasto: user_id={user.id}, category_id={category_id}, amount={amount}")
+                expense = await Expense.create_expense_async(
+                    db, user.id, category_id, amount, description
+                )
+                
+                if not expense:
+                    logger.error("Falha ao criar expense no banco")
+                    await query.edit_message_text("❌ Erro ao salvar gasto.")
+                    return
             
-            # IMPORTANTE: Carregar categoria antes de fechar sessão
-            category = expense.category  # Força o carregamento da categoria
             expense_data = {
                 'id': expense.id,
                 'valor': float(expense.valor),
@@ -356,8 +360,6 @@ class ExpenseController:
                 'category_icone': category.icone
             }
             
-            db.close()
-            
             # Limpar estado
             state_manager.clear_state(user_id)
             
@@ -392,27 +394,30 @@ class ExpenseController:
                 await update.message.reply_text("❌ Dados incompletos. Tente novamente.")
                 return
             
-            # Buscar usuário
-            db = SessionLocal()
-            user = User.get_by_telegram_id(db, user_id)
-            
-            if not user:
-                await update.message.reply_text("❌ Usuário não encontrado.")
-                db.close()
-                return
-            
-            # Criar gasto
-            expense = Expense.create_expense(
-                db, user.id, category_id, amount, description
-            )
-            
-            if not expense:
-                await update.message.reply_text("❌ Erro ao salvar gasto.")
-                db.close()
-                return
+            async with db_session_scope() as db:
+                # Buscar usuário
+                user = await User.get_cached_async(db, user_id)
+                
+                if not user:
+                    await update.message.reply_text("❌ Usuário não encontrado.")
+                    return
+                
+                # Carregar categoria antes do insert (usada na mensagem, sem lazy load)
+                category = await Category.find_user_category_async(db, user.id, category_id)
+                
+                if not category:
+                    await update.message.reply_text("❌ Categoria não encontrada.")
+                    return
+                
+                # Criar gasto
+                expense = await Expense.create_expense_async(
+                    db, user.id, category_id, amount, description
+                )
+                
+                if not expense:
+                    await update.message.reply_text("❌ Erro ao salvar gasto.")
+                    return
             
-            # IMPORTANTE: Carregar categoria antes de fechar sessão
-            category = expense.category  # Força o carregamento da categoria
             expense_data = {
                 'id': expense.id,
                 'valor': float(expense.valor),
@@ -422,8 +427,6 @@ class ExpenseController:
                 'category_icone': category.icone
             }
             
-            db.close()
-            
             # Limpar estado
             state_manager.clear_state(user_id)
             
@@ -2,22 +2,90 @@
 Controlador para análise de fotos - VERSÃO SIMPLIFICADA
 """
 
-from telegram import Update, File
+import asyncio
+import contextvars
+from telegram import Update, File, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
+from decouple import config
 from loguru import logger
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Set
 
-from services.gemini_service import gemini_service
-from config.database_config import SessionLocal
+from services.nfce_service import read_receipt_qr
+from services.analysis_queue import analysis_queue, AnalysisJob
+from services.metrics_service import receipt_metrics, Timer
+from middlewares.db_session_middleware import db_session_scope
 from models.user_model import User
 from models.category_model import Category
 from models.expense_model import Expense
 from views.keyboards.main_keyboard import MainKeyboard
 from utils.state_manager import state_manager, ConversationState
 
+# Espera após a última foto de um álbum antes de analisá-lo (segundos)
+MEDIA_GROUP_WINDOW = config('MEDIA_GROUP_WINDOW', default=1.5, cast=float)
+
+MAX_PHOTO_SIZE = 20 * 1024 * 1024  # 20MB
+
+class _MediaGroup:
+    """Fotos de um álbum (media_group_id) aguardando o fim da janela de coleta"""
+    
+    __slots__ = ('user_id', 'message', 'images', 'downloading', 'last_seen', 'cancelled')
+    
+    def __init__(self, user_id: int, message):
+        self.user_id = user_id
+        self.message = message
+        self.images: List[bytes] = []
+        self.downloading = 0
+        self.last_seen = asyncio.get_running_loop().time()
+        self.cancelled = False
+
 class PhotoController:
     """Controlador para análise de comprovantes por foto"""
     
+    def __init__(self):
+        # Álbuns em coleta {media_group_id: _MediaGroup}
+        self._media_groups: Dict[str, _MediaGroup] = {}
+        # Tasks de coleta dos álbuns (o loop só guarda referência fraca)
+        self._flush_tasks: Set[asyncio.Task] = set()
+    
+    ABORT_KEYBOARD = InlineKeyboardMarkup([
+        [InlineKeyboardButton("❌ Cancelar", callback_data="photo:abort")]
+    ])
+    
+    ANALYZING_TEXT = (
+        "📷 **Analisando comprovante...**\n\n"
+        "🤖 Usando IA para extrair informações...\n"
+        "⏳ Isso pode levar alguns segundos..."
+    )
+    
+    async def stop(self):
+        """Cancelar coletas de álbum pendentes (desligamento do bot)"""
+        for task in self._flush_tasks:
+            task.cancel()
+        await asyncio.gather(*self._flush_tasks, return_exceptions=True)
+    
+    async def abort_analysis(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Cancelar análise na fila ou em andamento"""
+        query = update.callback_query
+        user_id = query.from_user.id
+        
+        cancelled = analysis_queue.cancel(user_id)
+        for group in self._media_groups.values():
+            if group.user_id == user_id and not group.cancelled:
+                group.cancelled = True
+                cancelled += 1
+        
+        if not cancelled:
+            await query.answer("Nenhuma análise em andamento.")
+            return
+        
+        await query.answer("Análise cancelada")
+        logger.info(f"Análise cancelada pelo usuário {query.from_user.id}")
+        await query.edit_message_text(
+            "❌ **Análise cancelada**\n\nVocê pode tentar novamente quando quiser.",
+            reply_markup=MainKeyboard.get_main_menu(),
+            parse_mode='Markdown'
+        )
+    
     async def handle_photo_callback(self, query, parts):
         """Manipular callbacks de foto"""
         
@@ -30,6 +98,8 @@ class PhotoController:
             await self._show_photo_guide(query)
         elif subaction == "confirm":
             await self._confirm_photo_expense(query)
+        elif subaction == "confirm_all":
+            await self._confirm_photo_batch(query)
         elif subaction == "cancel":
             await self._cancel_photo_expense(query)
     
@@ -87,20 +157,21 @@ class PhotoController:
         try:
             logger.info(f"📷 Foto recebida do usuário {user_id}")
             
+            # Fotos de álbum são juntadas e analisadas em lote
+            media_group_id = update.message.media_group_id
+            if media_group_id is not None:
+                await self._collect_media_group(update, media_group_id)
+                return
+            
             # Mostrar mensagem de processamento
             processing_message = await update.message.reply_text(
-                "📷 **Analisando comprovante...**\n\n"
-                "🤖 Usando IA para extrair informações...\n"
-                "⏳ Isso pode levar alguns segundos...",
+                self.ANALYZING_TEXT,
+                reply_markup=self.ABORT_KEYBOARD,
                 parse_mode='Markdown'
             )
             
-            # Baixar foto
-            photo = update.message.photo[-1]  # Maior resolução
-            file: File = await photo.get_file()
-            
-            # Verificar tamanho
-            if file.file_size > 20 * 1024 * 1024:  # 20MB
+            image_data = await self._download_photo(update)
+            if image_data is None:
                 await processing_message.edit_text(
                     "❌ **Arquivo muito grande**\n\n"
                     "Envie uma foto menor que 20MB.",
@@ -108,15 +179,155 @@ class PhotoController:
                 )
                 return
             
-            image_data = await file.download_as_bytearray()
-            logger.info(f"Foto baixada: {len(image_data)} bytes")
+            await self._start_analysis(processing_message, user_id, [image_data])
+            
+        except Exception as e:
+            logger.error(f"Erro ao processar foto: {e}")
+            await update.message.reply_text(
+                "❌ **Erro ao processar foto**\n\n"
+                "Tente novamente ou use registro manual.",
+                parse_mode='Markdown'
+            )
+    
+    async def _download_photo(self, update: Update) -> Optional[bytes]:
+        """Baixar a maior resolução da foto (None se passar de 20MB)"""
+        photo = update.message.photo[-1]  # Maior resolução
+        
+        with Timer() as timer:
+            file: File = await photo.get_file()
+            
+            if file.file_size > MAX_PHOTO_SIZE:
+                return None
+            
+            image_data = bytes(await file.download_as_bytearray())
+        
+        receipt_metrics.observe('download_seconds', timer.elapsed())
+        logger.info(f"Foto baixada: {len(image_data)} bytes em {timer.elapsed():.2f}s")
+        return image_data
+    
+    async def _collect_media_group(self, update: Update, media_group_id: str):
+        """Juntar foto ao álbum; a análise sai MEDIA_GROUP_WINDOW após a última foto"""
+        user_id = update.effective_user.id
+        group = self._media_groups.get(media_group_id)
+        
+        # Fotos do mesmo usuário chegam em ordem (lock do usuário): sem corrida aqui
+        if group is None:
+            message = await update.message.reply_text(
+                "📷 **Recebendo álbum de comprovantes...**",
+                reply_markup=self.ABORT_KEYBOARD,
+                parse_mode='Markdown'
+            )
+            group = self._media_groups[media_group_id] = _MediaGroup(user_id, message)
+            # Contexto limpo: a análise roda depois que este update terminar
+            task = asyncio.get_running_loop().create_task(
+                self._flush_media_group(media_group_id), context=contextvars.Context()
+            )
+            self._flush_tasks.add(task)
+            task.add_done_callback(self._flush_tasks.discard)
+        
+        group.downloading += 1
+        try:
+            image_data = await self._download_photo(update)
+        finally:
+            group.downloading -= 1
+            group.last_seen = asyncio.get_running_loop().time()
+        
+        if image_data is None:
+            logger.warning(f"Foto do álbum {media_group_id} ignorada: maior que 20MB")
+            return
+        group.images.append(image_data)
+    
+    async def _flush_media_group(self, media_group_id: str):
+        """Esperar o álbum terminar de chegar e mandar todas as fotos para análise"""
+        group = self._media_groups[media_group_id]
+        loop = asyncio.get_running_loop()
+        
+        try:
+            while True:
+                delay = group.last_seen + MEDIA_GROUP_WINDOW - loop.time()
+                if delay <= 0 and not group.downloading:
+                    break
+                await asyncio.sleep(max(delay, 0.1))
+        finally:
+            del self._media_groups[media_group_id]
+        
+        if group.cancelled:
+            return
+        
+        try:
+            if not group.images:
+                await group.message.edit_text("❌ Nenhuma foto do álbum pôde ser baixada.")
+                return
             
-            # Analisar com Gemini
-            analysis_result = await gemini_service.analyze_receipt(bytes(image_data))
+            logger.info(f"📚 Álbum {media_group_id} do usuário {group.user_id}: {len(group.images)} foto(s)")
+            await group.message.edit_text(
+                self.ANALYZING_TEXT,
+                reply_markup=self.ABORT_KEYBOARD,
+                parse_mode='Markdown'
+            )
+            await self._start_analysis(group.message, group.user_id, group.images)
             
+        except Exception as e:
+            logger.error(f"Erro ao processar álbum {media_group_id}: {e}")
+            await group.message.edit_text("❌ Erro ao processar álbum. Tente novamente.")
+    
+    async def _start_analysis(self, message, user_id: int, images: List[bytes]):
+        """Ler QR Codes e enfileirar o restante para o Gemini (uma chamada por foto ou álbum)"""
+        
+        # Atalho: QR Code da NFC-e com valor total dispensa a IA
+        qr_results = list(await asyncio.gather(*(read_receipt_qr(image) for image in images)))
+        remaining = [image for image, qr_result in zip(images, qr_results) if qr_result is None]
+        album = len(images) > 1
+        
+        def merge(result: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+            if not album:
+                return result or qr_results[0]
+            if result is not None and result.get('erro'):
+                return result
+            analyzed = (result.get('comprovantes') or []) if result else []
+            if len(analyzed) != len(remaining):
+                logger.error(f"Álbum do usuário {user_id}: {len(analyzed)} análise(s) para {len(remaining)} foto(s)")
+                return {'erro': True, 'observacoes': "Erro: a IA não devolveu um resultado para cada foto"}
+            analyzed = iter(analyzed)
+            return {'comprovantes': [qr_result or next(analyzed) for qr_result in qr_results]}
+        
+        if not remaining:
+            await self._finish_analysis(message, merge(None), user_id)
+            return
+        
+        # Analisar com Gemini em background: o handler termina aqui
+        job = AnalysisJob(
+            user_id,
+            remaining if album else remaining[0],
+            on_done=lambda result: self._finish_analysis(message, merge(result), user_id),
+            on_progress=lambda position: self._show_queue_position(message, position)
+        )
+        if await analysis_queue.submit(job) is None:
+            await message.edit_text(
+                "⏳ **Muitos comprovantes sendo analisados agora**\n\n"
+                "Tente novamente em alguns instantes ou registre manualmente.",
+                reply_markup=MainKeyboard.get_main_menu(),
+                parse_mode='Markdown'
+            )
+    
+    async def _show_queue_position(self, message, position: int):
+        """Atualizar mensagem de processamento com a posição na fila (0 = análise começou)"""
+        if position == 0:
+            text = self.ANALYZING_TEXT
+        else:
+            text = (
+                "📷 **Comprovante na fila**\n\n"
+                f"⏳ Posição: {position}\n"
+                "A análise começa em instantes..."
+            )
+        await message.edit_text(text, reply_markup=self.ABORT_KEYBOARD, parse_mode='Markdown')
+    
+    async def _finish_analysis(self, message, analysis_result: dict, user_id: int):
+        """Resultado da fila: mostrar ao usuário e guardar no estado da conversa"""
+        async with state_manager.update_scope(user_id):
             # Verificar se houve erro
             if analysis_result.get('erro'):
-                await processing_message.edit_text(
+                await message.edit_text(
                     f"❌ **Erro na análise**\n\n"
                     f"{analysis_result.get('observacoes', 'Erro desconhecido')}\n\n"
                     f"💡 Dicas:\n"
@@ -128,15 +339,10 @@ class PhotoController:
                 return
             
             # Mostrar resultado
-            await self._show_analysis_result(processing_message, analysis_result, user_id)
-            
-        except Exception as e:
-            logger.error(f"Erro ao processar foto: {e}")
-            await update.message.reply_text(
-                "❌ **Erro ao processar foto**\n\n"
-                "Tente novamente ou use registro manual.",
-                parse_mode='Markdown'
-            )
+            if 'comprovantes' in analysis_result:
+                await self._show_batch_result(message, analysis_result['comprovantes'], user_id)
+            else:
+                await self._show_analysis_result(message, analysis_result, user_id)
     
     async def _show_analysis_result(self, message, analysis_result: dict, user_id: int):
         """Mostrar resultado da análise"""
@@ -186,15 +392,11 @@ class PhotoController:
             result_message += "**Confirme ou cancele:**"
             
             # Salvar no estado
-            state_data = {
-                'photo_analysis': analysis_result,
-                'source': 'photo'
-            }
-            
-            if suggested_category:
-                state_data['category_id'] = suggested_category['id']
-            
-            state_manager.set_state(user_id, ConversationState.CONFIRMING_EXPENSE, state_data)
+            state_manager.set_photo_analysis(
+                user_id,
+                analysis_result,
+                suggested_category['id'] if suggested_category else None
+            )
             
             # Keyboard de confirmação
             from telegram import InlineKeyboardButton, InlineKeyboardMarkup
@@ -217,67 +419,116 @@ class PhotoController:
             logger.error(f"Erro ao mostrar resultado: {e}")
             await message.edit_text("❌ Erro ao processar resultado.")
     
+    async def _show_batch_result(self, message, items: List[Dict[str, Any]], user_id: int):
+        """Mostrar análises de um álbum para confirmação conjunta"""
+        
+        async with db_session_scope() as db:
+            user = await User.get_cached_async(db, user_id)
+            categories = [
+                await self._match_user_category(db, user.id, item.get('categoria_sugerida', 'outros')) if user else None
+                for item in items
+            ]
+        
+        lines = []
+        pending = []
+        for number, (item, category) in enumerate(zip(items, categories), 1):
+            valor = item.get('valor_total')
+            local = item.get('estabelecimento') or 'Comprovante'
+            if not valor:
+                lines.append(f"{number}. ❌ {local}: valor não identificado (ignorado)")
+                continue
+            
+            icone = category['icone'] if category else '🏷️'
+            valor_formatado = f"R$ {valor:.2f}".replace('.', ',')
+            lines.append(f"{number}. {icone} {local}: {valor_formatado}")
+            pending.append(dict(item, category_id=category['id'] if category else None))
+        
+        result_message = f"🤖 **Análise de {len(items)} comprovantes**\n\n" + "\n".join(lines)
+        
+        if not pending:
+            await message.edit_text(
+                result_message + "\n\n❌ Nenhum valor identificado. Tente fotos mais nítidas.",
+                reply_markup=MainKeyboard.get_main_menu(),
+                parse_mode='Markdown'
+            )
+            return
+        
+        total = sum(item['valor_total'] for item in pending)
+        result_message += f"\n\n💰 **Total:** R$ {total:.2f}".replace('.', ',')
+        result_message += "\n\n**Confirme ou cancele:**"
+        
+        # Salvar no estado (confirmação de todos de uma vez)
+        state_manager.set_photo_analysis(user_id, {'comprovantes': pending})
+        
+        keyboard = [
+            [
+                InlineKeyboardButton(f"✅ Confirmar {len(pending)} gastos", callback_data="photo:confirm_all")
+            ],
+            [
+                InlineKeyboardButton("❌ Cancelar", callback_data="photo:cancel")
+            ]
+        ]
+        
+        await message.edit_text(
+            result_message,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='Markdown'
+        )
+    
     async def _find_suggested_category(self, user_id: int, suggested_category: str) -> Optional[Dict]:
         """Encontrar categoria sugerida"""
         
         try:
-            db = SessionLocal()
-            user = User.get_by_telegram_id(db, user_id)
-            
-            if not user:
-                db.close()
-                return None
-            
-            # Mapear categoria para nomes em português
-            category_mapping = {
-                'alimentacao': ['Alimentação', 'Comida', 'Restaurante'],
-                'transporte': ['Transporte', 'Combustível', 'Uber'],
-                'casa': ['Casa', 'Moradia', 'Lar'],
-                'saude': ['Saúde', 'Farmácia', 'Médico'],
-                'lazer': ['Lazer', 'Entretenimento', 'Diversão'],
-                'outros': ['Outros', 'Diversos']
-            }
-            
-            # Buscar categoria correspondente
-            possible_names = category_mapping.get(suggested_category, ['Outros'])
-            
-            for name in possible_names:
-                category = db.query(Category).filter(
-                    Category.user_id == user.id,
-                    Category.nome.ilike(f'%{name}%'),
-                    Category.ativo == True
-                ).first()
+            async with db_session_scope() as db:
+                user = await User.get_cached_async(db, user_id)
                 
-                if category:
-                    result = {
-                        'id': category.id,
-                        'nome': category.nome,
-                        'icone': category.icone
-                    }
-                    db.close()
-                    return result
-            
-            # Se não encontrou, pegar primeira categoria
-            first_category = db.query(Category).filter(
-                Category.user_id == user.id,
-                Category.ativo == True
-            ).first()
-            
-            db.close()
-            
-            if first_category:
-                return {
-                    'id': first_category.id,
-                    'nome': first_category.nome,
-                    'icone': first_category.icone
-                }
-            
-            return None
+                if not user:
+                    return None
+                
+                return await self._match_user_category(db, user.id, suggested_category)
             
         except Exception as e:
             logger.error(f"Erro ao buscar categoria: {e}")
             return None
     
+    async def _match_user_category(self, db, internal_user_id: int, suggested_category: str) -> Optional[Dict]:
+        """Procurar categoria do usuário correspondente à sugestão da IA"""
+        
+        # Mapear categoria para nomes em português
+        category_mapping = {
+            'alimentacao': ['Alimentação', 'Comida', 'Restaurante'],
+            'transporte': ['Transporte', 'Combustível', 'Uber'],
+            'casa': ['Casa', 'Moradia', 'Lar'],
+            'saude': ['Saúde', 'Farmácia', 'Médico'],
+            'lazer': ['Lazer', 'Entretenimento', 'Diversão'],
+            'outros': ['Outros', 'Diversos']
+        }
+        
+        # Buscar categoria correspondente (nas categorias em cache)
+        possible_names = category_mapping.get(suggested_category, ['Outros'])
+        categories = await Category.get_user_categories_cached_async(db, internal_user_id)
+        
+        for name in possible_names:
+            needle = name.casefold()
+            for category in categories:
+                if needle in category.nome.casefold():
+                    return {
+                        'id': category.id,
+                        'nome': category.nome,
+                        'icone': category.icone
+                    }
+        
+        # Se não encontrou, pegar primeira categoria
+        if categories:
+            first_category = categories[0]
+            return {
+                'id': first_category.id,
+                'nome': first_category.nome,
+                'icone': first_category.icone
+            }
+        
+        return None
+    
     async def _confirm_photo_expense(self, query):
         """Confirmar gasto da foto"""
         
@@ -292,54 +543,49 @@ class PhotoController:
                 await query.edit_message_text("❌ Dados perdidos. Tente novamente.")
                 return
             
-            # Buscar usuário
-            db = SessionLocal()
-            user = User.get_by_telegram_id(db, user_id)
-            
-            if not user:
-                await query.edit_message_text("❌ Usuário não encontrado.")
-                db.close()
-                return
-            
-            # Usar categoria sugerida ou primeira disponível
-            category_id = data.get('category_id')
-            if not category_id:
-                first_category = db.query(Category).filter(
-                    Category.user_id == user.id,
-                    Category.ativo == True
-                ).first()
+            async with db_session_scope() as db:
+                # Buscar usuário
+                user = await User.get_cached_async(db, user_id)
                 
-                if not first_category:
-                    await query.edit_message_text("❌ Nenhuma categoria disponível.")
-                    db.close()
+                if not user:
+                    await query.edit_message_text("❌ Usuário não encontrado.")
                     return
                 
-                category_id = first_category.id
-            
-            # Criar descrição automática
-            estabelecimento = analysis.get('estabelecimento', 'Comprovante')
-            descricao = f"📷 {estabelecimento}"
-            
-            # Criar gasto
-            expense = Expense.create_expense(
-                db, 
-                user.id, 
-                category_id, 
-                analysis['valor_total'],
-                descricao
-            )
-            
-            if not expense:
-                await query.edit_message_text("❌ Erro ao salvar gasto.")
-                db.close()
-                return
+                # Usar categoria sugerida ou primeira disponível
+                category = None
+                category_id = data.get('category_id')
+                if category_id:
+                    category = await Category.find_user_category_async(db, user.id, category_id)
+                
+                if not category:
+                    categories = await Category.get_user_categories_cached_async(db, user.id)
+                    
+                    if not categories:
+                        await query.edit_message_text("❌ Nenhuma categoria disponível.")
+                        return
+                    
+                    category = categories[0]
+                    category_id = category.id
+                
+                # Criar descrição automática
+                estabelecimento = analysis.get('estabelecimento', 'Comprovante')
+                descricao = f"📷 {estabelecimento}"
+                
+                # Criar gasto
+                expense = await Expense.create_expense_async(
+                    db, 
+                    user.id, 
+                    category_id, 
+                    analysis['valor_total'],
+                    descricao
+                )
+                
+                if not expense:
+                    await query.edit_message_text("❌ Erro ao salvar gasto.")
+                    return
             
-            # Carregar dados para mensagem
-            category = expense.category
             valor_formatado = f"R$ {float(expense.valor):.2f}".replace('.', ',')
             
-            db.close()
-            
             # Limpar estado
             state_manager.clear_state(user_id)
             
@@ -367,6 +613,73 @@ class PhotoController:
             logger.error(f"Erro ao confirmar gasto por foto: {e}")
             await query.edit_message_text("❌ Erro interno.")
     
+    async def _confirm_photo_batch(self, query):
+        """Confirmar todos os gastos de um álbum (uma transação)"""
+        
+        user_id = query.from_user.id
+        
+        try:
+            analysis = state_manager.get_data(user_id).get('photo_analysis') or {}
+            items = [item for item in analysis.get('comprovantes', []) if item.get('valor_total')]
+            
+            if not items:
+                await query.edit_message_text("❌ Dados perdidos. Tente novamente.")
+                return
+            
+            async with db_session_scope() as db:
+                user = await User.get_cached_async(db, user_id)
+                
+                if not user:
+                    await query.edit_message_text("❌ Usuário não encontrado.")
+                    return
+                
+                # Categoria sugerida se ainda for do usuário, senão a primeira
+                categories = await Category.get_user_categories_cached_async(db, user.id)
+                if not categories:
+                    await query.edit_message_text("❌ Nenhuma categoria disponível.")
+                    return
+                
+                by_id = {category.id: category for category in categories}
+                rows = [
+                    (
+                        item['category_id'] if item.get('category_id') in by_id else categories[0].id,
+                        item['valor_total'],
+                        f"📷 {item.get('estabelecimento') or 'Comprovante'}"
+                    )
+                    for item in items
+                ]
+                
+                expenses = await Expense.create_expenses_async(db, user.id, rows)
+                if not expenses:
+                    await query.edit_message_text("❌ Erro ao salvar gastos.")
+                    return
+            
+            state_manager.clear_state(user_id)
+            
+            lines = [
+                f"{by_id[expense.category_id].icone} {expense.descricao}: " + f"R$ {float(expense.valor):.2f}".replace('.', ',')
+                for expense in expenses
+            ]
+            total = sum(float(expense.valor) for expense in expenses)
+            message = (
+                f"📷 **{len(expenses)} gastos registrados por foto!**\n\n"
+                + "\n".join(lines)
+                + f"\n\n💰 **Total:** R$ {total:.2f}".replace('.', ',')
+                + "\n\n🎉 **Gastos salvos com sucesso!**"
+            )
+            
+            await query.edit_message_text(
+                message,
+                reply_markup=MainKeyboard.get_main_menu(),
+                parse_mode='Markdown'
+            )
+            
+            logger.info(f"✅ {len(expenses)} gastos por foto salvos (álbum)")
+            
+        except Exception as e:
+            logger.error(f"Erro ao confirmar gastos do álbum: {e}")
+            await query.edit_message_text("❌ Erro interno.")
+    
     async def _cancel_photo_expense(self, query):
         """Cancelar gasto por foto"""
         
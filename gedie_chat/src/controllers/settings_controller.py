@@ -4,7 +4,7 @@ Controlador de configurações do usuário
 
 import random
 from loguru import logger
-from config.database_config import SessionLocal
+from middlewares.db_session_middleware import db_session_scope
 from models.user_model import User
 from views.keyboards.main_keyboard import SettingsKeyboard
 from views.messages.settings_messages import SettingsMessages
@@ -42,15 +42,14 @@ class SettingsController:
         
         try:
             # Buscar usuário para verificar se já tem código
-            db = SessionLocal()
-            user = User.get_by_telegram_id(db, user_id)
-            db.close()
+            async with db_session_scope() as db:
+                user = await User.get_cached_async(db, user_id)
             
             if not user:
                 await query.edit_message_text("❌ Usuário não encontrado.")
                 return
             
-            has_code = user.codigo_acesso is not None
+            has_code = user.has_code
             
             message = SettingsMessages.settings_menu_message(user.nome, has_code)
             keyboard = SettingsKeyboard.get_settings_menu(has_code)
@@ -74,17 +73,15 @@ class SettingsController:
             code = self._generate_random_code()
             
             # Salvar no banco
-            db = SessionLocal()
-            user = User.get_by_telegram_id(db, user_id)
-            
-            if not user:
-                await query.edit_message_text("❌ Usuário não encontrado.")
-                db.close()
-                return
-            
-            # Atualizar código no banco
-            success = User.update_access_code(db, user.id, code)
-            db.close()
+            async with db_session_scope() as db:
+                user = await User.get_cached_async(db, user_id)
+                
+                if not user:
+                    await query.edit_message_text("❌ Usuário não encontrado.")
+                    return
+                
+                # Atualizar código no banco
+                success = await User.update_access_code_async(db, user.id, code)
             
             if success:
                 logger.info(f"✅ Código gerado para usuário {user_id}: {code}")
@@ -109,9 +106,8 @@ class SettingsController:
         user_id = query.from_user.id
         
         try:
-            db = SessionLocal()
-            user = User.get_by_telegram_id(db, user_id)
-            db.close()
+            async with db_session_scope() as db:
+                user = await User.get_by_telegram_id_async(db, user_id)
             
             if not user:
                 await query.edit_message_text("❌ Usuário não encontrado.")
@@ -143,16 +139,14 @@ class SettingsController:
             new_code = self._generate_random_code()
             
             # Atualizar no banco
-            db = SessionLocal()
-            user = User.get_by_telegram_id(db, user_id)
-            
-            if not user:
-                await query.edit_message_text("❌ Usuário não encontrado.")
-                db.close()
-                return
-            
-            success = User.update_access_code(db, user.id, new_code)
-            db.close()
+            async with db_session_scope() as db:
+                user = await User.get_cached_async(db, user_id)
+                
+                if not user:
+                    await query.edit_message_text("❌ Usuário não encontrado.")
+                    return
+                
+                success = await User.update_access_code_async(db, user.id, new_code)
             
             if success:
                 logger.info(f"✅ Código regenerado para usuário {user_id}: {new_code}")
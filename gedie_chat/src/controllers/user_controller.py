@@ -4,38 +4,49 @@ Controlador de usuários
 
 from typing import Optional
 from loguru import logger
-from config.database_config import SessionLocal
+from middlewares.db_session_middleware import db_session_scope, on_commit
 from models.user_model import User
 from models.category_model import Category
+from utils.user_cache import user_cache, CachedUser
 
 class UserController:
     """Controlador para operações de usuário"""
     
-    async def get_or_create_user(self, telegram_id: int, name: str) -> Optional[User]:
-        """Buscar usuário existente ou criar novo"""
+    async def get_or_create_user(self, telegram_id: int, name: str) -> Optional[CachedUser]:
+        """Buscar usuário existente ou criar novo (usuário + categorias numa transação)"""
         try:
-            db = SessionLocal()
-            
-            # Buscar usuário existente
-            user = User.get_by_telegram_id(db, telegram_id)
-            
-            if user:
-                logger.info(f"Usuário encontrado: {user.nome} (ID: {user.id})")
-                db.close()
+            async with db_session_scope() as db:
+                # Buscar usuário existente (normalmente resolvido pelo cache)
+                user = await User.get_cached_async(db, telegram_id)
+                
+                if user:
+                    logger.info(f"Usuário encontrado: {user.nome} (ID: {user.id})")
+                    return user
+                
+                # Criar novo usuário (INSERT que ignora duplicado: /start concorrentes)
+                user_id, created = await User.insert_if_absent_async(db, telegram_id, name)
+                
+                if not created:
+                    logger.info(f"Usuário {telegram_id} criado por outro update")
+                    return await User.get_cached_async(db, telegram_id, locking=True)
+                
+                # Criar categorias padrão na mesma transação
+                logger.info(f"Criando novo usuário: {name} ({telegram_id})")
+                categories_count = await Category.insert_default_categories_async(db, user_id)
+                
+                logger.info(f"Usuário criado com {categories_count} categorias padrão")
+                
+                user = CachedUser(
+                    id=user_id,
+                    nome=name[:100],
+                    ativo=True,
+                    timezone='America/Sao_Paulo',
+                    has_code=False
+                )
+                # Cache só depois do commit: rollback do update não deixa usuário fantasma
+                on_commit(db, lambda: user_cache.set(telegram_id, user))
                 return user
             
-            # Criar novo usuário
-            logger.info(f"Criando novo usuário: {name} ({telegram_id})")
-            user = User.create_user(db, telegram_id, name)
-            
-            if user:
-                # Criar categorias padrão
-                categories = Category.create_default_categories(db, user.id)
-                logger.info(f"Usuário criado com {len(categories)} categorias padrão")
-            
-            db.close()
-            return user
-            
         except Exception as e:
             logger.error(f"Erro ao buscar/criar usuário {telegram_id}: {e}")
             return None
@@ -43,10 +54,8 @@ class UserController:
     async def get_user_by_telegram_id(self, telegram_id: int) -> Optional[User]:
         """Buscar usuário pelo Telegram ID"""
         try:
-            db = SessionLocal()
-            user = User.get_by_telegram_id(db, telegram_id)
-            db.close()
-            return user
+            async with db_session_scope() as db:
+                return await User.get_by_telegram_id_async(db, telegram_id)
         except Exception as e:
             logger.error(f"Erro ao buscar usuário {telegram_id}: {e}")
             return None
@@ -54,24 +63,24 @@ class UserController:
     async def update_user_settings(self, telegram_id: int, **kwargs) -> bool:
         """Atualizar configurações do usuário"""
         try:
-            db = SessionLocal()
-            user = User.get_by_telegram_id(db, telegram_id)
-            
-            if not user:
-                db.close()
-                return False
-            
-            # Atualizar campos permitidos
-            for key, value in kwargs.items():
-                if hasattr(user, key):
-                    setattr(user, key, value)
+            async with db_session_scope() as db:
+                user = await User.get_by_telegram_id_async(db, telegram_id)
+                
+                if not user:
+                    return False
+                
+                # Atualizar campos permitidos
+                for key, value in kwargs.items():
+                    if hasattr(user, key):
+                        setattr(user, key, value)
+                
+                await user.save_async(db)
             
-            user.save(db)
-            db.close()
+            user_cache.invalidate(telegram_id)
             
             logger.info(f"Configurações do usuário {telegram_id} atualizadas")
             return True
             
         except Exception as e:
             logger.error(f"Erro ao atualizar usuário {telegram_id}: {e}")
-            return False
\ No newline at end of file
+            return False
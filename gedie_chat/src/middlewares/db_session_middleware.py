@@ -0,0 +1,126 @@
+"""
+Middleware de sessão do banco por update (unit of work)
+"""
+
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Optional
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from loguru import logger
+
+from config.database_config import (
+    AsyncSessionLocal, AsyncReadSessionLocal, REPLICA_ENABLED, READ_STICKINESS_SECONDS
+)
+from utils.ttl_cache import TTLCache
+
+# Sessão do update em processamento (isolada por task do asyncio)
+_current_session: ContextVar[Optional[AsyncSession]] = ContextVar('current_db_session', default=None)
+
+# Telegram IDs que escreveram há pouco: leem do primário (read-your-writes)
+recent_writers = TTLCache('recent_writers', max_size=10000, ttl=READ_STICKINESS_SECONDS)
+
+@event.listens_for(Session, 'after_flush')
+def _mark_flush_writes(session, flush_context):
+    session.info['has_writes'] = True
+
+@event.listens_for(Session, 'do_orm_execute')
+def _mark_statement_writes(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info['has_writes'] = True
+
+@event.listens_for(Session, 'after_commit')
+def _run_commit_callbacks(session):
+    for callback in session.info.pop('on_commit', []):
+        callback()
+
+@event.listens_for(Session, 'after_rollback')
+def _drop_commit_callbacks(session):
+    session.info.pop('on_commit', None)
+
+def on_commit(db: AsyncSession, callback: Callable[[], None]):
+    """Executar callback (síncrono) só depois do commit da sessão; descartado no rollback"""
+    db.info.setdefault('on_commit', []).append(callback)
+
+def _has_writes(db: AsyncSession) -> bool:
+    return bool(db.info.get('has_writes') or db.new or db.dirty or db.deleted)
+
+def with_db_session(handler):
+    """Envolver handler: uma sessão para o update inteiro e um único commit no final
+    
+    O middleware é o único dono do commit/rollback. Os controllers tratam os
+    próprios erros, então uma exceção que passou por db_session_scope marca a
+    sessão como falha e o update inteiro é desfeito mesmo sem chegar aqui.
+    """
+    
+    @wraps(handler)
+    async def wrapper(update, context):
+        async with AsyncSessionLocal() as db:
+            token = _current_session.set(db)
+            try:
+                result = await handler(update, context)
+                
+                if db.info.pop('failed', False):
+                    logger.debug("Falha tratada no handler: rollback da sessão do update")
+                    await db.rollback()
+                    return result
+                
+                await db.commit()
+                
+                user = getattr(update, 'effective_user', None)
+                if user is not None and db.info.pop('has_writes', False):
+                    recent_writers.set(user.id, True)
+                return result
+            except Exception:
+                logger.debug("Rollback da sessão do update")
+                await db.rollback()
+                raise
+            finally:
+                _current_session.reset(token)
+    
+    return wrapper
+
+@asynccontextmanager
+async def db_session_scope():
+    """Sessão do update atual; fora do middleware abre (e commita) uma sessão própria"""
+    db = _current_session.get()
+    if db is not None:
+        try:
+            yield db
+        except Exception:
+            # O handler pode engolir o erro: o middleware desfaz o update no final
+            db.info['failed'] = True
+            raise
+        return
+    
+    async with AsyncSessionLocal() as db:
+        try:
+            yield db
+            await db.commit()
+        except Exception:
+            await db.rollback()
+            raise
+
+@asynccontextmanager
+async def db_read_scope(telegram_id: Optional[int] = None):
+    """Sessão para caminhos somente leitura (listagens, relatórios)
+    
+    Vai para a réplica, exceto quando o update já escreveu algo ou o
+    usuário escreveu nos últimos READ_STICKINESS_SECONDS: aí usa o primário
+    para enxergar as próprias escritas.
+    """
+    current = _current_session.get()
+    sticky = (
+        (current is not None and _has_writes(current))
+        or (telegram_id is not None and recent_writers.get(telegram_id) is not None)
+    )
+    
+    if not REPLICA_ENABLED or sticky:
+        async with db_session_scope() as db:
+            yield db
+        return
+    
+    async with AsyncReadSessionLocal() as db:
+        yield db
@@ -0,0 +1,21 @@
+"""
+Middleware de estado da conversa por update
+"""
+
+from functools import wraps
+
+from utils.state_manager import state_manager
+
+def with_user_state(handler):
+    """Envolver handler: estado do usuário lido uma vez e gravado em lote no final"""
+    
+    @wraps(handler)
+    async def wrapper(update, context):
+        user = getattr(update, 'effective_user', None)
+        if user is None:
+            return await handler(update, context)
+        
+        async with state_manager.update_scope(user.id):
+            return await handler(update, context)
+    
+    return wrapper
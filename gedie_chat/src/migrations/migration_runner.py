@@ -0,0 +1,141 @@
+"""
+Migrações versionadas do schema do banco
+"""
+
+from datetime import datetime
+from typing import Callable, List, NamedTuple
+from sqlalchemy import inspect, text
+from sqlalchemy.schema import CreateIndex
+from loguru import logger
+
+from config.database_config import Base, engine as default_engine
+
+class Migration(NamedTuple):
+    """Uma etapa do schema"""
+    version: int
+    description: str
+    apply: Callable
+
+def _create_schema(connection):
+    """Tabelas base (no-op para bancos já existentes)"""
+    # Importar models para registrar as tabelas no metadata
+    from models import user_model, category_model, expense_model  # noqa: F401
+    Base.metadata.create_all(bind=connection, checkfirst=True)
+
+def _create_index_online(table_name: str, index_name: str):
+    """Criar índice declarado no model sem bloquear escritas (MySQL InnoDB)"""
+    
+    def apply(connection):
+        from models import user_model, category_model, expense_model  # noqa: F401
+        table = Base.metadata.tables[table_name]
+        index = next(ix for ix in table.indexes if ix.name == index_name)
+        
+        existing = {ix['name'] for ix in inspect(connection).get_indexes(table_name)}
+        if index_name in existing:
+            logger.info(f"   Índice {index_name} já existe")
+            return
+        
+        ddl = str(CreateIndex(index).compile(dialect=connection.dialect))
+        if connection.dialect.name == 'mysql':
+            ddl += " ALGORITHM=INPLACE LOCK=NONE"
+        connection.execute(text(ddl))
+    
+    return apply
+
+def _touch_categories_on_update(connection):
+    """categories.updated_at atualizado pelo próprio banco em qualquer UPDATE
+    
+    A versão web (e SQL manual) altera categorias sem passar pelo ORM; sem
+    isso o CategorySyncService nunca enxerga a mudança. Escritas do ORM
+    continuam mandando o valor explícito (utcnow), que prevalece.
+    """
+    if connection.dialect.name == 'mysql':
+        # Trigger com UTC_TIMESTAMP(): ON UPDATE CURRENT_TIMESTAMP usaria o fuso da
+        # sessão, e o ORM e o CategorySyncService comparam em UTC
+        connection.execute(text("DROP TRIGGER IF EXISTS categories_touch_updated_at"))
+        connection.execute(text(
+            "CREATE TRIGGER categories_touch_updated_at BEFORE UPDATE ON categories "
+            "FOR EACH ROW SET NEW.updated_at = "
+            "IF(NEW.updated_at <=> OLD.updated_at, UTC_TIMESTAMP(), NEW.updated_at)"
+        ))
+        return
+    
+    # SQLite (testes/desenvolvimento): trigger no mesmo formato de data do SQLAlchemy
+    connection.execute(text("DROP TRIGGER IF EXISTS categories_touch_updated_at"))
+    connection.execute(text(
+        "CREATE TRIGGER categories_touch_updated_at AFTER UPDATE ON categories "
+        "FOR EACH ROW WHEN NEW.updated_at IS OLD.updated_at BEGIN "
+        "UPDATE categories SET updated_at = strftime('%Y-%m-%d %H:%M:%f000', 'now') WHERE id = NEW.id; "
+        "END"
+    ))
+
+# Lista ordenada de migrações - NUNCA alterar uma versão já publicada
+MIGRATIONS: List[Migration] = [
+    Migration(1, "Schema inicial", _create_schema),
+    Migration(2, "Índice expenses(user_id, data_gasto, created_at)",
+              _create_index_online('expenses', 'ix_expenses_user_data_created')),
+    Migration(3, "Índice categories(user_id, ativo, nome)",
+              _create_index_online('categories', 'ix_categories_user_ativo_nome')),
+    Migration(4, "Índice categories(updated_at)",
+              _create_index_online('categories', 'ix_categories_updated_at')),
+    Migration(5, "categories.updated_at atualizado pelo banco (trigger em UTC)",
+              _touch_categories_on_update),
+]
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+def get_schema_version(connection) -> int:
+    """Versão atual do schema (0 para banco sem migrações)"""
+    connection.execute(text(
+        "CREATE TABLE IF NOT EXISTS schema_version ("
+        " version INTEGER NOT NULL PRIMARY KEY,"
+        " description VARCHAR(200) NOT NULL,"
+        " applied_at DATETIME NOT NULL)"
+    ))
+    return connection.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+
+def run_migrations(engine=None) -> bool:
+    """Aplicar migrações pendentes (uma transação por migração)"""
+    engine = engine or default_engine
+    
+    try:
+        with engine.connect() as lock_conn:
+            # Evitar que dois processos do bot migrem ao mesmo tempo
+            is_mysql = engine.dialect.name == 'mysql'
+            if is_mysql:
+                # 0 = tempo esgotado, NULL = erro: não migrar sem o lock
+                acquired = lock_conn.execute(text("SELECT GET_LOCK('gedie_migrations', 60)")).scalar()
+                if acquired != 1:
+                    raise RuntimeError(f"lock de migração não obtido (GET_LOCK = {acquired})")
+            
+            try:
+                with engine.begin() as connection:
+                    current = get_schema_version(connection)
+                
+                pending = [m for m in MIGRATIONS if m.version > current]
+                if not pending:
+                    logger.info(f"✅ Schema atualizado (versão {current})")
+                    return True
+                
+                for migration in pending:
+                    logger.info(f"🔧 Aplicando migração {migration.version}: {migration.description}")
+                    with engine.begin() as connection:
+                        migration.apply(connection)
+                        connection.execute(
+                            text("INSERT INTO schema_version (version, description, applied_at) "
+                                 "VALUES (:version, :description, :applied_at)"),
+                            {
+                                'version': migration.version,
+                                'description': migration.description,
+                                'applied_at': datetime.utcnow()
+                            }
+                        )
+                
+                logger.info(f"✅ Schema migrado para a versão {LATEST_VERSION}")
+                return True
+            finally:
+                if is_mysql:
+                    lock_conn.execute(text("SELECT RELEASE_LOCK('gedie_migrations')"))
+    except Exception as e:
+        logger.error(f"❌ Erro ao aplicar migrações: {e}")
+        return False
@@ -41,4 +41,19 @@ class BaseModel(Base):
         """Remover do banco de dados"""
         db_session.delete(self)
         db_session.commit()
-        return True
\ No newline at end of file
+        return True
+    
+    async def save_async(self, db_session):
+        """Salvar no banco de dados (sessão assíncrona)
+        
+        Apenas faz flush: o commit fica a cargo da sessão do update.
+        """
+        db_session.add(self)
+        await db_session.flush()
+        return self
+    
+    async def delete_async(self, db_session):
+        """Remover do banco de dados (sessão assíncrona, sem commit)"""
+        await db_session.delete(self)
+        await db_session.flush()
+        return True
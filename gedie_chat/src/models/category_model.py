@@ -2,9 +2,10 @@
 Model para categorias de gastos
 """
 
-from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, Enum
+from sqlalchemy import Column, String, Integer, Boolean, ForeignKey, Enum, Index, select, func, event, insert
 from sqlalchemy.orm import relationship
 from models.base_model import BaseModel
+from utils.category_cache import category_cache, CachedCategory
 from loguru import logger
 import enum
 
@@ -12,10 +13,28 @@ class TipoCategoria(enum.Enum):
     DESPESA = "despesa"
     RECEITA = "receita"
 
+# Categorias criadas para todo novo usuário
+DEFAULT_CATEGORIES = [
+    {"nome": "Alimentação", "icone": "🍔", "cor": "#e74c3c"},
+    {"nome": "Transporte", "icone": "🚗", "cor": "#3498db"},
+    {"nome": "Casa", "icone": "🏠", "cor": "#2ecc71"},
+    {"nome": "Saúde", "icone": "💊", "cor": "#e67e22"},
+    {"nome": "Lazer", "icone": "🎬", "cor": "#9b59b6"},
+    {"nome": "Roupas", "icone": "👕", "cor": "#f39c12"},
+    {"nome": "Educação", "icone": "📚", "cor": "#34495e"},
+    {"nome": "Outros", "icone": "💳", "cor": "#95a5a6"},
+]
+
 class Category(BaseModel):
     """Model de categoria"""
     
     __tablename__ = 'categories'
+    __table_args__ = (
+        # Categorias ativas do usuário ordenadas por nome
+        Index('ix_categories_user_ativo_nome', 'user_id', 'ativo', 'nome'),
+        # Alterações recentes (sincronização do cache com a versão web)
+        Index('ix_categories_updated_at', 'updated_at'),
+    )
     
     nome = Column(String(50), nullable=False)
     icone = Column(String(10), nullable=False)
@@ -33,36 +52,50 @@ class Category(BaseModel):
     
     @classmethod
     def create_default_categories(cls, db_session, user_id):
-        """Criar categorias padrão para novo usuário"""
-        default_categories = [
-            {"nome": "Alimentação", "icone": "🍔", "cor": "#e74c3c"},
-            {"nome": "Transporte", "icone": "🚗", "cor": "#3498db"},
-            {"nome": "Casa", "icone": "🏠", "cor": "#2ecc71"},
-            {"nome": "Saúde", "icone": "💊", "cor": "#e67e22"},
-            {"nome": "Lazer", "icone": "🎬", "cor": "#9b59b6"},
-            {"nome": "Roupas", "icone": "👕", "cor": "#f39c12"},
-            {"nome": "Educação", "icone": "📚", "cor": "#34495e"},
-            {"nome": "Outros", "icone": "💳", "cor": "#95a5a6"},
-        ]
-        
+        """Criar categorias padrão para novo usuário (um único commit)"""
         try:
-            created_categories = []
-            for cat_data in default_categories:
-                category = cls(
+            created_categories = [
+                cls(
                     nome=cat_data["nome"],
                     icone=cat_data["icone"],
                     cor=cat_data["cor"],
                     user_id=user_id,
                     tipo=TipoCategoria.DESPESA
                 )
-                created_categories.append(category.save(db_session))
+                for cat_data in DEFAULT_CATEGORIES
+            ]
+            db_session.add_all(created_categories)
+            db_session.commit()
             
             logger.info(f"✅ {len(created_categories)} categorias padrão criadas para usuário {user_id}")
             return created_categories
         except Exception as e:
             logger.error(f"Erro ao criar categorias padrão: {e}")
+            db_session.rollback()
             return []
     
+    @classmethod
+    async def insert_default_categories_async(cls, db_session, user_id):
+        """Inserir categorias padrão num único INSERT multi-linha (sem commit/refresh)"""
+        await db_session.execute(
+            insert(cls.__table__),
+            [
+                {
+                    "nome": cat_data["nome"],
+                    "icone": cat_data["icone"],
+                    "cor": cat_data["cor"],
+                    "user_id": user_id,
+                    "tipo": TipoCategoria.DESPESA
+                }
+                for cat_data in DEFAULT_CATEGORIES
+            ]
+        )
+        # INSERT em massa não dispara eventos do ORM
+        category_cache.invalidate(user_id)
+        
+        logger.info(f"✅ {len(DEFAULT_CATEGORIES)} categorias padrão criadas para usuário {user_id}")
+        return len(DEFAULT_CATEGORIES)
+    
     @classmethod
     def get_user_categories(cls, db_session, user_id, tipo=None):
         """Obter categorias do usuário"""
@@ -78,4 +111,94 @@ class Category(BaseModel):
             return query.order_by(cls.nome).all()
         except Exception as e:
             logger.error(f"Erro ao buscar categorias do usuário {user_id}: {e}")
-            return []
\ No newline at end of file
+            return []
+    
+    @classmethod
+    async def get_user_categories_async(cls, db_session, user_id, tipo=None):
+        """Obter categorias do usuário (sessão assíncrona)"""
+        try:
+            query = select(cls).where(
+                cls.user_id == user_id,
+                cls.ativo == True
+            )
+            
+            if tipo:
+                query = query.where(cls.tipo == tipo)
+            
+            result = await db_session.execute(query.order_by(cls.nome))
+            return result.scalars().all()
+        except Exception as e:
+            logger.error(f"Erro ao buscar categorias do usuário {user_id}: {e}")
+            return []
+    
+    @classmethod
+    def _cached_categories_query(cls, user_id):
+        """Consulta só com as colunas guardadas no cache"""
+        return select(cls.id, cls.nome, cls.icone, cls.cor, cls.tipo).where(
+            cls.user_id == user_id,
+            cls.ativo == True
+        ).order_by(cls.nome)
+    
+    @classmethod
+    def get_user_categories_cached(cls, db_session, user_id):
+        """Obter categorias ativas do usuário (tupla imutável, via cache)"""
+        cached = category_cache.get(user_id)
+        if cached is not None:
+            return cached
+        
+        try:
+            rows = db_session.execute(cls._cached_categories_query(user_id)).all()
+            cached = tuple(CachedCategory(*row) for row in rows)
+            category_cache.set(user_id, cached)
+            return cached
+        except Exception as e:
+            logger.error(f"Erro ao buscar categorias do usuário {user_id}: {e}")
+            return ()
+    
+    @classmethod
+    async def get_user_categories_cached_async(cls, db_session, user_id):
+        """Obter categorias ativas do usuário (tupla imutável, via cache, sessão assíncrona)"""
+        cached = category_cache.get(user_id)
+        if cached is not None:
+            return cached
+        
+        try:
+            result = await db_session.execute(cls._cached_categories_query(user_id))
+            cached = tuple(CachedCategory(*row) for row in result.all())
+            category_cache.set(user_id, cached)
+            return cached
+        except Exception as e:
+            logger.error(f"Erro ao buscar categorias do usuário {user_id}: {e}")
+            return ()
+    
+    @classmethod
+    async def find_user_category_async(cls, db_session, user_id, category_id):
+        """Obter uma categoria ativa do usuário a partir do cache"""
+        categories = await cls.get_user_categories_cached_async(db_session, user_id)
+        for category in categories:
+            if category.id == category_id:
+                return category
+        return None
+    
+    @classmethod
+    async def get_last_update_async(cls, db_session):
+        """Data da última alteração em qualquer categoria"""
+        result = await db_session.execute(select(func.max(cls.updated_at)))
+        return result.scalar()
+    
+    @classmethod
+    async def get_changed_user_ids_async(cls, db_session, since):
+        """IDs dos usuários com categorias alteradas desde `since` (ex.: pela versão web)"""
+        result = await db_session.execute(
+            select(cls.user_id, func.max(cls.updated_at))
+            .where(cls.updated_at > since)
+            .group_by(cls.user_id)
+        )
+        return result.all()
+
+# Invalidar cache de categorias em qualquer escrita feita pelo ORM
+@event.listens_for(Category, 'after_insert')
+@event.listens_for(Category, 'after_update')
+@event.listens_for(Category, 'after_delete')
+def _invalidate_category_cache(mapper, connection, target):
+    category_cache.invalidate(target.user_id)
@@ -2,16 +2,38 @@
 Model para gastos/receitas
 """
 
-from datetime import date, datetime
-from sqlalchemy import Column, Numeric, Text, Date, Integer, ForeignKey
-from sqlalchemy.orm import relationship
+from datetime import date, datetime, timedelta
+from typing import NamedTuple
+from sqlalchemy import Column, Numeric, Text, Date, Integer, ForeignKey, Index, select, func, and_, or_
+from sqlalchemy.orm import relationship, selectinload
 from models.base_model import BaseModel
 from loguru import logger
 
+class ExpenseRow(NamedTuple):
+    """Linha leve de gasto para listagens (sem objeto ORM)"""
+    id: int
+    valor: float
+    descricao: str
+    data_gasto: date
+    created_at: datetime
+    category_nome: str
+    category_icone: str
+
+class ExpenseStats(NamedTuple):
+    """Resumo agregado de um período"""
+    count: int
+    total: float
+    average: float
+    maximum: float
+
 class Expense(BaseModel):
     """Model de gasto/receita"""
     
     __tablename__ = 'expenses'
+    __table_args__ = (
+        # Gastos do usuário por período, mais recentes primeiro
+        Index('ix_expenses_user_data_created', 'user_id', 'data_gasto', 'created_at'),
+    )
     
     valor = Column(Numeric(10, 2), nullable=False)
     descricao = Column(Text)
@@ -42,6 +64,38 @@ class Expense(BaseModel):
             logger.error(f"Erro ao criar gasto: {e}")
             return None
     
+    @classmethod
+    async def create_expense_async(cls, db_session, user_id, category_id, valor, descricao=None, data_gasto=None):
+        """Criar novo gasto (sessão assíncrona)
+        
+        Erros sobem para o chamador: o rollback é da sessão do update.
+        """
+        expense = cls(
+            user_id=user_id,
+            category_id=category_id,
+            valor=valor,
+            descricao=descricao,
+            data_gasto=data_gasto or date.today()
+        )
+        return await expense.save_async(db_session)
+    
+    @classmethod
+    async def create_expenses_async(cls, db_session, user_id, items, data_gasto=None):
+        """Criar vários gastos com um único flush (itens: category_id, valor, descricao)"""
+        expenses = [
+            cls(
+                user_id=user_id,
+                category_id=category_id,
+                valor=valor,
+                descricao=descricao,
+                data_gasto=data_gasto or date.today()
+            )
+            for category_id, valor, descricao in items
+        ]
+        db_session.add_all(expenses)
+        await db_session.flush()
+        return expenses
+    
     @classmethod
     def get_user_expenses(cls, db_session, user_id, data_inicio=None, data_fim=None):
         """Obter gastos do usuário por período"""
@@ -59,6 +113,95 @@ class Expense(BaseModel):
             logger.error(f"Erro ao buscar gastos do usuário {user_id}: {e}")
             return []
     
+    @classmethod
+    async def get_user_expenses_async(cls, db_session, user_id, data_inicio=None, data_fim=None):
+        """Obter gastos do usuário por período (sessão assíncrona)
+        
+        A categoria já vem carregada: sessões assíncronas não fazem lazy load.
+        """
+        try:
+            query = select(cls).where(cls.user_id == user_id).options(selectinload(cls.category))
+            
+            if data_inicio:
+                query = query.where(cls.data_gasto >= data_inicio)
+            
+            if data_fim:
+                query = query.where(cls.data_gasto <= data_fim)
+            
+            result = await db_session.execute(
+                query.order_by(cls.data_gasto.desc(), cls.created_at.desc())
+            )
+            return result.scalars().all()
+        except Exception as e:
+            logger.error(f"Erro ao buscar gastos do usuário {user_id}: {e}")
+            return []
+    
+    @classmethod
+    def _keyset_condition(cls, cursor, older):
+        """(data_gasto, created_at, id) antes/depois do cursor, na forma expandida
+        que usa o índice (user_id, data_gasto, created_at)"""
+        if older:
+            return or_(
+                cls.data_gasto < cursor.data_gasto,
+                and_(cls.data_gasto == cursor.data_gasto, or_(
+                    cls.created_at < cursor.created_at,
+                    and_(cls.created_at == cursor.created_at, cls.id < cursor.id)
+                ))
+            )
+        return or_(
+            cls.data_gasto > cursor.data_gasto,
+            and_(cls.data_gasto == cursor.data_gasto, or_(
+                cls.created_at > cursor.created_at,
+                and_(cls.created_at == cursor.created_at, cls.id > cursor.id)
+            ))
+        )
+    
+    @classmethod
+    def _rows_query(cls, user_id, data_inicio, data_fim, limit, after=None, before=None):
+        """Projeção com join na categoria: só as colunas da listagem"""
+        from models.category_model import Category
+        query = (
+            select(
+                cls.id, cls.valor, cls.descricao, cls.data_gasto, cls.created_at,
+                Category.nome, Category.icone
+            )
+            .join(Category, Category.id == cls.category_id)
+            .where(*cls._period_filter(user_id, data_inicio, data_fim))
+        )
+        
+        if before is not None:
+            # Página mais recente que o cursor: percorrer em ordem crescente
+            return (
+                query.where(cls._keyset_condition(before, older=False))
+                .order_by(cls.data_gasto, cls.created_at, cls.id)
+                .limit(limit)
+            )
+        
+        if after is not None:
+            query = query.where(cls._keyset_condition(after, older=True))
+        
+        return query.order_by(cls.data_gasto.desc(), cls.created_at.desc(), cls.id.desc()).limit(limit)
+    
+    @classmethod
+    async def list_rows_async(cls, db_session, user_id, data_inicio=None, data_fim=None, limit=10,
+                              after=None, before=None):
+        """Listar gastos do período como ExpenseRow (uma consulta, até `limit` linhas)
+        
+        Paginação keyset: `after` traz os gastos mais antigos que o cursor,
+        `before` os mais recentes. O resultado vem sempre do mais recente
+        para o mais antigo.
+        """
+        result = await db_session.execute(
+            cls._rows_query(user_id, data_inicio, data_fim, limit, after, before)
+        )
+        rows = [
+            ExpenseRow(id_, float(valor), descricao, data_gasto, created_at, nome, icone)
+            for id_, valor, descricao, data_gasto, created_at, nome, icone in result.all()
+        ]
+        if before is not None:
+            rows.reverse()
+        return rows
+    
     @classmethod
     def get_today_expenses(cls, db_session, user_id):
         """Obter gastos de hoje"""
@@ -74,19 +217,133 @@ class Expense(BaseModel):
             if not ano:
                 ano = date.today().year
             
-            # Primeiro e último dia do mês
+            # Primeiro e último dia do mês (intervalo inclusivo)
             primeiro_dia = date(ano, mes, 1)
             if mes == 12:
-                ultimo_dia = date(ano + 1, 1, 1)
+                ultimo_dia = date(ano + 1, 1, 1) - timedelta(days=1)
             else:
-                ultimo_dia = date(ano, mes + 1, 1)
+                ultimo_dia = date(ano, mes + 1, 1) - timedelta(days=1)
             
-            expenses = cls.get_user_expenses(db_session, user_id, primeiro_dia, ultimo_dia)
-            return sum(float(expense.valor) for expense in expenses)
+            return cls.get_period_total(db_session, user_id, primeiro_dia, ultimo_dia)
         except Exception as e:
             logger.error(f"Erro ao calcular total do mês: {e}")
             return 0
     
+    # ------------------------------------------------------------------ #
+    # Agregações no banco (SUM/COUNT ... GROUP BY), retornam tuplas simples
+    # ------------------------------------------------------------------ #
+    
+    @classmethod
+    def _period_filter(cls, user_id, data_inicio=None, data_fim=None):
+        """Condições de usuário/período (intervalo inclusivo)"""
+        conditions = [cls.user_id == user_id]
+        if data_inicio:
+            conditions.append(cls.data_gasto >= data_inicio)
+        if data_fim:
+            conditions.append(cls.data_gasto <= data_fim)
+        return conditions
+    
+    @classmethod
+    def _period_total_query(cls, user_id, data_inicio, data_fim):
+        return select(func.coalesce(func.sum(cls.valor), 0)).where(
+            *cls._period_filter(user_id, data_inicio, data_fim)
+        )
+    
+    @classmethod
+    def _category_totals_query(cls, user_id, data_inicio, data_fim):
+        from models.category_model import Category
+        return (
+            select(
+                Category.id,
+                Category.nome,
+                Category.icone,
+                func.sum(cls.valor).label('total'),
+                func.count(cls.id).label('quantidade')
+            )
+            .join(Category, Category.id == cls.category_id)
+            .where(*cls._period_filter(user_id, data_inicio, data_fim))
+            .group_by(Category.id, Category.nome, Category.icone)
+            .order_by(func.sum(cls.valor).desc())
+        )
+    
+    @classmethod
+    def _daily_totals_query(cls, user_id, data_inicio, data_fim):
+        return (
+            select(cls.data_gasto, func.sum(cls.valor))
+            .where(*cls._period_filter(user_id, data_inicio, data_fim))
+            .group_by(cls.data_gasto)
+            .order_by(cls.data_gasto)
+        )
+    
+    @classmethod
+    def _period_stats_query(cls, user_id, data_inicio, data_fim):
+        return select(
+            func.count(cls.id),
+            func.coalesce(func.sum(cls.valor), 0),
+            func.coalesce(func.avg(cls.valor), 0),
+            func.coalesce(func.max(cls.valor), 0)
+        ).where(*cls._period_filter(user_id, data_inicio, data_fim))
+    
+    @staticmethod
+    def _category_totals_rows(rows):
+        return [(cat_id, nome, icone, float(total), quantidade) for cat_id, nome, icone, total, quantidade in rows]
+    
+    @staticmethod
+    def _daily_totals_rows(rows):
+        return [(dia, float(total)) for dia, total in rows]
+    
+    @staticmethod
+    def _period_stats_row(row):
+        count, total, average, maximum = row
+        return ExpenseStats(count, float(total), float(average), float(maximum))
+    
+    @classmethod
+    def get_period_total(cls, db_session, user_id, data_inicio=None, data_fim=None):
+        """Total gasto no período"""
+        return float(db_session.execute(cls._period_total_query(user_id, data_inicio, data_fim)).scalar())
+    
+    @classmethod
+    async def get_period_total_async(cls, db_session, user_id, data_inicio=None, data_fim=None):
+        """Total gasto no período (sessão assíncrona)"""
+        result = await db_session.execute(cls._period_total_query(user_id, data_inicio, data_fim))
+        return float(result.scalar())
+    
+    @classmethod
+    def get_category_totals(cls, db_session, user_id, data_inicio=None, data_fim=None):
+        """Totais por categoria: [(category_id, nome, icone, total, quantidade)], maior total primeiro"""
+        rows = db_session.execute(cls._category_totals_query(user_id, data_inicio, data_fim)).all()
+        return cls._category_totals_rows(rows)
+    
+    @classmethod
+    async def get_category_totals_async(cls, db_session, user_id, data_inicio=None, data_fim=None):
+        """Totais por categoria (sessão assíncrona)"""
+        result = await db_session.execute(cls._category_totals_query(user_id, data_inicio, data_fim))
+        return cls._category_totals_rows(result.all())
+    
+    @classmethod
+    def get_daily_totals(cls, db_session, user_id, data_inicio=None, data_fim=None):
+        """Série diária: [(data_gasto, total)] em ordem cronológica"""
+        rows = db_session.execute(cls._daily_totals_query(user_id, data_inicio, data_fim)).all()
+        return cls._daily_totals_rows(rows)
+    
+    @classmethod
+    async def get_daily_totals_async(cls, db_session, user_id, data_inicio=None, data_fim=None):
+        """Série diária (sessão assíncrona)"""
+        result = await db_session.execute(cls._daily_totals_query(user_id, data_inicio, data_fim))
+        return cls._daily_totals_rows(result.all())
+    
+    @classmethod
+    def get_period_stats(cls, db_session, user_id, data_inicio=None, data_fim=None):
+        """Quantidade, total, média e maior gasto do período"""
+        row = db_session.execute(cls._period_stats_query(user_id, data_inicio, data_fim)).one()
+        return cls._period_stats_row(row)
+    
+    @classmethod
+    async def get_period_stats_async(cls, db_session, user_id, data_inicio=None, data_fim=None):
+        """Quantidade, total, média e maior gasto do período (sessão assíncrona)"""
+        result = await db_session.execute(cls._period_stats_query(user_id, data_inicio, data_fim))
+        return cls._period_stats_row(result.one())
+    
     def format_valor(self):
         """Formatar valor para exibição"""
         return f"R$ {float(self.valor):.2f}".replace('.', ',')
\ No newline at end of file
@@ -2,9 +2,10 @@
 Model para usuários do sistema - VERSÃO COM CÓDIGO DE ACESSO
 """
 
-from sqlalchemy import Column, BigInteger, String, Boolean
+from sqlalchemy import Column, BigInteger, String, Boolean, select, insert
 from sqlalchemy.orm import relationship
 from models.base_model import BaseModel
+from utils.user_cache import user_cache, CachedUser
 from loguru import logger
 
 class User(BaseModel):
@@ -35,6 +36,54 @@ class User(BaseModel):
             logger.error(f"Erro ao buscar usuário {telegram_id}: {e}")
             return None
     
+    @classmethod
+    async def get_by_telegram_id_async(cls, db_session, telegram_id):
+        """Buscar usuário pelo Telegram ID (sessão assíncrona)"""
+        try:
+            result = await db_session.execute(
+                select(cls).where(cls.telegram_id == telegram_id)
+            )
+            return result.scalars().first()
+        except Exception as e:
+            logger.error(f"Erro ao buscar usuário {telegram_id}: {e}")
+            return None
+    
+    @classmethod
+    async def get_cached_async(cls, db_session, telegram_id, locking=False):
+        """Buscar registro leve do usuário, passando pelo cache em memória
+        
+        locking=True lê com FOR UPDATE: no MySQL (REPEATABLE READ) enxerga
+        linhas commitadas depois do snapshot da transação.
+        """
+        cached = user_cache.get(telegram_id)
+        if cached is not None:
+            return cached
+        
+        try:
+            query = (
+                select(cls.id, cls.nome, cls.ativo, cls.timezone, cls.codigo_acesso)
+                .where(cls.telegram_id == telegram_id)
+            )
+            if locking:
+                query = query.with_for_update()
+            result = await db_session.execute(query)
+            row = result.first()
+            if row is None:
+                return None
+            
+            cached = CachedUser(
+                id=row.id,
+                nome=row.nome,
+                ativo=row.ativo,
+                timezone=row.timezone,
+                has_code=row.codigo_acesso is not None and len(row.codigo_acesso) == 6
+            )
+            user_cache.set(telegram_id, cached)
+            return cached
+        except Exception as e:
+            logger.error(f"Erro ao buscar usuário {telegram_id}: {e}")
+            return None
+    
     @classmethod
     def create_user(cls, db_session, telegram_id, nome, timezone='America/Sao_Paulo'):
         """Criar novo usuário"""
@@ -44,11 +93,49 @@ class User(BaseModel):
                 nome=nome,
                 timezone=timezone
             )
+            user_cache.invalidate(telegram_id)
             return user.save(db_session)
         except Exception as e:
             logger.error(f"Erro ao criar usuário {telegram_id}: {e}")
             return None
     
+    @classmethod
+    async def create_user_async(cls, db_session, telegram_id, nome, timezone='America/Sao_Paulo'):
+        """Criar novo usuário (sessão assíncrona; erros sobem, o rollback é da sessão do update)"""
+        user = cls(
+            telegram_id=telegram_id,
+            nome=nome,
+            timezone=timezone
+        )
+        user_cache.invalidate(telegram_id)
+        return await user.save_async(db_session)
+    
+    @classmethod
+    async def insert_if_absent_async(cls, db_session, telegram_id, nome, timezone='America/Sao_Paulo'):
+        """Inserir usuário se ainda não existir (seguro para /start concorrentes)
+        
+        Retorna (user_id, criado). Não faz commit nem refresh.
+        """
+        stmt = (
+            insert(cls.__table__)
+            .values(telegram_id=telegram_id, nome=nome[:100], timezone=timezone)
+            .prefix_with('IGNORE', dialect='mysql')
+            .prefix_with('OR IGNORE', dialect='sqlite')
+        )
+        result = await db_session.execute(stmt)
+        user_cache.invalidate(telegram_id)
+        
+        if result.rowcount == 1:
+            return result.inserted_primary_key[0], True
+        
+        # Outro update criou o usuário antes: usar o existente. Leitura com
+        # FOR UPDATE: um SELECT comum reusaria o snapshot do início da
+        # transação (MySQL, REPEATABLE READ), em que o usuário ainda não existe
+        existing = await db_session.execute(
+            select(cls.id).where(cls.telegram_id == telegram_id).with_for_update()
+        )
+        return existing.scalar_one(), False
+    
     @classmethod
     def update_access_code(cls, db_session, user_id, codigo_acesso):
         """Atualizar código de acesso do usuário"""
@@ -57,6 +144,7 @@ class User(BaseModel):
             if user:
                 user.codigo_acesso = codigo_acesso
                 db_session.commit()
+                user_cache.invalidate(user.telegram_id)
                 db_session.refresh(user)
                 logger.info(f"Código de acesso atualizado para usuário {user_id}")
                 return True
@@ -68,6 +156,20 @@ class User(BaseModel):
             db_session.rollback()
             return False
     
+    @classmethod
+    async def update_access_code_async(cls, db_session, user_id, codigo_acesso):
+        """Atualizar código de acesso do usuário (sessão assíncrona; erros sobem)"""
+        user = await db_session.get(cls, user_id)
+        if user:
+            user.codigo_acesso = codigo_acesso
+            await db_session.flush()
+            user_cache.invalidate(user.telegram_id)
+            logger.info(f"Código de acesso atualizado para usuário {user_id}")
+            return True
+        else:
+            logger.error(f"Usuário {user_id} não encontrado para atualizar código")
+            return False
+    
     @classmethod
     def get_by_telegram_id_and_code(cls, db_session, telegram_id, codigo_acesso):
         """Buscar usuário por Telegram ID e código de acesso (para login web)"""
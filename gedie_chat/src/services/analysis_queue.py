@@ -0,0 +1,211 @@
+"""
+Fila de análises de comprovantes (workers em background, backpressure e retries)
+"""
+
+import asyncio
+import contextvars
+import random
+from functools import partial
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Set, Union
+from decouple import config
+from loguru import logger
+
+# Workers simultâneos, tamanho máximo da fila e tentativas extras em falhas passageiras
+WORKERS = config('ANALYSIS_WORKERS', default=4, cast=int)
+QUEUE_SIZE = config('ANALYSIS_QUEUE_SIZE', default=50, cast=int)
+MAX_RETRIES = config('ANALYSIS_MAX_RETRIES', default=2, cast=int)
+RETRY_BASE = config('ANALYSIS_RETRY_BASE', default=1.0, cast=float)
+
+Result = Dict[str, Any]
+
+class AnalysisJob:
+    """Análise enfileirada de um usuário (lista de imagens = álbum, analisado em lote)"""
+    
+    __slots__ = ('user_id', 'image_data', 'on_progress', 'on_done', 'position', 'cancelled', 'task')
+    
+    def __init__(self, user_id: int, image_data: Union[bytes, List[bytes]],
+                 on_done: Callable[[Result], Awaitable[None]],
+                 on_progress: Optional[Callable[[int], Awaitable[None]]] = None):
+        self.user_id = user_id
+        self.image_data = image_data
+        self.on_done = on_done
+        self.on_progress = on_progress
+        self.position: Optional[int] = None   # posição informada ao usuário (None = nunca esperou)
+        self.cancelled = False
+        self.task: Optional[asyncio.Task] = None
+
+class AnalysisQueue:
+    """Fila limitada atendida por workers próprios
+    
+    As análises rodam fora do handler: o handler só enfileira e retorna,
+    então um job em andamento não depende do tempo de vida do update.
+    Fila cheia recusa novos jobs (submit devolve None). Resultados com
+    'transitorio' são repetidos com backoff exponencial e jitter.
+    """
+    
+    def __init__(self, analyze: Callable[[Any], Awaitable[Result]] = None, workers: int = WORKERS,
+                 max_size: int = QUEUE_SIZE, max_retries: int = MAX_RETRIES, retry_base: float = RETRY_BASE):
+        self._analyze = analyze
+        self.workers = workers
+        self.max_size = max_size
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self._pending: Deque[AnalysisJob] = deque()
+        self._running: Set[AnalysisJob] = set()
+        self._ready = asyncio.Condition()
+        self._worker_tasks: List[asyncio.Task] = []
+        self._callbacks: Set[asyncio.Task] = set()
+        self.submitted = self.rejected = self.retries = self.completed = self.cancelled = 0
+    
+    def _start(self):
+        """Subir os workers no primeiro uso, com contexto limpo (sem sessão/estado do update)"""
+        if self._worker_tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._worker_tasks = [
+            loop.create_task(self._worker(), context=contextvars.Context())
+            for _ in range(self.workers)
+        ]
+    
+    async def stop(self):
+        """Parar os workers (jobs pendentes são descartados)"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        self._pending.clear()
+    
+    async def submit(self, job: AnalysisJob) -> Optional[int]:
+        """Enfileirar job; devolve a posição na fila (0 = começa já) ou None se a fila estiver cheia"""
+        if len(self._pending) >= self.max_size:
+            self.rejected += 1
+            logger.warning(f"Fila de análises cheia ({len(self._pending)}): job do usuário {job.user_id} recusado")
+            return None
+        
+        self._start()
+        async with self._ready:
+            self._pending.append(job)
+            self.submitted += 1
+            self._ready.notify()
+        
+        waiting = len(self._running) + len(self._pending) - self.workers
+        if waiting > 0:
+            job.position = waiting
+            self._notify(job, waiting)
+            return waiting
+        return 0
+    
+    def cancel(self, user_id: int) -> int:
+        """Cancelar jobs do usuário (na fila ou em andamento); devolve quantos"""
+        jobs = [job for job in (*self._pending, *self._running) if job.user_id == user_id and not job.cancelled]
+        for job in jobs:
+            job.cancelled = True
+            if job in self._pending:
+                self._pending.remove(job)
+                self.cancelled += 1
+            elif job.task is not None:
+                job.task.cancel()
+        
+        if jobs:
+            self._report_positions()
+        return len(jobs)
+    
+    def _report_positions(self):
+        """Avisar os jobs que esperam (sem worker livre) da nova posição na fila"""
+        free = self.workers - len(self._running)
+        for index, job in enumerate(self._pending):
+            position = index + 1 - free
+            if position > 0 and position != job.position:
+                job.position = position
+                self._notify(job, position)
+    
+    def _notify(self, job: AnalysisJob, position: int):
+        if job.on_progress is not None:
+            task = asyncio.ensure_future(self._safe_call(job.on_progress, position))
+            self._callbacks.add(task)
+            task.add_done_callback(self._callbacks.discard)
+    
+    async def _safe_call(self, callback, *args):
+        try:
+            await callback(*args)
+        except Exception as e:
+            logger.warning(f"Erro no callback da análise: {e}")
+    
+    async def _worker(self):
+        while True:
+            async with self._ready:
+                await self._ready.wait_for(lambda: self._pending)
+                job = self._pending.popleft()
+                self._running.add(job)
+        
+            try:
+                self._report_positions()
+                if job.position is not None:
+                    self._notify(job, 0)    # saiu da fila: começou a análise
+                await self._run(job)
+            except Exception as e:
+                logger.error(f"Erro no job de análise do usuário {job.user_id}: {e}")
+            finally:
+                self._running.discard(job)
+    
+    async def _run(self, job: AnalysisJob):
+        job.task = asyncio.ensure_future(self._attempts(job))
+        try:
+            result = await job.task
+        except asyncio.CancelledError:
+            # Cancelado pelo usuário (não pelo stop() do worker)
+            if job.cancelled and not asyncio.current_task().cancelling():
+                self.cancelled += 1
+                logger.info(f"Análise do usuário {job.user_id} cancelada")
+                return
+            job.task.cancel()
+            raise
+        except Exception as e:
+            # Todo job aceito termina com exatamente um on_done (o usuário não fica esperando)
+            logger.error(f"Falha na análise do usuário {job.user_id}: {e}")
+            result = {'erro': True, 'observacoes': "Erro: falha inesperada na análise"}
+        
+        self.completed += 1
+        await self._safe_call(job.on_done, result)
+    
+    async def _attempts(self, job: AnalysisJob) -> Result:
+        """Analisar repetindo falhas passageiras com backoff exponencial (full jitter)"""
+        analyze = self._analyze
+        if analyze is None:
+            from services.receipt_provider import get_receipt_provider
+            provider = get_receipt_provider()
+            batch = isinstance(job.image_data, list)
+            method = provider.analyze_receipts if batch else provider.analyze_receipt
+            analyze = partial(method, user_id=job.user_id)   # métricas por usuário
+        
+        attempt = 0
+        while True:
+            result = await analyze(job.image_data)
+            if not (result.get('erro') and result.get('transitorio')) or attempt >= self.max_retries:
+                return result
+        
+            delay = random.uniform(0, self.retry_base * 2 ** attempt)
+            attempt += 1
+            self.retries += 1
+            logger.warning(f"Análise do usuário {job.user_id} falhou ({result.get('observacoes')}); "
+                           f"tentativa {attempt + 1} em {delay:.1f}s")
+            await asyncio.sleep(delay)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Estatísticas da fila"""
+        return {
+            'name': 'analysis_queue',
+            'workers': self.workers,
+            'pending': len(self._pending),
+            'running': len(self._running),
+            'max_size': self.max_size,
+            'submitted': self.submitted,
+            'rejected': self.rejected,
+            'retries': self.retries,
+            'completed': self.completed,
+            'cancelled': self.cancelled
+        }
+
+# Instância global
+analysis_queue = AnalysisQueue()
@@ -0,0 +1,47 @@
+"""
+Sincronização do cache de categorias com alterações feitas fora do bot
+"""
+
+import asyncio
+from loguru import logger
+from decouple import config
+
+from config.database_config import AsyncSessionLocal
+from models.category_model import Category
+from utils.category_cache import category_cache
+
+class CategorySyncService:
+    """Invalida o cache quando outro processo (ex.: versão web) altera categorias"""
+    
+    def __init__(self, interval: float = None):
+        self.interval = interval or config('CATEGORY_SYNC_INTERVAL', default=30, cast=float)
+        self._since = None
+    
+    async def sync_once(self) -> int:
+        """Verificar alterações desde a última sincronização; retorna usuários invalidados"""
+        async with AsyncSessionLocal() as db:
+            if self._since is None:
+                # Primeira execução: cache ainda vazio, só marcar o ponto de partida
+                self._since = await Category.get_last_update_async(db)
+                return 0
+            
+            changes = await Category.get_changed_user_ids_async(db, self._since)
+        
+        for user_id, last_update in changes:
+            category_cache.invalidate(user_id)
+            if last_update > self._since:
+                self._since = last_update
+        
+        if changes:
+            logger.info(f"🔄 Cache de categorias invalidado para {len(changes)} usuário(s)")
+        return len(changes)
+    
+    async def run(self):
+        """Loop de sincronização em background"""
+        logger.info(f"🔄 Sincronização de categorias a cada {self.interval:.0f}s")
+        while True:
+            try:
+                await self.sync_once()
+            except Exception as e:
+                logger.error(f"Erro ao sincronizar cache de categorias: {e}")
+            await asyncio.sleep(self.interval)
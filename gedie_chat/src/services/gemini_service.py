@@ -2,17 +2,71 @@
 Serviço de integração com Google Gemini - VERSÃO ATUALIZADA
 """
 
+import asyncio
 import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
 import json
-from typing import Dict, Any
-from PIL import Image
-from io import BytesIO
+from typing import Dict, Any, List, Optional
 from decouple import config
 from loguru import logger
 
-class GeminiService:
+from services.receipt_cache import create_receipt_cache
+from services.image_preprocessing import preprocess_receipt_async
+from services.metrics_service import AnalysisCall, Timer
+from services.receipt_provider import ReceiptProvider, CATEGORIAS
+
+# Falhas passageiras da API (vale tentar de novo mais tarde)
+TRANSIENT_ERRORS = (
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+)
+
+# Prompt curto: formato e tipos vêm do schema da resposta (modo JSON do Gemini)
+RECEIPT_PROMPT = """Extraia os dados deste comprovante fiscal brasileiro (nota fiscal, cupom, recibo, PIX).
+valor_total: valor TOTAL PAGO. estabelecimento: nome da loja/empresa. itens_principais: até 3.
+categoria_sugerida: alimentacao (restaurantes, mercados, delivery), transporte (combustível,
+estacionamento, apps, ônibus), casa (construção, móveis, limpeza), saude (farmácia, consultas,
+exames), lazer (cinema, eventos, viagens) ou outros. confianca: sua certeza de 0 a 1.
+Use null no que não estiver legível."""
+
+# Álbum: várias imagens na mesma chamada, uma análise por imagem
+BATCH_PROMPT = """As próximas {count} imagens são comprovantes DIFERENTES: devolva um objeto por imagem, na mesma ordem.
+"""
+
+RECEIPT_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'valor_total': {'type': 'number', 'nullable': True},
+        'estabelecimento': {'type': 'string', 'nullable': True},
+        'categoria_sugerida': {'type': 'string', 'format': 'enum', 'enum': CATEGORIAS},
+        'itens_principais': {'type': 'array', 'items': {'type': 'string'}},
+        'confianca': {'type': 'number'},
+        'observacoes': {'type': 'string', 'nullable': True}
+    },
+    'required': ['valor_total', 'estabelecimento', 'categoria_sugerida', 'confianca']
+}
+
+# Teto de tokens da resposta por comprovante
+MAX_OUTPUT_TOKENS = config('GEMINI_MAX_OUTPUT_TOKENS', default=256, cast=int)
+
+def generation_config(count: int = None) -> genai.GenerationConfig:
+    """Saída JSON com schema (count: álbum, array com `count` objetos)"""
+    schema = RECEIPT_SCHEMA if count is None else {'type': 'array', 'items': RECEIPT_SCHEMA}
+    return genai.GenerationConfig(
+        response_mime_type='application/json',
+        response_schema=schema,
+        max_output_tokens=MAX_OUTPUT_TOKENS * (count or 1),
+        temperature=0
+    )
+
+class GeminiService(ReceiptProvider):
     """Serviço para análise de comprovantes com Gemini"""
     
+    name = 'gemini'
+    transient_errors = TRANSIENT_ERRORS
+    
     def __init__(self):
         self.api_key = config('GEMINI_API_KEY')
         genai.configure(api_key=self.api_key)
@@ -20,99 +74,133 @@ class GeminiService:
         # CORREÇÃO: Usar modelo atualizado
         self.model = genai.GenerativeModel('gemini-1.5-flash')
         
+        # Análises simultâneas no processo e tempo máximo de cada chamada
+        self.timeout = config('GEMINI_TIMEOUT', default=30, cast=float)
+        self._semaphore = asyncio.Semaphore(config('GEMINI_MAX_CONCURRENCY', default=4, cast=int))
+        
+        # Resultados já obtidos para a mesma imagem (None = sem cache)
+        self.cache = create_receipt_cache()
+        
         logger.info("🤖 Gemini Service inicializado com modelo gemini-1.5-flash")
     
-    async def analyze_receipt(self, image_data: bytes) -> Dict[str, Any]:
-        """Analisar comprovante e extrair informações"""
+    def _parse_response(self, response_text: str, array: bool = False) -> Any:
+        """JSON da resposta (já no formato do schema; array=True: lista de objetos)"""
+        logger.debug(f"Resposta bruta do Gemini: {response_text[:200]}...")
+        data = json.loads(response_text)
         
-        try:
-            logger.info(f"Iniciando análise de comprovante ({len(image_data)} bytes)")
-            
-            # Converter bytes para PIL Image
-            image = Image.open(BytesIO(image_data))
-            
-            # Redimensionar se muito grande
-            max_size = 1024
-            if image.width > max_size or image.height > max_size:
-                image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
-                logger.info(f"Imagem redimensionada para {image.size}")
-            
-            # Prompt otimizado para comprovantes brasileiros
-            prompt = """
-Analise esta imagem de comprovante fiscal brasileiro (nota fiscal, cupom, recibo) e extraia as informações em formato JSON.
-
-IMPORTANTE: Responda APENAS o JSON válido, sem texto adicional ou formatação markdown.
-
-{
-    "valor_total": 25.50,
-    "estabelecimento": "Nome da Loja/Restaurante",
-    "categoria_sugerida": "alimentacao",
-    "itens_principais": ["item1", "item2", "item3"],
-    "confianca": 0.85,
-    "observacoes": "Informações relevantes"
-}
-
-REGRAS IMPORTANTES:
-- valor_total: número decimal do valor TOTAL PAGO (exemplo: 25.50)
-- estabelecimento: nome completo da loja/restaurante/empresa
-- categoria_sugerida: escolha uma: "alimentacao", "transporte", "casa", "saude", "lazer", "outros"
-- itens_principais: até 3 itens mais importantes comprados
-- confianca: sua certeza na análise (0.0 a 1.0)
-- observacoes: informações adicionais úteis
-
-CATEGORIZAÇÃO:
-- "alimentacao": restaurantes, mercados, lanches, delivery, supermercados
-- "transporte": combustível, estacionamento, Uber, táxi, ônibus
-- "casa": construção, móveis, utensílios, limpeza
-- "saude": farmácia, consultas, exames, medicamentos
-- "lazer": cinema, eventos, jogos, viagens, entretenimento
-- "outros": quando não se encaixar nas demais
-
-Se não conseguir identificar algum campo claramente, use null.
-RESPONDA APENAS O JSON, SEM TEXTO ADICIONAL.
-"""
-            
-            # Enviar para Gemini com novo modelo
-            logger.info("Enviando para análise do Gemini 1.5 Flash...")
-            response = self.model.generate_content([prompt, image])
-            
-            # Parse da resposta
-            response_text = response.text.strip()
-            logger.info(f"Resposta bruta do Gemini: {response_text[:200]}...")
-            
-            # Limpar possível formatação markdown
-            if response_text.startswith('```json'):
-                response_text = response_text.replace('```json', '').replace('```', '').strip()
-            elif response_text.startswith('```'):
-                response_text = response_text.replace('```', '').strip()
-            
-            # Tentar encontrar JSON na resposta
-            try:
-                result = json.loads(response_text)
-            except json.JSONDecodeError:
-                # Tentar extrair JSON de uma resposta mais complexa
-                import re
-                json_match = re.search(r'\{.*?\}', response_text, re.DOTALL)
-                if json_match:
-                    json_text = json_match.group()
-                    result = json.loads(json_text)
-                else:
-                    raise ValueError("Não foi possível encontrar JSON válido na resposta")
-            
-            # Validar e normalizar resultado
-            result = self._validate_result(result)
-            
-            logger.info(f"✅ Análise concluída: valor={result.get('valor_total')}, estabelecimento={result.get('estabelecimento')}, confiança={result.get('confianca')}")
-            return result
+        if not isinstance(data, list if array else dict):
+            raise ValueError(f"esperado {'array' if array else 'objeto'}, veio {type(data).__name__}")
+        return data
+    
+    async def _generate(self, parts: List[Any], call: AnalysisCall, count: int = None) -> str:
+        """Chamada ao modelo limitada por GEMINI_MAX_CONCURRENCY e GEMINI_TIMEOUT"""
+        call.upload_bytes = sum(len(part['data']) for part in parts if isinstance(part, dict))
+        
+        async with self._semaphore:
+            # Latência medida sem a espera pelo semáforo
+            with Timer() as timer:
+                try:
+                    response = await asyncio.wait_for(
+                        self.model.generate_content_async(parts, generation_config=generation_config(count)),
+                        timeout=self.timeout
+                    )
+                finally:
+                    call.model_seconds = timer.elapsed()
+        
+        call.usage(response)
+        logger.info(f"Gemini respondeu em {call.model_seconds:.2f}s "
+                    f"({call.upload_bytes} bytes, tokens {call.prompt_tokens}/{call.response_tokens})")
+        return response.text
+    
+    async def _preprocess(self, images: List[bytes], call: AnalysisCall) -> List[bytes]:
+        with Timer() as timer:
+            processed = await asyncio.gather(*(preprocess_receipt_async(image) for image in images))
+        call.preprocess_seconds = timer.elapsed()
+        return list(processed)
+    
+    async def _cached(self, image: bytes, use_cache: bool) -> Optional[Dict[str, Any]]:
+        if use_cache and self.cache is not None:
+            return await asyncio.to_thread(self.cache.get, image)
+        return None
+    
+    async def _remember(self, image: bytes, result: Dict[str, Any], use_cache: bool):
+        if use_cache and self.cache is not None:
+            await asyncio.to_thread(self.cache.set, image, result)
+    
+    async def analyze_receipt(self, image_data: bytes, use_cache: bool = True,
+                              user_id: Optional[int] = None) -> Dict[str, Any]:
+        """Analisar comprovante e extrair informações
+        
+        Não bloqueia o event loop: imagem pré-processada no pool de processos
+        e chamada assíncrona ao Gemini, limitada por GEMINI_MAX_CONCURRENCY e
+        GEMINI_TIMEOUT. Cancelar a task interrompe a análise.
+        Imagens já analisadas vêm do cache (use_cache=False ignora o cache).
+        Tempos, bytes e tokens vão para receipt_metrics (user_id: contadores por usuário).
+        """
+        call = AnalysisCall(user_id)
+        return await self._guarded(self._analyze_one(image_data, use_cache, call), call)
+    
+    async def _analyze_one(self, image_data: bytes, use_cache: bool, call: AnalysisCall) -> Dict[str, Any]:
+        logger.info(f"Iniciando análise de comprovante ({len(image_data)} bytes)")
+        
+        # Orientado, recortado, em tons de cinza e recomprimido
+        image, = await self._preprocess([image_data], call)
+        logger.info(f"Imagem pré-processada: {len(image_data)} → {len(image)} bytes")
+        
+        cached = await self._cached(image, use_cache)
+        if cached is not None:
+            call.cached, call.outcome = 1, 'cache'
+            logger.info("🧾 Comprovante já analisado: resultado do cache")
+            return cached
+        
+        logger.info("Enviando para análise do Gemini 1.5 Flash...")
+        response_text = await self._generate([RECEIPT_PROMPT, {'mime_type': 'image/jpeg', 'data': image}], call)
+        
+        # Validar e normalizar resultado
+        result = self._validate_result(self._parse_response(response_text))
+        call.confidences.append(result['confianca'])
+        await self._remember(image, result, use_cache)
+        
+        logger.info(f"✅ Análise concluída: valor={result.get('valor_total')}, estabelecimento={result.get('estabelecimento')}, confiança={result.get('confianca')}")
+        return result
+    
+    async def analyze_receipts(self, images: List[bytes], use_cache: bool = True,
+                               user_id: Optional[int] = None) -> Dict[str, Any]:
+        """Analisar vários comprovantes (álbum) em uma única chamada ao Gemini
+        
+        Devolve {'comprovantes': [análise por imagem, na ordem]} ou um resultado de erro.
+        Só as imagens fora do cache vão para o modelo.
+        """
+        call = AnalysisCall(user_id, images=len(images))
+        return await self._guarded(self._analyze_batch(images, use_cache, call), call)
+    
+    async def _analyze_batch(self, images: List[bytes], use_cache: bool, call: AnalysisCall) -> Dict[str, Any]:
+        logger.info(f"Iniciando análise de {len(images)} comprovantes em lote")
+        processed = await self._preprocess(images, call)
+        
+        results: List[Optional[Dict[str, Any]]] = [await self._cached(image, use_cache) for image in processed]
+        missing = [index for index, result in enumerate(results) if result is None]
+        call.cached = len(images) - len(missing)
+        if not missing:
+            call.outcome = 'cache'
+        
+        if missing:
+            logger.info(f"Enviando {len(missing)} imagem(ns) em uma chamada ao Gemini...")
+            parts = [BATCH_PROMPT.format(count=len(missing)) + RECEIPT_PROMPT]
+            parts += [{'mime_type': 'image/jpeg', 'data': processed[index]} for index in missing]
+            items = self._parse_response(await self._generate(parts, call, count=len(missing)), array=True)
             
-        except json.JSONDecodeError as e:
-            logger.error(f"Erro ao fazer parse do JSON: {e}")
-            logger.error(f"Resposta recebida: {response_text}")
-            return self._create_error_result("IA retornou formato inválido")
+            if len(items) != len(missing):
+                call.outcome = 'parse_error'
+                return self._create_error_result(f"IA retornou {len(items)} análise(s) para {len(missing)} imagem(ns)")
             
-        except Exception as e:
-            logger.error(f"Erro na análise: {e}")
-            return self._create_error_result(f"Erro na análise: {str(e)}")
+            for index, item in zip(missing, items):
+                results[index] = self._validate_result(item if isinstance(item, dict) else {})
+                call.confidences.append(results[index]['confianca'])
+                await self._remember(processed[index], results[index], use_cache)
+        
+        logger.info(f"✅ Lote analisado: {len(images)} comprovantes, {len(images) - len(missing)} do cache")
+        return {'comprovantes': results}
     
     def _validate_result(self, result: Dict[str, Any]) -> Dict[str, Any]:
         """Validar e normalizar resultado do Gemini"""
@@ -138,8 +226,7 @@ RESPONDA APENAS O JSON, SEM TEXTO ADICIONAL.
             result['estabelecimento'] = None
         
         # Validar categoria
-        categorias_validas = ['alimentacao', 'transporte', 'casa', 'saude', 'lazer', 'outros']
-        if result.get('categoria_sugerida') not in categorias_validas:
+        if result.get('categoria_sugerida') not in CATEGORIAS:
             logger.warning(f"Categoria inválida: {result.get('categoria_sugerida')}")
             result['categoria_sugerida'] = 'outros'
         
@@ -171,18 +258,6 @@ RESPONDA APENAS O JSON, SEM TEXTO ADICIONAL.
         
         return result
     
-    def _create_error_result(self, error_message: str) -> Dict[str, Any]:
-        """Criar resultado de erro padronizado"""
-        return {
-            'valor_total': None,
-            'estabelecimento': None,
-            'categoria_sugerida': 'outros',
-            'itens_principais': [],
-            'confianca': 0.0,
-            'observacoes': f"Erro: {error_message}",
-            'erro': True
-        }
-    
     def test_connection(self) -> bool:
         """Testar conexão com Gemini API"""
         try:
@@ -202,6 +277,3 @@ RESPONDA APENAS O JSON, SEM TEXTO ADICIONAL.
         except Exception as e:
             logger.error(f"❌ Erro ao testar Gemini API: {e}")
             return False
-
-# Instância global
-gemini_service = GeminiService()
\ No newline at end of file
@@ -0,0 +1,95 @@
+"""
+Pré-processamento de fotos de comprovantes (roda em pool de processos)
+"""
+
+import asyncio
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from typing import Any, Callable, Optional
+from PIL import Image, ImageFilter, ImageOps, ImageStat
+from decouple import config
+
+# Lado máximo enviado ao modelo e orçamento de bytes do upload
+MAX_SIDE = config('RECEIPT_MAX_SIDE', default=1024, cast=int)
+UPLOAD_BUDGET = config('RECEIPT_UPLOAD_BUDGET', default=200 * 1024, cast=int)
+
+# Processos do pool (0 = executar em thread, sem pool de processos)
+WORKERS = config('IMAGE_PREPROCESS_WORKERS', default=2, cast=int)
+
+# O pool nasce com o bot já rodando (threads do PTB, to_thread, drivers do banco):
+# fork copiaria locks presos por essas threads; forkserver parte de um processo limpo
+START_METHOD = config('IMAGE_PREPROCESS_START_METHOD', default='forkserver')
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+def _crop_to_document(image: Image.Image) -> Image.Image:
+    """Recortar a área clara do papel sobre fundo mais escuro (mantém a imagem se incerto)"""
+    small = image.reduce(4) if min(image.size) >= 64 else image
+    threshold = ImageStat.Stat(small).mean[0] + 10
+    mask = small.point(lambda p: 255 if p > threshold else 0).filter(ImageFilter.MedianFilter(5))
+    bbox = mask.getbbox()
+    if bbox is None:
+        return image
+    
+    scale_x = image.width / small.width
+    scale_y = image.height / small.height
+    left, top, right, bottom = bbox
+    area = (right - left) * (bottom - top) / (small.width * small.height)
+    
+    # Documento muito pequeno (ruído) ou ocupando tudo: não recortar
+    if area < 0.2 or area > 0.95:
+        return image
+    
+    margin = 8
+    return image.crop((
+        max(0, int(left * scale_x) - margin),
+        max(0, int(top * scale_y) - margin),
+        min(image.width, int(right * scale_x) + margin),
+        min(image.height, int(bottom * scale_y) + margin)
+    ))
+
+def preprocess_receipt(image_data: bytes, max_side: int = MAX_SIDE, budget: int = UPLOAD_BUDGET) -> bytes:
+    """Foto original → JPEG em tons de cinza, orientado, recortado e dentro do orçamento"""
+    image = Image.open(BytesIO(image_data))
+    
+    # JPEG: decodificar já reduzido (escala 1/2, 1/4, 1/8) em vez da resolução cheia
+    if image.format == 'JPEG':
+        image.draft('L', (max_side, max_side))
+    
+    image = ImageOps.exif_transpose(image).convert('L')
+    image = _crop_to_document(image)
+    image.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    
+    # Recomprimir baixando qualidade e, se preciso, o tamanho
+    while True:
+        for quality in (85, 75, 65, 55, 45):
+            buffer = BytesIO()
+            image.save(buffer, format='JPEG', quality=quality, optimize=True)
+            if buffer.tell() <= budget:
+                return buffer.getvalue()
+        
+        if max(image.size) <= 256:
+            return buffer.getvalue()
+        image = image.resize((int(image.width * 0.8), int(image.height * 0.8)), Image.Resampling.LANCZOS)
+
+async def run_in_pool(func: Callable[..., Any], *args) -> Any:
+    """Executar trabalho de CPU fora do event loop (pool de processos ou thread)"""
+    global _pool
+    if WORKERS <= 0:
+        return await asyncio.to_thread(func, *args)
+    
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context(START_METHOD))
+    return await asyncio.get_running_loop().run_in_executor(_pool, func, *args)
+
+async def preprocess_receipt_async(image_data: bytes) -> bytes:
+    """preprocess_receipt fora do event loop (pool de processos)"""
+    return await run_in_pool(preprocess_receipt, image_data)
+
+def shutdown_pool():
+    """Encerrar o pool de processos (desligamento do bot)"""
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(cancel_futures=True)
+        _pool = None
@@ -0,0 +1,180 @@
+"""
+Endpoint local de introspecção do bot (estados e caches do processo em execução)
+
+Protocolo: uma linha JSON de requisição, respostas em linhas JSON.
+    {"cmd": "stats"}                  estatísticas de estados e caches
+    {"cmd": "states"}                 todos os estados ativos
+    {"cmd": "user", "user_id": 123}   estado de um usuário
+    {"cmd": "clear", "user_id": 123}  limpar estado de um usuário
+    {"cmd": "watch", "user_id": 123}  eventos de alteração (user_id opcional)
+    {"cmd": "simulate", "user_id": 123, "category_id": 5, "amount": 10.0}
+                                      fluxo de despesa até CONFIRMING_EXPENSE (estado final)
+    {"cmd": "metrics"}                métricas das análises (user_id opcional: contadores por dia;
+                                      "format": "prometheus" devolve {"text": ...})
+"""
+
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, Optional
+from loguru import logger
+from decouple import config
+
+from utils.state_manager import state_manager as default_state_manager, ConversationRecord, ConversationState
+from utils.user_cache import user_cache
+from utils.category_cache import category_cache
+
+def state_event(user_id: int, record: Optional[ConversationRecord]) -> Dict[str, Any]:
+    """Evento de estado serializável"""
+    return {
+        'event': 'state',
+        'user_id': user_id,
+        'state': record.state.value if record is not None else None,
+        'data': dict(record) if record is not None else {},
+        'expires_at': record.expires_at if record is not None else None,
+        'at': time.time()
+    }
+
+def encode_line(message: Dict[str, Any]) -> bytes:
+    return json.dumps(message, ensure_ascii=False, default=str).encode('utf-8') + b'\n'
+
+def parse_address(address: str):
+    """'tcp:host:porta' ou caminho de Unix socket"""
+    if address.startswith('tcp:'):
+        host, port = address[4:].rsplit(':', 1)
+        return host, int(port)
+    return address
+
+class IntrospectionServer:
+    """Servidor local (Unix socket por padrão) com eventos de estado em push"""
+    
+    # Eventos acumulados por cliente lento antes de descartar
+    QUEUE_SIZE = 1000
+    
+    def __init__(self, address: str = None, manager=None):
+        self.address = address if address is not None else config(
+            'INTROSPECTION_ADDRESS', default='gedie_introspection.sock'
+        )
+        self.manager = manager or default_state_manager
+        self._server = None
+    
+    async def start(self):
+        """Abrir o endpoint (sem endereço configurado, não faz nada)"""
+        if not self.address:
+            return
+        
+        target = parse_address(self.address)
+        if isinstance(target, tuple):
+            self._server = await asyncio.start_server(self._handle_client, *target)
+        else:
+            if os.path.exists(target):
+                os.unlink(target)
+            self._server = await asyncio.start_unix_server(self._handle_client, path=target)
+            os.chmod(target, 0o600)
+        
+        logger.info(f"🔎 Introspecção disponível em {self.address}")
+    
+    async def stop(self):
+        """Fechar o endpoint"""
+        if self._server is None:
+            return
+        
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        if not isinstance(parse_address(self.address), tuple) and os.path.exists(self.address):
+            os.unlink(self.address)
+    
+    async def stats(self) -> Dict[str, Any]:
+        """Estatísticas de estados, caches e fila de análises"""
+        from services.receipt_provider import get_receipt_provider
+        from services.analysis_queue import analysis_queue
+        caches = [user_cache.stats(), category_cache.stats()]
+        provider = get_receipt_provider(create=False)   # não criar o provedor só para estatísticas
+        if provider is not None and provider.cache is not None:
+            caches.append(provider.cache.stats())
+        return {'states': await self.manager.stats_async(), 'caches': caches, 'analysis_queue': analysis_queue.stats()}
+    
+    async def _dispatch(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        cmd = request.get('cmd')
+        user_id = request.get('user_id')
+        
+        # Backends persistentes (SQLite/Redis) são lidos fora do event loop
+        if cmd == 'stats':
+            return await self.stats()
+        if cmd == 'states':
+            return {'states': [state_event(uid, record) for uid, record in await self.manager.records_async()]}
+        if cmd == 'user' and user_id is not None:
+            return state_event(int(user_id), await self.manager.get_record_async(int(user_id)))
+        if cmd == 'metrics':
+            from services.metrics_service import receipt_metrics
+            if request.get('format') == 'prometheus':
+                return {'text': receipt_metrics.prometheus()}
+            return receipt_metrics.snapshot(int(user_id) if user_id is not None else None)
+        if cmd == 'simulate' and user_id is not None:
+            return await self.simulate_expense_flow(int(user_id), int(request['category_id']),
+                                                    float(request['amount']))
+        if cmd == 'clear' and user_id is not None:
+            # Com o lock do usuário: não sobrescreve um update em andamento
+            await self.manager.clear_state_async(int(user_id))
+            return {'cleared': int(user_id)}
+        return {'error': f"comando inválido: {cmd}"}
+    
+    async def simulate_expense_flow(self, user_id: int, category_id: int, amount: float) -> Dict[str, Any]:
+        """Percorrer as transições do fluxo de despesa como um update do usuário"""
+        async with self.manager.update_scope(user_id):
+            self.manager.clear_state(user_id)
+            self.manager.transition(user_id, ConversationState.SELECTING_CATEGORY)
+            self.manager.select_category(user_id, category_id)
+            record = self.manager.set_amount(user_id, amount)
+        return state_event(user_id, record)
+    
+    async def _watch(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                     user_id: Optional[int]):
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        
+        def listener(changed_id, record):
+            if user_id is None or changed_id == user_id:
+                try:
+                    queue.put_nowait(state_event(changed_id, record))
+                except asyncio.QueueFull:
+                    pass
+        
+        self.manager.add_listener(listener)
+        # Cliente desconectou: leitura retorna EOF
+        disconnected = asyncio.ensure_future(reader.read())
+        try:
+            if user_id is not None:
+                writer.write(encode_line(state_event(user_id, await self.manager.get_record_async(user_id))))
+                await writer.drain()
+            
+            while True:
+                next_event = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait(
+                    {next_event, disconnected}, return_when=asyncio.FIRST_COMPLETED
+                )
+                if disconnected in done:
+                    next_event.cancel()
+                    break
+                writer.write(encode_line(next_event.result()))
+                await writer.drain()
+        finally:
+            disconnected.cancel()
+            self.manager.remove_listener(listener)
+    
+    async def _handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = json.loads(await reader.readline() or b'{}')
+            if request.get('cmd') == 'watch':
+                user_id = request.get('user_id')
+                await self._watch(reader, writer, int(user_id) if user_id is not None else None)
+            else:
+                writer.write(encode_line(await self._dispatch(request)))
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            logger.error(f"Erro na introspecção: {e}")
+        finally:
+            writer.close()
@@ -0,0 +1,240 @@
+"""
+Métricas das análises de comprovantes (latências, bytes, tokens e custo por usuário/dia)
+"""
+
+import asyncio
+import bisect
+import os
+import time
+from datetime import date
+from typing import Any, Dict, List, Optional, Tuple
+from decouple import config
+from loguru import logger
+
+# Dias mantidos nos contadores por usuário e arquivo de exportação (textfile do node_exporter)
+METRICS_DAYS = config('METRICS_DAYS', default=7, cast=int)
+METRICS_TEXTFILE = config('METRICS_TEXTFILE', default='')
+METRICS_INTERVAL = config('METRICS_INTERVAL', default=30, cast=float)
+
+SECONDS_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30)
+
+# nome: (limites dos buckets, descrição)
+HISTOGRAMS: Dict[str, Tuple[Tuple[float, ...], str]] = {
+    'download_seconds': (SECONDS_BUCKETS, 'Download da foto do Telegram'),
+    'preprocess_seconds': (SECONDS_BUCKETS, 'Pré-processamento das imagens'),
+    'model_seconds': (SECONDS_BUCKETS, 'Latência da chamada ao Gemini'),
+    'upload_bytes': ((25_000, 50_000, 100_000, 200_000, 400_000, 800_000, 1_600_000), 'Bytes de imagem enviados ao Gemini'),
+    'prompt_tokens': ((250, 500, 1000, 2000, 4000, 8000), 'Tokens de entrada por chamada'),
+    'response_tokens': ((25, 50, 100, 200, 400, 800), 'Tokens de saída por chamada'),
+    'confidence': ((0.2, 0.4, 0.6, 0.8, 0.9, 1.0), 'Confiança informada pelo modelo'),
+}
+
+class Histogram:
+    """Histograma de buckets fixos (cumulativo na exportação, como no Prometheus)"""
+    
+    __slots__ = ('bounds', 'counts', 'count', 'sum')
+    
+    def __init__(self, bounds: Tuple[float, ...]):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # último = acima do maior limite
+        self.count = 0
+        self.sum = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+    
+    def quantile(self, q: float) -> Optional[float]:
+        """Limite superior do bucket que contém o quantil q (aproximado)"""
+        if not self.count:
+            return None
+        target = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return float('inf')
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'count': self.count,
+            'avg': round(self.sum / self.count, 3) if self.count else None,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95)
+        }
+
+class AnalysisCall:
+    """Medições de uma análise (foto ou álbum), preenchidas ao longo da chamada"""
+    
+    __slots__ = ('user_id', 'images', 'cached', 'preprocess_seconds', 'upload_bytes', 'model_seconds',
+                 'prompt_tokens', 'response_tokens', 'outcome', 'confidences')
+    
+    def __init__(self, user_id: Optional[int] = None, images: int = 1):
+        self.user_id = user_id
+        self.images = images
+        self.cached = 0
+        self.preprocess_seconds: Optional[float] = None
+        self.upload_bytes = 0
+        self.model_seconds: Optional[float] = None
+        self.prompt_tokens: Optional[int] = None
+        self.response_tokens: Optional[int] = None
+        self.outcome = 'ok'
+        self.confidences: List[float] = []
+    
+    def usage(self, response):
+        """Tokens da resposta do Gemini (usage_metadata), se informados"""
+        usage = getattr(response, 'usage_metadata', None)
+        if usage is not None:
+            self.prompt_tokens = getattr(usage, 'prompt_token_count', None)
+            self.response_tokens = getattr(usage, 'candidates_token_count', None)
+
+class ReceiptMetrics:
+    """Agregados em memória das análises (consultados pelo endpoint de introspecção)"""
+    
+    def __init__(self, days: int = METRICS_DAYS):
+        self.days = days
+        self.histograms = {name: Histogram(bounds) for name, (bounds, _) in HISTOGRAMS.items()}
+        self.outcomes: Dict[str, int] = {}
+        self.images = 0
+        self.cached_images = 0
+        self.prompt_tokens = 0
+        self.response_tokens = 0
+        # {dia ISO: {user_id: contadores}}
+        self.daily: Dict[str, Dict[int, Dict[str, int]]] = {}
+    
+    def observe(self, name: str, value: float):
+        self.histograms[name].observe(value)
+    
+    def record(self, call: AnalysisCall):
+        """Agregar uma análise concluída"""
+        self.outcomes[call.outcome] = self.outcomes.get(call.outcome, 0) + 1
+        self.images += call.images
+        self.cached_images += call.cached
+        
+        if call.preprocess_seconds is not None:
+            self.observe('preprocess_seconds', call.preprocess_seconds)
+        if call.model_seconds is not None:
+            self.observe('model_seconds', call.model_seconds)
+            self.observe('upload_bytes', call.upload_bytes)
+        if call.prompt_tokens is not None:
+            self.observe('prompt_tokens', call.prompt_tokens)
+            self.prompt_tokens += call.prompt_tokens
+        if call.response_tokens is not None:
+            self.observe('response_tokens', call.response_tokens)
+            self.response_tokens += call.response_tokens
+        for confidence in call.confidences:
+            self.observe('confidence', confidence)
+        
+        if call.user_id is not None:
+            self._count_user(call)
+    
+    def _count_user(self, call: AnalysisCall):
+        today = date.today().isoformat()
+        if today not in self.daily:
+            self.daily[today] = {}
+            for old in sorted(self.daily)[:-self.days]:
+                del self.daily[old]
+        
+        counters = self.daily[today].setdefault(call.user_id, {
+            'calls': 0, 'images': 0, 'model_calls': 0, 'upload_bytes': 0,
+            'prompt_tokens': 0, 'response_tokens': 0
+        })
+        counters['calls'] += 1
+        counters['images'] += call.images
+        counters['model_calls'] += call.model_seconds is not None
+        counters['upload_bytes'] += call.upload_bytes
+        counters['prompt_tokens'] += call.prompt_tokens or 0
+        counters['response_tokens'] += call.response_tokens or 0
+    
+    def snapshot(self, user_id: Optional[int] = None) -> Dict[str, Any]:
+        """Resumo para o comando de debug (user_id: só os contadores desse usuário)"""
+        if user_id is not None:
+            return {
+                'user_id': user_id,
+                'days': {day: users[user_id] for day, users in sorted(self.daily.items()) if user_id in users}
+            }
+        
+        today = self.daily.get(date.today().isoformat(), {})
+        top = sorted(today.items(), key=lambda item: item[1]['prompt_tokens'], reverse=True)[:10]
+        return {
+            'outcomes': dict(self.outcomes),
+            'images': self.images,
+            'cached_images': self.cached_images,
+            'tokens': {'prompt': self.prompt_tokens, 'response': self.response_tokens},
+            'histograms': {name: histogram.to_dict() for name, histogram in self.histograms.items()},
+            'today_top_users': [{'user_id': uid, **counters} for uid, counters in top]
+        }
+    
+    def prometheus(self) -> str:
+        """Exportação no formato texto do Prometheus (sem rótulo de usuário: cardinalidade)"""
+        lines = []
+        for name, histogram in self.histograms.items():
+            metric = f"gedie_receipt_{name}"
+            lines.append(f"# HELP {metric} {HISTOGRAMS[name][1]}")
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(histogram.bounds, histogram.counts):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric}_sum {histogram.sum}")
+            lines.append(f"{metric}_count {histogram.count}")
+        
+        lines.append("# HELP gedie_receipt_analyses_total Análises por resultado")
+        lines.append("# TYPE gedie_receipt_analyses_total counter")
+        for outcome, count in sorted(self.outcomes.items()):
+            lines.append(f'gedie_receipt_analyses_total{{outcome="{outcome}"}} {count}')
+        
+        lines.append("# HELP gedie_receipt_images_total Imagens analisadas (cached: vindas do cache)")
+        lines.append("# TYPE gedie_receipt_images_total counter")
+        lines.append(f'gedie_receipt_images_total{{source="all"}} {self.images}')
+        lines.append(f'gedie_receipt_images_total{{source="cached"}} {self.cached_images}')
+        
+        lines.append("# HELP gedie_receipt_tokens_total Tokens gastos no Gemini")
+        lines.append("# TYPE gedie_receipt_tokens_total counter")
+        lines.append(f'gedie_receipt_tokens_total{{kind="prompt"}} {self.prompt_tokens}')
+        lines.append(f'gedie_receipt_tokens_total{{kind="response"}} {self.response_tokens}')
+        return "\n".join(lines) + "\n"
+    
+    def write_textfile(self, path: str, text: str = None):
+        """Gravar a exportação de forma atômica (textfile collector do node_exporter)"""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text if text is not None else self.prometheus())
+        os.replace(tmp_path, path)
+    
+    async def run(self, path: str = METRICS_TEXTFILE, interval: float = METRICS_INTERVAL):
+        """Exportar periodicamente para METRICS_TEXTFILE (vazio: não exporta)"""
+        if not path:
+            return
+        logger.info(f"📈 Métricas exportadas em {path} a cada {interval:.0f}s")
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                # Texto gerado no event loop (onde as métricas mudam); só a escrita vai para thread
+                await asyncio.to_thread(self.write_textfile, path, self.prometheus())
+            except Exception as e:
+                logger.warning(f"Falha ao exportar métricas: {e}")
+
+class Timer:
+    """Cronômetro de bloco: `with Timer() as timer: ...` e depois timer.elapsed()"""
+    
+    __slots__ = ('started', 'stopped')
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        self.stopped = None
+        return self
+    
+    def __exit__(self, *exc):
+        self.stopped = time.perf_counter()
+        return False
+    
+    def elapsed(self) -> float:
+        """Segundos desde o início (até o fim do bloco, se já terminou)"""
+        return (self.stopped or time.perf_counter()) - self.started
+
+# Instância global
+receipt_metrics = ReceiptMetrics()
@@ -0,0 +1,137 @@
+"""
+Leitura local do QR Code de NFC-e / CF-e SAT (atalho que dispensa a IA)
+"""
+
+import importlib.util
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit, parse_qs
+from decouple import config
+from loguru import logger
+
+from services.image_preprocessing import run_in_pool
+
+# Atalho ativo só com OpenCV instalado (opencv-python-headless)
+QR_FAST_PATH = config('NFCE_QR_FAST_PATH', default=True, cast=bool)
+QR_AVAILABLE = importlib.util.find_spec('cv2') is not None
+
+# Lado máximo para a segunda tentativa de leitura (QR pequeno em foto grande)
+QR_RETRY_SIDE = 1600
+
+MODELS = {'55': 'NF-e', '59': 'CF-e SAT', '65': 'NFC-e'}
+
+def decode_qr(image_data: bytes) -> Optional[str]:
+    """Conteúdo do QR Code da foto, se houver (roda no pool de processos)"""
+    import cv2
+    import numpy as np
+    
+    image = cv2.imdecode(np.frombuffer(image_data, np.uint8), cv2.IMREAD_GRAYSCALE)
+    if image is None:
+        return None
+    
+    detector = cv2.QRCodeDetector()
+    text, _, _ = detector.detectAndDecode(image)
+    
+    if not text and max(image.shape) > QR_RETRY_SIDE:
+        scale = QR_RETRY_SIDE / max(image.shape)
+        small = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        text, _, _ = detector.detectAndDecode(small)
+    
+    return text or None
+
+def valid_access_key(key: str) -> bool:
+    """Chave de acesso de 44 dígitos com dígito verificador (módulo 11)"""
+    if len(key) != 44 or not key.isdigit():
+        return False
+    
+    total = sum(int(digit) * (2 + i % 8) for i, digit in enumerate(reversed(key[:43])))
+    check = 11 - total % 11
+    return int(key[43]) == (0 if check >= 10 else check)
+
+def _parse_amount(value: str) -> Optional[float]:
+    try:
+        amount = float(value.replace(',', '.'))
+    except (AttributeError, ValueError):
+        return None
+    return amount if amount > 0 else None
+
+def parse_receipt_qr(text: str) -> Optional[Dict[str, Any]]:
+    """Chave, modelo e valor total do conteúdo do QR (None se não for documento fiscal)
+    
+    Formatos: NFC-e v1 (chNFe=...&vNF=...), NFC-e v2 (p=chave|2|...; valor só na
+    emissão em contingência) e CF-e SAT (chave|data|valor|...).
+    """
+    text = text.strip()
+    query = parse_qs(urlsplit(text).query)
+    amount = None
+    
+    if 'chNFe' in query:
+        key = query['chNFe'][0]
+        amount = _parse_amount(query.get('vNF', [''])[0])
+    elif 'p' in query:
+        fields = query['p'][0].split('|')
+        key = fields[0]
+        # Online: chave|versão|ambiente|token|hash; contingência: chave|versão|ambiente|dia|vNF|digVal|token|hash
+        if len(fields) >= 8:
+            amount = _parse_amount(fields[4])
+    elif '|' in text:
+        fields = text.split('|')
+        key = fields[0]
+        if len(fields) >= 3:
+            amount = _parse_amount(fields[2])
+    else:
+        return None
+    
+    key = key.replace(' ', '')
+    if not valid_access_key(key):
+        return None
+    
+    return {
+        'chave': key,
+        'cnpj': key[6:20],
+        'modelo': MODELS.get(key[20:22], 'Documento fiscal'),
+        'valor_total': amount
+    }
+
+def _format_cnpj(cnpj: str) -> str:
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+
+def qr_analysis_result(info: Dict[str, Any]) -> Dict[str, Any]:
+    """Resultado no mesmo formato da análise do Gemini"""
+    return {
+        'valor_total': info['valor_total'],
+        'estabelecimento': f"CNPJ {_format_cnpj(info['cnpj'])}",
+        'categoria_sugerida': 'outros',
+        'itens_principais': [],
+        'confianca': 1.0,
+        'observacoes': f"Lido do QR Code da {info['modelo']} (chave {info['chave']})",
+        'origem': 'qrcode'
+    }
+
+async def read_receipt_qr(image_data: bytes) -> Optional[Dict[str, Any]]:
+    """Tentar ler o comprovante pelo QR Code (None = seguir para a IA)"""
+    if not (QR_FAST_PATH and QR_AVAILABLE):
+        return None
+    
+    try:
+        text = await run_in_pool(decode_qr, image_data)
+    except Exception as e:
+        logger.warning(f"Falha ao ler QR Code: {e}")
+        return None
+    
+    if not text:
+        return None
+    
+    info = parse_receipt_qr(text)
+    if info is None:
+        logger.info("QR Code lido, mas não é de documento fiscal")
+        return None
+    
+    if info['valor_total'] is None:
+        logger.info(f"QR Code da {info['modelo']} sem valor total: seguindo para a IA")
+        return None
+    
+    logger.info(f"⚡ Comprovante lido pelo QR Code: valor={info['valor_total']}, chave={info['chave']}")
+    return qr_analysis_result(info)
+
+if QR_FAST_PATH and not QR_AVAILABLE:
+    logger.info("Leitura de QR Code desativada (instale opencv-python-headless)")
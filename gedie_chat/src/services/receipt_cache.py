@@ -0,0 +1,157 @@
+"""
+Cache em disco dos resultados de análise de comprovantes (endereçado por conteúdo)
+"""
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from io import BytesIO
+from typing import Any, Dict, Optional
+from PIL import Image
+from decouple import config
+from loguru import logger
+
+_UINT64 = 1 << 64
+
+def content_hash(image_data: bytes) -> str:
+    """SHA-256 da imagem já normalizada pelo pré-processamento (determinístico)"""
+    return hashlib.sha256(image_data).hexdigest()
+
+def perceptual_hash(image_data: bytes) -> int:
+    """dHash de 64 bits: gradiente horizontal de uma miniatura 9x8 em tons de cinza"""
+    small = Image.open(BytesIO(image_data)).convert('L').resize((9, 8), Image.Resampling.BILINEAR)
+    pixels = small.tobytes()
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+def _to_signed(value: int) -> int:
+    return value - _UINT64 if value >= _UINT64 // 2 else value
+
+class ReceiptCache:
+    """Resultados por hash do conteúdo, em SQLite, limitado (LRU por último uso)
+    
+    Com near_duplicates=True, imagens com dHash a até `max_distance` bits
+    de uma já analisada também contam como acerto.
+    """
+    
+    def __init__(self, path: str, max_entries: int = 5000, near_duplicates: bool = False,
+                 max_distance: int = 4):
+        self.path = path
+        self.max_entries = max_entries
+        self.near_duplicates = near_duplicates
+        self.max_distance = max_distance
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS receipt_results ("
+            "content_hash TEXT PRIMARY KEY, phash INTEGER NOT NULL, result TEXT NOT NULL, "
+            "created_at REAL NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_receipt_results_last_used ON receipt_results (last_used)"
+        )
+        self._conn.commit()
+    
+    def _find_near(self, phash: int) -> Optional[str]:
+        best = None
+        for key, other in self._conn.execute("SELECT content_hash, phash FROM receipt_results"):
+            distance = bin((phash ^ other) % _UINT64).count('1')
+            if distance <= self.max_distance and (best is None or distance < best[0]):
+                best = (distance, key)
+        return best[1] if best else None
+    
+    def get(self, image_data: bytes) -> Optional[Dict[str, Any]]:
+        """Resultado já conhecido para a imagem (None se não houver)"""
+        key = content_hash(image_data)
+        phash = _to_signed(perceptual_hash(image_data)) if self.near_duplicates else None
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT result FROM receipt_results WHERE content_hash = ?", (key,)
+            ).fetchone()
+            near = False
+            
+            if row is None and self.near_duplicates:
+                near_key = self._find_near(phash)
+                if near_key is not None:
+                    key, near = near_key, True
+                    row = self._conn.execute(
+                        "SELECT result FROM receipt_results WHERE content_hash = ?", (key,)
+                    ).fetchone()
+            
+            if row is None:
+                self.misses += 1
+                return None
+            
+            self._conn.execute(
+                "UPDATE receipt_results SET last_used = ? WHERE content_hash = ?", (time.time(), key)
+            )
+        
+        if near:
+            self.near_hits += 1
+        else:
+            self.hits += 1
+        return json.loads(row[0])
+    
+    def set(self, image_data: bytes, result: Dict[str, Any]):
+        """Guardar resultado, removendo os menos usados acima do limite"""
+        now = time.time()
+        row = (content_hash(image_data), _to_signed(perceptual_hash(image_data)),
+               json.dumps(result, ensure_ascii=False), now, now)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO receipt_results (content_hash, phash, result, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?)",
+                row
+            )
+            self._conn.execute(
+                "DELETE FROM receipt_results WHERE content_hash IN ("
+                "SELECT content_hash FROM receipt_results ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,)
+            )
+    
+    def clear(self):
+        """Remover todos os resultados e zerar contadores"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM receipt_results")
+        self.hits = self.near_hits = self.misses = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Estatísticas do cache"""
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM receipt_results").fetchone()[0]
+        total = self.hits + self.near_hits + self.misses
+        return {
+            'name': 'receipts',
+            'size': size,
+            'max_size': self.max_entries,
+            'hits': self.hits,
+            'near_hits': self.near_hits,
+            'misses': self.misses,
+            'hit_rate': (self.hits + self.near_hits) / total if total else 0.0
+        }
+
+def create_receipt_cache() -> Optional[ReceiptCache]:
+    """Cache configurado no .env (None se RECEIPT_CACHE_PATH vazio)"""
+    path = config('RECEIPT_CACHE_PATH', default='receipt_cache.db')
+    if not path:
+        return None
+    
+    logger.info(f"🧾 Cache de análises de comprovantes em {path}")
+    return ReceiptCache(
+        path,
+        max_entries=config('RECEIPT_CACHE_SIZE', default=5000, cast=int),
+        near_duplicates=config('RECEIPT_CACHE_NEAR_DUPLICATES', default=False, cast=bool),
+        max_distance=config('RECEIPT_CACHE_MAX_DISTANCE', default=4, cast=int)
+    )
@@ -0,0 +1,185 @@
+"""
+Provedores de análise de comprovantes (Gemini ou fake local), criados no primeiro uso
+"""
+
+import asyncio
+from abc import ABC, abstractmethod
+import hashlib
+import json
+from typing import Any, Dict, List, Optional, Tuple
+from decouple import config
+from loguru import logger
+
+from services.image_preprocessing import preprocess_receipt_async
+from services.metrics_service import receipt_metrics, AnalysisCall, Timer
+
+CATEGORIAS = ['alimentacao', 'transporte', 'casa', 'saude', 'lazer', 'outros']
+
+class ReceiptProvider(ABC):
+    """Interface dos provedores de análise
+    
+    analyze_receipt devolve uma análise (dict no formato do prompt do Gemini);
+    analyze_receipts devolve {'comprovantes': [análise por imagem]}. Falhas
+    viram resultado com 'erro' (e 'transitorio' quando vale tentar de novo).
+    """
+    
+    name = 'base'
+    
+    # Cache de resultados por imagem (None = sem cache)
+    cache = None
+    
+    # Exceções do provedor que valem nova tentativa (resultado com 'transitorio')
+    transient_errors: Tuple[type, ...] = ()
+    
+    @abstractmethod
+    async def analyze_receipt(self, image_data: bytes, use_cache: bool = True,
+                              user_id: Optional[int] = None) -> Dict[str, Any]:
+        """Análise de uma imagem"""
+    
+    @abstractmethod
+    async def analyze_receipts(self, images: List[bytes], use_cache: bool = True,
+                               user_id: Optional[int] = None) -> Dict[str, Any]:
+        """Análise de um álbum: {'comprovantes': [análise por imagem]}"""
+    
+    async def _guarded(self, analysis, call: AnalysisCall) -> Dict[str, Any]:
+        """Executar análise convertendo falhas em resultado de erro (e registrar as métricas)
+        
+        Todo provedor passa por aqui: analyze_receipt(s) sempre devolve um dict.
+        """
+        try:
+            return await analysis
+            
+        except asyncio.TimeoutError:
+            call.outcome = 'timeout'
+            logger.warning(f"Provedor {self.name} não respondeu a tempo")
+            return self._create_error_result("A IA demorou demais para responder", transient=True)
+            
+        except self.transient_errors as e:
+            call.outcome = 'transient_error'
+            logger.warning(f"Provedor {self.name} indisponível no momento: {e}")
+            return self._create_error_result("A IA está sobrecarregada no momento", transient=True)
+            
+        except ValueError as e:
+            call.outcome = 'parse_error'
+            logger.error(f"Resposta fora do schema: {e}")
+            return self._create_error_result("IA retornou formato inválido")
+            
+        except asyncio.CancelledError:
+            call.outcome = 'cancelled'
+            raise
+            
+        except Exception as e:
+            call.outcome = 'error'
+            logger.error(f"Erro na análise: {e}")
+            return self._create_error_result(f"Erro na análise: {str(e)}")
+            
+        finally:
+            receipt_metrics.record(call)
+    
+    def _create_error_result(self, error_message: str, transient: bool = False) -> Dict[str, Any]:
+        """Criar resultado de erro padronizado (transitorio=True: pode tentar de novo)"""
+        return {
+            'valor_total': None,
+            'estabelecimento': None,
+            'categoria_sugerida': 'outros',
+            'itens_principais': [],
+            'confianca': 0.0,
+            'observacoes': f"Erro: {error_message}",
+            'erro': True,
+            'transitorio': transient
+        }
+
+class FakeReceiptProvider(ReceiptProvider):
+    """Provedor local determinístico, sem rede (testes de carga e desenvolvimento)
+    
+    Passa pelo mesmo pré-processamento do Gemini e espera `latency` segundos
+    por chamada; o resultado depende só do conteúdo da imagem, com os campos
+    de `result` sobrepostos (FAKE_RECEIPT_RESULT, JSON).
+    """
+    
+    name = 'fake'
+    
+    ESTABELECIMENTOS = ['Mercado Fake', 'Posto Fake', 'Farmácia Fake', 'Padaria Fake', 'Cinema Fake']
+    
+    def __init__(self, latency: float = None, result: Dict[str, Any] = None, max_concurrency: int = None):
+        self.latency = latency if latency is not None else config('FAKE_RECEIPT_LATENCY', default=0.5, cast=float)
+        self.result = result if result is not None else json.loads(config('FAKE_RECEIPT_RESULT', default='{}'))
+        # Mesmo limite do Gemini: a vazão medida reflete o gargalo real
+        self._semaphore = asyncio.Semaphore(
+            max_concurrency or config('GEMINI_MAX_CONCURRENCY', default=4, cast=int)
+        )
+    
+    def fake_result(self, image: bytes) -> Dict[str, Any]:
+        """Análise estável para a mesma imagem"""
+        seed = int.from_bytes(hashlib.sha256(image).digest()[:8], 'big')
+        result = {
+            'valor_total': round(5 + seed % 20000 / 100, 2),
+            'estabelecimento': self.ESTABELECIMENTOS[seed % len(self.ESTABELECIMENTOS)],
+            'categoria_sugerida': CATEGORIAS[seed % len(CATEGORIAS)],
+            'itens_principais': [],
+            'confianca': 0.9,
+            'observacoes': 'Resultado do provedor fake'
+        }
+        result.update(self.result)
+        return result
+    
+    async def _analyze(self, images: List[bytes], call: AnalysisCall) -> List[Dict[str, Any]]:
+        with Timer() as timer:
+            processed = await asyncio.gather(*(preprocess_receipt_async(image) for image in images))
+        call.preprocess_seconds = timer.elapsed()
+        call.upload_bytes = sum(len(image) for image in processed)
+        
+        async with self._semaphore:
+            with Timer() as timer:
+                await asyncio.sleep(self.latency)
+        call.model_seconds = timer.elapsed()
+        
+        results = [self.fake_result(image) for image in processed]
+        call.confidences = [result['confianca'] for result in results]
+        return results
+    
+    async def _analyze_one(self, image_data: bytes, call: AnalysisCall) -> Dict[str, Any]:
+        return (await self._analyze([image_data], call))[0]
+    
+    async def _analyze_batch(self, images: List[bytes], call: AnalysisCall) -> Dict[str, Any]:
+        return {'comprovantes': await self._analyze(images, call)}
+    
+    async def analyze_receipt(self, image_data: bytes, use_cache: bool = True,
+                              user_id: Optional[int] = None) -> Dict[str, Any]:
+        call = AnalysisCall(user_id)
+        return await self._guarded(self._analyze_one(image_data, call), call)
+    
+    async def analyze_receipts(self, images: List[bytes], use_cache: bool = True,
+                               user_id: Optional[int] = None) -> Dict[str, Any]:
+        call = AnalysisCall(user_id, images=len(images))
+        return await self._guarded(self._analyze_batch(images, call), call)
+
+_provider: Optional[ReceiptProvider] = None
+
+def create_receipt_provider(kind: str = None) -> ReceiptProvider:
+    """Provedor configurado em RECEIPT_PROVIDER (gemini ou fake)"""
+    kind = (kind or config('RECEIPT_PROVIDER', default='gemini')).lower()
+    
+    if kind == 'fake':
+        provider = FakeReceiptProvider()
+        logger.info(f"🧪 Análise de comprovantes com provedor fake (latência {provider.latency:.2f}s)")
+        return provider
+    
+    if kind != 'gemini':
+        logger.warning(f"RECEIPT_PROVIDER desconhecido: {kind}; usando gemini")
+    
+    # Importado só aqui: SDK do Google e GEMINI_API_KEY apenas quando usados
+    from services.gemini_service import GeminiService
+    return GeminiService()
+
+def get_receipt_provider(create: bool = True) -> Optional[ReceiptProvider]:
+    """Provedor do processo, criado no primeiro uso (create=False: None se ainda não existe)"""
+    global _provider
+    if _provider is None and create:
+        _provider = create_receipt_provider()
+    return _provider
+
+def set_receipt_provider(provider: Optional[ReceiptProvider]):
+    """Trocar o provedor do processo (testes; None volta ao configurado)"""
+    global _provider
+    _provider = provider
@@ -0,0 +1,119 @@
+"""
+Snapshot dos estados da conversa entre restarts do bot
+"""
+
+import asyncio
+import json
+import os
+import struct
+import time
+import zlib
+from typing import Optional, Tuple
+from loguru import logger
+from decouple import config
+
+from utils.state_manager import state_manager as default_state_manager, ConversationRecord
+
+# Cabeçalho: assinatura, versão do formato, momento da escrita (epoch)
+_HEADER = struct.Struct('>4sBd')
+_MAGIC = b'GDST'
+_VERSION = 1
+
+def encode_snapshot(records, written_at: float) -> bytes:
+    """Registros (user_id, ConversationRecord) → bytes comprimidos"""
+    rows = [
+        [user_id, record.state.value, record.expires_at, dict(record)]
+        for user_id, record in records
+    ]
+    body = json.dumps(rows, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+    return _HEADER.pack(_MAGIC, _VERSION, written_at) + zlib.compress(body)
+
+def decode_snapshot(payload: bytes):
+    """Bytes → (written_at, [(user_id, ConversationRecord)])"""
+    magic, version, written_at = _HEADER.unpack_from(payload)
+    if magic != _MAGIC or version != _VERSION:
+        raise ValueError(f"Snapshot em formato desconhecido ({magic!r} v{version})")
+    
+    rows = json.loads(zlib.decompress(payload[_HEADER.size:]))
+    return written_at, [
+        (user_id, ConversationRecord.from_dict({'state': state, 'data': data, 'expires_at': expires_at}))
+        for user_id, state, expires_at, data in rows
+    ]
+
+class StateSnapshotService:
+    """Grava os estados em memória periodicamente e no desligamento; restaura no início
+    
+    Só atua com backend em memória (SQLite/Redis já sobrevivem a restarts).
+    """
+    
+    def __init__(self, path: str = None, interval: float = None, manager=None):
+        self.path = path or config('STATE_SNAPSHOT_PATH', default='state_snapshot.bin')
+        self.interval = interval or config('STATE_SNAPSHOT_INTERVAL', default=60, cast=float)
+        self.manager = manager or default_state_manager
+    
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) and not self.manager.backend.persistent
+    
+    def encode(self) -> Tuple[bytes, int]:
+        """Snapshot em bytes e quantos estados contém
+        
+        Roda no event loop: o backend em memória não é thread-safe (items()
+        também expira registros e reconstrói o heap de prazos).
+        """
+        records = list(self.manager.backend.items())
+        return encode_snapshot(records, time.time()), len(records)
+    
+    def write_file(self, payload: bytes):
+        """Gravar bytes já prontos de forma atômica (pode rodar em thread)"""
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+    
+    def write(self) -> int:
+        """Gravar snapshot (escrita atômica); retorna quantos estados foram salvos"""
+        payload, count = self.encode()
+        self.write_file(payload)
+        logger.debug(f"💾 Snapshot de {count} estado(s) ({len(payload)} bytes)")
+        return count
+    
+    def restore(self) -> Optional[int]:
+        """Restaurar estados não vencidos do último snapshot; retorna quantos voltaram"""
+        if not os.path.exists(self.path):
+            return None
+        
+        try:
+            with open(self.path, 'rb') as f:
+                written_at, records = decode_snapshot(f.read())
+        except (OSError, ValueError, struct.error, zlib.error) as e:
+            logger.error(f"Snapshot de estados ignorado: {e}")
+            return None
+        
+        now = time.time()
+        live = {
+            user_id: record for user_id, record in records
+            if record.expires_at is None or record.expires_at > now
+        }
+        self.manager.backend.save_many(live)
+        
+        logger.info(
+            f"♻️ {len(live)} estado(s) restaurado(s) do snapshot de "
+            f"{now - written_at:.0f}s atrás ({len(records) - len(live)} vencido(s))"
+        )
+        return len(live)
+    
+    async def run(self):
+        """Loop de snapshot em background"""
+        logger.info(f"💾 Snapshot de estados a cada {self.interval:.0f}s em {self.path}")
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                # Estados lidos e comprimidos no event loop; só a escrita do arquivo vai para thread
+                payload, count = self.encode()
+                await asyncio.to_thread(self.write_file, payload)
+                logger.debug(f"💾 Snapshot de {count} estado(s) ({len(payload)} bytes)")
+            except Exception as e:
+                logger.error(f"Erro ao gravar snapshot de estados: {e}")
@@ -0,0 +1,22 @@
+"""
+Cache em memória das categorias ativas de cada usuário
+"""
+
+from typing import Any, NamedTuple
+from decouple import config
+from utils.ttl_cache import TTLCache
+
+class CachedCategory(NamedTuple):
+    """Registro imutável de categoria (compartilhado entre handlers)"""
+    id: int
+    nome: str
+    icone: str
+    cor: str
+    tipo: Any
+
+# Instância global do cache {user_id interno: tuple[CachedCategory, ...]}
+category_cache = TTLCache(
+    'categories',
+    max_size=config('CATEGORY_CACHE_SIZE', default=10000, cast=int),
+    ttl=config('CATEGORY_CACHE_TTL', default=600, cast=float)
+)
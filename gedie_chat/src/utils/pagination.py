@@ -0,0 +1,45 @@
+"""
+Cursores de paginação keyset para listagens de gastos
+"""
+
+from datetime import date, datetime, timedelta
+from typing import NamedTuple, Optional
+from loguru import logger
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+class ExpenseCursor(NamedTuple):
+    """Posição na ordenação (data_gasto, created_at, id)"""
+    data_gasto: date
+    created_at: datetime
+    id: int
+
+def _to_base36(value: int) -> str:
+    digits = "0123456789abcdefghijklmnopqrstuvwxyz"
+    result = ""
+    while True:
+        value, rest = divmod(value, 36)
+        result = digits[rest] + result
+        if not value:
+            return result
+
+def encode_expense_cursor(row) -> str:
+    """Cursor compacto (cabe no limite de 64 bytes do callback_data)"""
+    created_us = (row.created_at - _EPOCH) // _MICROSECOND
+    return ".".join(
+        _to_base36(value) for value in (row.data_gasto.toordinal(), created_us, row.id)
+    )
+
+def decode_expense_cursor(cursor: str) -> Optional[ExpenseCursor]:
+    """Decodificar cursor vindo do callback (None se inválido)"""
+    try:
+        ordinal, created_us, expense_id = (int(part, 36) for part in cursor.split("."))
+        return ExpenseCursor(
+            date.fromordinal(ordinal),
+            _EPOCH + created_us * _MICROSECOND,
+            expense_id
+        )
+    except (ValueError, OverflowError) as e:
+        logger.warning(f"Cursor inválido '{cursor}': {e}")
+        return None
@@ -0,0 +1,292 @@
+"""
+Backends de armazenamento dos estados da conversa
+"""
+
+import heapq
+from abc import ABC, abstractmethod
+import json
+import math
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+from decouple import config
+from loguru import logger
+
+# Registro de estado: utils.state_manager.ConversationRecord
+StateRecord = Any
+
+def encode_record(record: StateRecord) -> str:
+    """Serializar registro para backends persistentes"""
+    return json.dumps(record.to_dict(), ensure_ascii=False, default=str)
+
+def decode_record(payload) -> StateRecord:
+    """Desserializar registro salvo por encode_record"""
+    from utils.state_manager import ConversationRecord
+    return ConversationRecord.from_dict(json.loads(payload))
+
+class StateBackend(ABC):
+    """Interface dos backends de estado
+    
+    Operações em lote: cada chamada é no máximo uma ida ao armazenamento.
+    Registro None em save_many remove o estado do usuário.
+    """
+    
+    # Se True, o StateManager executa as operações fora do event loop
+    blocking = True
+    
+    # Se True, os estados sobrevivem a um restart sem snapshot
+    persistent = True
+    
+    @abstractmethod
+    def load_many(self, user_ids: Iterable[int]) -> Dict[int, Optional[StateRecord]]:
+        """Registros dos usuários (sem estado ou vencido = None)"""
+    
+    @abstractmethod
+    def save_many(self, records: Dict[int, Optional[StateRecord]]):
+        """Gravar registros (None remove o estado)"""
+    
+    @abstractmethod
+    def items(self) -> Iterator[Tuple[int, StateRecord]]:
+        """Estados ativos como pares (user_id, registro)"""
+    
+    def stats(self) -> Dict[str, Any]:
+        return {'backend': type(self).__name__}
+    
+    def load(self, user_id: int) -> Optional[StateRecord]:
+        return self.load_many([user_id]).get(user_id)
+    
+    def save(self, user_id: int, record: Optional[StateRecord]):
+        self.save_many({user_id: record})
+
+class MemoryStateBackend(StateBackend):
+    """Estados em dicionário do processo, limitado (LRU) e com expiração
+    
+    Expiração por heap de prazos: cada operação remove só o que venceu,
+    sem varrer todos os estados.
+    """
+    
+    blocking = False
+    persistent = False
+    
+    def __init__(self, max_entries: int = 50000):
+        self.max_entries = max_entries
+        self._records: "OrderedDict[int, StateRecord]" = OrderedDict()
+        # (expira_em, user_id); entradas antigas do mesmo usuário são ignoradas ao sair
+        self._deadlines: list = []
+        self.expired = 0
+        self.evicted = 0
+    
+    def _expire(self, now: float):
+        deadlines = self._deadlines
+        while deadlines and deadlines[0][0] <= now:
+            expires_at, user_id = heapq.heappop(deadlines)
+            record = self._records.get(user_id)
+            if record is not None and record.expires_at == expires_at:
+                del self._records[user_id]
+                self.expired += 1
+        
+        # Muitas entradas obsoletas (usuários que mudaram de estado): reconstruir
+        if len(deadlines) > 2 * len(self._records) + 1024:
+            self._deadlines = [
+                (record.expires_at, user_id)
+                for user_id, record in self._records.items()
+                if record.expires_at is not None
+            ]
+            heapq.heapify(self._deadlines)
+    
+    def load_many(self, user_ids):
+        self._expire(time.time())
+        result = {}
+        for user_id in user_ids:
+            record = self._records.get(user_id)
+            if record is not None:
+                self._records.move_to_end(user_id)
+            result[user_id] = record
+        return result
+    
+    def save_many(self, records):
+        for user_id, record in records.items():
+            if record is None:
+                self._records.pop(user_id, None)
+                continue
+            
+            self._records[user_id] = record
+            self._records.move_to_end(user_id)
+            if record.expires_at is not None:
+                heapq.heappush(self._deadlines, (record.expires_at, user_id))
+        
+        self._expire(time.time())
+        while len(self._records) > self.max_entries:
+            self._records.popitem(last=False)
+            self.evicted += 1
+    
+    def items(self):
+        self._expire(time.time())
+        return iter(list(self._records.items()))
+    
+    def stats(self):
+        return {
+            'backend': type(self).__name__,
+            'size': len(self._records),
+            'max_entries': self.max_entries,
+            'expired': self.expired,
+            'evicted': self.evicted
+        }
+
+class SQLiteStateBackend(StateBackend):
+    """Estados em arquivo SQLite (sobrevive a restart, compartilhado entre processos)"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversation_states ("
+            "user_id INTEGER PRIMARY KEY, payload TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(conversation_states)")}
+        if 'expires_at' not in columns:
+            self._conn.execute("ALTER TABLE conversation_states ADD COLUMN expires_at REAL")
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_conversation_states_expires ON conversation_states (expires_at)"
+        )
+        self._conn.commit()
+        self.expired = 0
+    
+    def load_many(self, user_ids):
+        user_ids = list(user_ids)
+        result = dict.fromkeys(user_ids)
+        if not user_ids:
+            return result
+        
+        placeholders = ",".join("?" * len(user_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT user_id, payload FROM conversation_states WHERE user_id IN ({placeholders}) "
+                f"AND (expires_at IS NULL OR expires_at > ?)",
+                [*user_ids, time.time()]
+            ).fetchall()
+        
+        for user_id, payload in rows:
+            result[user_id] = decode_record(payload)
+        return result
+    
+    def save_many(self, records):
+        now = time.time()
+        upserts = [
+            (user_id, encode_record(record), now, record.expires_at)
+            for user_id, record in records.items() if record is not None
+        ]
+        deletes = [(user_id,) for user_id, record in records.items() if record is None]
+        
+        with self._lock, self._conn:
+            if upserts:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO conversation_states (user_id, payload, updated_at, expires_at) "
+                    "VALUES (?, ?, ?, ?)",
+                    upserts
+                )
+            if deletes:
+                self._conn.executemany("DELETE FROM conversation_states WHERE user_id = ?", deletes)
+            # Vencidos saem pelo índice de expires_at, sem varrer a tabela
+            self.expired += self._conn.execute(
+                "DELETE FROM conversation_states WHERE expires_at <= ?", (now,)
+            ).rowcount
+    
+    def items(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT user_id, payload FROM conversation_states WHERE expires_at IS NULL OR expires_at > ?",
+                (time.time(),)
+            ).fetchall()
+        return ((user_id, decode_record(payload)) for user_id, payload in rows)
+    
+    def stats(self):
+        with self._lock:
+            size = self._conn.execute("SELECT COUNT(*) FROM conversation_states").fetchone()[0]
+        return {'backend': type(self).__name__, 'size': size, 'expired': self.expired}
+    
+    def close(self):
+        self._conn.close()
+
+class RedisStateBackend(StateBackend):
+    """Estados em servidor compatível com o protocolo Redis
+    
+    Recebe um cliente no estilo redis-py (mget, pipeline, scan_iter).
+    A expiração de cada registro vira o TTL da chave no servidor.
+    """
+    
+    def __init__(self, client, prefix: str = "gedie:state:"):
+        self.client = client
+        self.prefix = prefix
+    
+    def _key(self, user_id: int) -> str:
+        return f"{self.prefix}{user_id}"
+    
+    def _user_id(self, key) -> int:
+        if isinstance(key, bytes):
+            key = key.decode()
+        return int(key[len(self.prefix):])
+    
+    def load_many(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        
+        payloads = self.client.mget([self._key(user_id) for user_id in user_ids])
+        return {
+            user_id: decode_record(payload) if payload is not None else None
+            for user_id, payload in zip(user_ids, payloads)
+        }
+    
+    def save_many(self, records):
+        if not records:
+            return
+        
+        # Todas as escritas do update em um único pipeline
+        now = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        for user_id, record in records.items():
+            if record is None:
+                pipe.delete(self._key(user_id))
+                continue
+            
+            expires_at = record.expires_at
+            ttl = max(1, math.ceil(expires_at - now)) if expires_at is not None else None
+            pipe.set(self._key(user_id), encode_record(record), ex=ttl)
+        pipe.execute()
+    
+    def items(self):
+        keys = list(self.client.scan_iter(match=f"{self.prefix}*"))
+        if not keys:
+            return iter(())
+        
+        payloads = self.client.mget(keys)
+        return (
+            (self._user_id(key), decode_record(payload))
+            for key, payload in zip(keys, payloads) if payload is not None
+        )
+
+def create_state_backend() -> StateBackend:
+    """Backend configurado em STATE_BACKEND (memory, sqlite ou redis)"""
+    kind = config('STATE_BACKEND', default='memory').lower()
+    
+    if kind == 'sqlite':
+        path = config('STATE_SQLITE_PATH', default='conversation_states.db')
+        logger.info(f"Estados da conversa em SQLite: {path}")
+        return SQLiteStateBackend(path)
+    
+    if kind == 'redis':
+        try:
+            import redis
+        except ImportError:
+            logger.error("STATE_BACKEND=redis requer o pacote 'redis'")
+            raise
+        url = config('STATE_REDIS_URL', default='redis://localhost:6379/0')
+        logger.info(f"Estados da conversa em Redis: {url}")
+        return RedisStateBackend(redis.Redis.from_url(url))
+    
+    return MemoryStateBackend(max_entries=config('STATE_MAX_ENTRIES', default=50000, cast=int))
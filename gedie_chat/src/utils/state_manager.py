@@ -2,10 +2,19 @@
 Gerenciador de estados da conversa - VERSÃO CORRIGIDA
 """
 
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from collections.abc import Mapping
+from contextvars import ContextVar
 from enum import Enum
-from typing import Dict, Any, Optional
+from typing import Callable, Dict, Any, Iterator, List, Optional, Set, Tuple
+from decouple import config
 from loguru import logger
 
+from utils.state_backends import StateBackend, MemoryStateBackend, create_state_backend
+from utils.user_locks import UserLocks
+
 class ConversationState(Enum):
     """Estados possíveis da conversa"""
     IDLE = "idle"
@@ -15,64 +24,276 @@ class ConversationState(Enum):
     CONFIRMING_EXPENSE = "confirming_expense"
     SELECTING_CATEGORY = "selecting_category"
 
+# Tempo de vida (segundos) de cada estado sem interação do usuário
+STATE_TTLS = {
+    state: config(f'STATE_TTL_{state.name}', default=default, cast=float)
+    for state, default in (
+        (ConversationState.IDLE, 1800),
+        (ConversationState.WAITING_AMOUNT, 900),
+        (ConversationState.WAITING_DESCRIPTION, 900),
+        (ConversationState.WAITING_CATEGORY_NAME, 900),
+        (ConversationState.CONFIRMING_EXPENSE, 1800),   # inclui análises de foto pendentes
+        (ConversationState.SELECTING_CATEGORY, 900),
+    )
+}
+
+class ConversationRecord(Mapping):
+    """Estado de um usuário em campos fixos (__slots__)
+    
+    Lido como mapeamento somente leitura dos campos preenchidos; alterações
+    só pelos métodos de transição, sem copiar dados.
+    """
+    
+    FIELDS = ('category_id', 'amount', 'description', 'source', 'photo_analysis')
+    
+    __slots__ = ('state', 'expires_at') + FIELDS
+    
+    def __init__(self, state: ConversationState = ConversationState.IDLE, expires_at: float = None, **fields):
+        self.state = state
+        self.expires_at = expires_at
+        self.category_id: Optional[int] = None
+        self.amount: Optional[float] = None
+        self.description: Optional[str] = None
+        self.source: Optional[str] = None
+        self.photo_analysis: Optional[Dict[str, Any]] = None
+        self.update(**fields)
+    
+    # Mapeamento somente leitura (compatível com get_data()[...] / .get())
+    def __getitem__(self, key: str) -> Any:
+        value = getattr(self, key, None) if key in self.FIELDS else None
+        if value is None:
+            raise KeyError(key)
+        return value
+    
+    def __iter__(self) -> Iterator[str]:
+        return (field for field in self.FIELDS if getattr(self, field) is not None)
+    
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+    
+    def __repr__(self) -> str:
+        return f"ConversationRecord({self.state.value}, {dict(self)})"
+    
+    # Transições
+    def update(self, **fields):
+        """Alterar campos (nome desconhecido levanta KeyError)"""
+        for field, value in fields.items():
+            if field not in self.FIELDS:
+                raise KeyError(field)
+            setattr(self, field, value)
+    
+    def transition(self, state: ConversationState, **fields):
+        """Mudar de estado preservando os campos atuais"""
+        self.state = state
+        self.update(**fields)
+    
+    def select_category(self, category_id: int):
+        """Categoria escolhida: aguardar valor"""
+        self.transition(ConversationState.WAITING_AMOUNT, category_id=category_id)
+    
+    def set_amount(self, amount: float):
+        """Valor informado: confirmar gasto"""
+        self.transition(ConversationState.CONFIRMING_EXPENSE, amount=amount)
+    
+    def request_description(self):
+        """Aguardar descrição do gasto"""
+        self.transition(ConversationState.WAITING_DESCRIPTION)
+    
+    def set_photo_analysis(self, analysis: Dict[str, Any], category_id: Optional[int] = None):
+        """Análise de comprovante pendente de confirmação"""
+        self.transition(ConversationState.CONFIRMING_EXPENSE, photo_analysis=analysis, source='photo')
+        if category_id is not None:
+            self.category_id = category_id
+    
+    # Serialização (backends persistentes)
+    def to_dict(self) -> Dict[str, Any]:
+        return {'state': self.state.value, 'data': dict(self), 'expires_at': self.expires_at}
+    
+    @classmethod
+    def from_dict(cls, raw: Dict[str, Any]) -> "ConversationRecord":
+        data = {key: value for key, value in raw.get('data', {}).items() if key in cls.FIELDS}
+        return cls(ConversationState(raw['state']), raw.get('expires_at'), **data)
+
+# Visão vazia para usuários sem estado
+_EMPTY_RECORD = ConversationRecord()
+
+class _UpdateStates:
+    """Estados carregados para o update atual (escritos de volta no final)"""
+    
+    __slots__ = ('records', 'dirty', 'expiry')
+    
+    def __init__(self, records: Dict[int, Optional[ConversationRecord]]):
+        self.records = records
+        self.dirty: Set[int] = set()
+        # Prazo anterior de cada registro alterado {id(registro): (registro, expires_at)}
+        self.expiry: Dict[int, Tuple[ConversationRecord, Optional[float]]] = {}
+
+# Estados do update em processamento (isolados por task do asyncio)
+_current_states: ContextVar[Optional[_UpdateStates]] = ContextVar('current_states', default=None)
+
 class StateManager:
-    """Gerenciador de estados dos usuários"""
+    """Gerenciador de estados dos usuários
     
-    def __init__(self):
-        # Armazenar estados em memória {user_id: {'state': state, 'data': {}}}
-        self._user_states: Dict[int, Dict[str, Any]] = {}
+    Dentro de update_scope() o estado do usuário é lido uma vez no início
+    e as alterações são gravadas em lote no final; fora dele cada operação
+    vai direto ao backend (scripts e testes). No event loop, fora de um
+    update, use os métodos _async: backends persistentes rodam em thread.
+    O escopo segura o lock do usuário: updates do mesmo usuário rodam em
+    ordem, de usuários diferentes em paralelo.
+    """
     
-    def set_state(self, user_id: int, state: ConversationState, data: Dict[str, Any] = None):
-        """Definir estado do usuário PRESERVANDO dados existentes"""
+    def __init__(self, backend: StateBackend = None):
+        self.backend = backend or MemoryStateBackend()
+        self.locks = UserLocks()
+        # Chamados a cada alteração de estado: listener(user_id, record ou None)
+        self._listeners: List[Callable[[int, Optional[ConversationRecord]], None]] = []
+    
+    def add_listener(self, listener: Callable[[int, Optional[ConversationRecord]], None]):
+        """Registrar callback de alterações de estado (não deve bloquear)"""
+        self._listeners.append(listener)
+    
+    def remove_listener(self, listener):
+        """Remover callback registrado com add_listener"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+    
+    async def _run(self, func, *args):
+        """Executar operação do backend sem bloquear o event loop"""
+        if self.backend.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+    
+    @asynccontextmanager
+    async def update_scope(self, *user_ids: int):
+        """Carregar estados dos usuários do update e gravar alterações no final"""
+        if _current_states.get() is not None:
+            yield
+            return
         
-        # Se já existe estado, preservar dados existentes
-        current_data = {}
-        if user_id in self._user_states:
-            current_data = self._user_states[user_id].get('data', {})
+        async with self.locks.hold(*user_ids):
+            scope = _UpdateStates(await self._run(self.backend.load_many, user_ids))
+            token = _current_states.set(scope)
+            try:
+                yield
+            except BaseException:
+                # Update descartado: o registro volta ao prazo que o backend conhece
+                # (no MemoryStateBackend é o mesmo objeto, com o prazo já no heap)
+                for record, expires_at in scope.expiry.values():
+                    record.expires_at = expires_at
+                raise
+            finally:
+                _current_states.reset(token)
+            
+            if scope.dirty:
+                changes = {user_id: scope.records.get(user_id) for user_id in scope.dirty}
+                await self._run(self.backend.save_many, changes)
+                # Listeners só veem alterações gravadas
+                for user_id, record in changes.items():
+                    self._notify(user_id, record)
+    
+    def _load(self, user_id: int) -> Optional[ConversationRecord]:
+        scope = _current_states.get()
+        if scope is None:
+            return self.backend.load(user_id)
         
-        # Mesclar dados novos com existentes
-        if data:
-            current_data.update(data)
+        if user_id not in scope.records:
+            # Leitura síncrona no loop e sem o lock do usuário: declarar em update_scope
+            raise RuntimeError(f"Estado do usuário {user_id} fora do update_scope atual")
+        return scope.records[user_id]
+    
+    def _notify(self, user_id: int, record: Optional[ConversationRecord]):
+        for listener in self._listeners:
+            listener(user_id, record)
+    
+    def _store(self, user_id: int, record: Optional[ConversationRecord]):
+        scope = _current_states.get()
+        if scope is not None and user_id not in scope.records:
+            raise RuntimeError(f"Estado do usuário {user_id} fora do update_scope atual")
+        
+        if record is not None:
+            if scope is not None:
+                scope.expiry.setdefault(id(record), (record, record.expires_at))
+            record.expires_at = time.time() + STATE_TTLS[record.state]
         
-        self._user_states[user_id] = {
-            'state': state,
-            'data': current_data
-        }
+        if scope is None:
+            self.backend.save(user_id, record)
+            self._notify(user_id, record)
+            return
         
-        logger.debug(f"Estado do usuário {user_id}: {state.value}")
-        logger.debug(f"Dados preservados: {current_data}")
+        scope.records[user_id] = record
+        scope.dirty.add(user_id)
+    
+    def get_record(self, user_id: int) -> Optional[ConversationRecord]:
+        """Registro atual do usuário (None se não houver estado)"""
+        return self._load(user_id)
+    
+    async def get_record_async(self, user_id: int) -> Optional[ConversationRecord]:
+        """get_record no event loop fora de um update (backend sem bloquear o loop)"""
+        if _current_states.get() is not None:
+            return self._load(user_id)
+        return await self._run(self.backend.load, user_id)
+    
+    def _apply(self, user_id: int, transition, *args, **kwargs) -> ConversationRecord:
+        """Aplicar transição ao registro do usuário (criado se não existir)"""
+        record = self._load(user_id)
+        if record is None:
+            record = ConversationRecord()
+        transition(record, *args, **kwargs)
+        self._store(user_id, record)
+        logger.debug(f"Estado do usuário {user_id}: {record.state.value}")
+        return record
+    
+    def transition(self, user_id: int, state: ConversationState, **fields) -> ConversationRecord:
+        """Mudar estado do usuário preservando os campos e alterando só `fields`"""
+        return self._apply(user_id, ConversationRecord.transition, state, **fields)
+    
+    def select_category(self, user_id: int, category_id: int) -> ConversationRecord:
+        """Categoria escolhida: aguardar valor"""
+        return self._apply(user_id, ConversationRecord.select_category, category_id)
+    
+    def set_amount(self, user_id: int, amount: float) -> ConversationRecord:
+        """Valor informado: confirmar gasto"""
+        return self._apply(user_id, ConversationRecord.set_amount, amount)
+    
+    def request_description(self, user_id: int) -> ConversationRecord:
+        """Aguardar descrição do gasto"""
+        return self._apply(user_id, ConversationRecord.request_description)
+    
+    def set_photo_analysis(self, user_id: int, analysis: Dict[str, Any],
+                           category_id: Optional[int] = None) -> ConversationRecord:
+        """Análise de comprovante pendente de confirmação"""
+        return self._apply(user_id, ConversationRecord.set_photo_analysis, analysis, category_id)
+    
+    def set_state(self, user_id: int, state: ConversationState, data: Dict[str, Any] = None):
+        """Definir estado do usuário PRESERVANDO dados existentes"""
+        self.transition(user_id, state, **(data or {}))
     
     def get_state(self, user_id: int) -> ConversationState:
         """Obter estado atual do usuário"""
-        user_state = self._user_states.get(user_id, {})
-        return user_state.get('state', ConversationState.IDLE)
+        record = self._load(user_id)
+        return record.state if record is not None else ConversationState.IDLE
     
-    def get_data(self, user_id: int) -> Dict[str, Any]:
-        """Obter dados do estado atual"""
-        user_state = self._user_states.get(user_id, {})
-        return user_state.get('data', {})
+    def get_data(self, user_id: int) -> Mapping:
+        """Obter dados do estado atual (visão somente leitura)"""
+        record = self._load(user_id)
+        return record if record is not None else _EMPTY_RECORD
     
     def update_data(self, user_id: int, key: str, value: Any):
         """Atualizar dados do estado PRESERVANDO existentes"""
-        if user_id not in self._user_states:
-            self._user_states[user_id] = {
-                'state': ConversationState.IDLE, 
-                'data': {}
-            }
-        
-        # Preservar dados existentes
-        current_data = self._user_states[user_id]['data']
-        current_data[key] = value
+        self._apply(user_id, ConversationRecord.update, **{key: value})
         
         logger.debug(f"Dados atualizados para usuário {user_id}: {key}={value}")
-        logger.debug(f"Dados completos: {current_data}")
     
     def clear_state(self, user_id: int):
         """Limpar estado do usuário"""
-        if user_id in self._user_states:
-            del self._user_states[user_id]
+        self._store(user_id, None)
         logger.debug(f"Estado do usuário {user_id} limpo")
     
+    async def clear_state_async(self, user_id: int):
+        """clear_state fora de um update: espera o lock do usuário e grava sem bloquear o loop"""
+        async with self.update_scope(user_id):
+            self.clear_state(user_id)
+    
     def is_waiting_input(self, user_id: int) -> bool:
         """Verificar se usuário está esperando input"""
         state = self.get_state(user_id)
@@ -84,18 +305,30 @@ class StateManager:
     
     def debug_user(self, user_id: int) -> str:
         """Debug completo de um usuário"""
-        if user_id not in self._user_states:
+        record = self._load(user_id)
+        if record is None:
             return f"Usuário {user_id} não possui estado ativo"
         
-        user_data = self._user_states[user_id]
-        return f"Usuário {user_id}: Estado={user_data['state'].value}, Dados={user_data['data']}"
+        return f"Usuário {user_id}: Estado={record.state.value}, Dados={dict(record)}"
+    
+    def stats(self) -> Dict[str, Any]:
+        """Tamanho e contadores de expiração/remoção do backend"""
+        return {**self.backend.stats(), 'active_locks': len(self.locks)}
+    
+    async def stats_async(self) -> Dict[str, Any]:
+        """stats() sem bloquear o event loop"""
+        return {**await self._run(self.backend.stats), 'active_locks': len(self.locks)}
+    
+    async def records_async(self) -> List[Tuple[int, ConversationRecord]]:
+        """Todos os estados ativos, lidos sem bloquear o event loop"""
+        return await self._run(lambda: list(self.backend.items()))
     
     def list_all_states(self) -> Dict[int, str]:
         """Listar todos os estados ativos"""
         result = {}
-        for user_id, state_data in self._user_states.items():
-            result[user_id] = f"{state_data['state'].value} - {state_data['data']}"
+        for user_id, record in self.backend.items():
+            result[user_id] = f"{record.state.value} - {dict(record)}"
         return result
 
-# Instância global do gerenciador
-state_manager = StateManager()
\ No newline at end of file
+# Instância global do gerenciador (backend definido em STATE_BACKEND)
+state_manager = StateManager(create_state_backend())
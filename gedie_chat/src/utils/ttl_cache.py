@@ -0,0 +1,65 @@
+"""
+Cache em memória limitado (LRU) com expiração por TTL
+"""
+
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+from loguru import logger
+
+class TTLCache:
+    """Cache limitado (LRU) com expiração por TTL"""
+    
+    def __init__(self, name: str, max_size: int = 10000, ttl: float = 300.0):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        # {chave: (expira_em, valor)}
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Obter valor do cache (None se ausente ou expirado)"""
+        entry = self._entries.get(key)
+        
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+    
+    def set(self, key: Hashable, value: Any):
+        """Guardar valor no cache, removendo o menos usado se cheio"""
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def invalidate(self, key: Hashable):
+        """Remover entrada do cache"""
+        if self._entries.pop(key, None) is not None:
+            logger.debug(f"Cache {self.name}: entrada {key} invalidada")
+    
+    def clear(self):
+        """Limpar cache e contadores"""
+        self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+    
+    def stats(self) -> Dict[str, Any]:
+        """Estatísticas do cache"""
+        total = self.hits + self.misses
+        return {
+            'name': self.name,
+            'size': len(self._entries),
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
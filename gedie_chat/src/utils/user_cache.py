@@ -0,0 +1,22 @@
+"""
+Cache em memória Telegram ID → usuário (registro leve)
+"""
+
+from typing import NamedTuple
+from decouple import config
+from utils.ttl_cache import TTLCache
+
+class CachedUser(NamedTuple):
+    """Registro leve do usuário, suficiente para a maioria dos handlers"""
+    id: int
+    nome: str
+    ativo: bool
+    timezone: str
+    has_code: bool
+
+# Instância global do cache {telegram_id: CachedUser}
+user_cache = TTLCache(
+    'users',
+    max_size=config('USER_CACHE_SIZE', default=10000, cast=int),
+    ttl=config('USER_CACHE_TTL', default=300, cast=float)
+)
@@ -0,0 +1,55 @@
+"""
+Locks asyncio por usuário (updates do mesmo usuário em ordem)
+"""
+
+from contextlib import asynccontextmanager
+from typing import Dict
+import asyncio
+
+class _LockEntry:
+    """Lock de um usuário e quantos updates o usam/aguardam"""
+    
+    __slots__ = ('lock', 'users')
+    
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        self.users = 0
+
+class UserLocks:
+    """Registro de locks por usuário
+    
+    O lock é criado no primeiro update do usuário e descartado quando nenhum
+    update o usa nem aguarda, então o registro só guarda usuários ativos.
+    """
+    
+    def __init__(self):
+        self._entries: Dict[int, _LockEntry] = {}
+    
+    @asynccontextmanager
+    async def hold(self, *user_ids: int):
+        """Segurar os locks dos usuários (ordem fixa evita deadlock)"""
+        ids = sorted(set(user_ids))
+        entries = []
+        for user_id in ids:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = self._entries[user_id] = _LockEntry()
+            entry.users += 1
+            entries.append(entry)
+        
+        acquired = []
+        try:
+            for entry in entries:
+                await entry.lock.acquire()
+                acquired.append(entry)
+            yield
+        finally:
+            for entry in acquired:
+                entry.lock.release()
+            for user_id, entry in zip(ids, entries):
+                entry.users -= 1
+                if entry.users == 0:
+                    del self._entries[user_id]
+    
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -82,6 +82,25 @@ class ExpenseKeyboard:
         ]
         return InlineKeyboardMarkup(keyboard)
     
+    @staticmethod
+    def get_page_navigation(period: str, newer_cursor: str = None, older_cursor: str = None):
+        """Navegação entre páginas de gastos (o cursor vai no callback)"""
+        keyboard = []
+        
+        nav_row = []
+        if newer_cursor:
+            nav_row.append(InlineKeyboardButton("⬅️ Mais recentes", callback_data=f"expense:view:{period}:n:{newer_cursor}"))
+        if older_cursor:
+            nav_row.append(InlineKeyboardButton("Mais antigos ➡️", callback_data=f"expense:view:{period}:o:{older_cursor}"))
+        if nav_row:
+            keyboard.append(nav_row)
+        
+        keyboard.append([
+            InlineKeyboardButton("🔙 Voltar", callback_data="expense:view_menu"),
+            InlineKeyboardButton("🏠 Menu Principal", callback_data="main:menu")
+        ])
+        return InlineKeyboardMarkup(keyboard)
+    
     @staticmethod
     def get_expense_actions(expense_id: int):
         """Ações para um gasto específico"""
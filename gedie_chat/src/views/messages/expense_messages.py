@@ -4,7 +4,7 @@ Formatadores de mensagens para gastos - VERSÃO CORRIGIDA
 
 from typing import List, Dict, Any
 from datetime import date, datetime
-from models.expense_model import Expense
+from models.expense_model import Expense, ExpenseRow
 from models.category_model import Category
 
 class ExpenseMessages:
@@ -45,6 +45,56 @@ Que tal começar a registrar seus gastos?"""
         
         return message
     
+    @staticmethod
+    def _row_line(row: ExpenseRow) -> str:
+        """Uma linha da listagem de gastos"""
+        valor_formatado = f"R$ {row.valor:.2f}".replace('.', ',')
+        data_formatada = row.data_gasto.strftime('%d/%m')
+        
+        line = f"• {row.category_icone} **{valor_formatado}** - {row.category_nome}"
+        if row.descricao:
+            line += f" _{row.descricao[:30]}{'...' if len(row.descricao) > 30 else ''}_"
+        return line + f" ({data_formatada})\n"
+    
+    @staticmethod
+    def expenses_rows_message(rows: List[ExpenseRow], period_title: str, total: float, count: int) -> str:
+        """Lista de gastos a partir de linhas leves (total e quantidade vêm do banco)"""
+        if not count:
+            return f"""📊 **{period_title}**
+
+😴 Nenhum gasto registrado neste período.
+
+Que tal começar a registrar seus gastos?"""
+        
+        total_formatado = f"R$ {total:.2f}".replace('.', ',')
+        
+        message = f"""📊 **{period_title}**
+
+💰 **Total: {total_formatado}**
+📝 **{count} gasto{'s' if count > 1 else ''}**
+
+"""
+        
+        for row in rows:
+            message += ExpenseMessages._row_line(row)
+        
+        return message
+    
+    @staticmethod
+    def expenses_page_message(rows: List[ExpenseRow], period_title: str) -> str:
+        """Página seguinte da lista de gastos (sem recalcular o total do período)"""
+        if not rows:
+            return f"""📊 **{period_title}**
+
+😴 Nenhum gasto nesta página."""
+        
+        message = f"📊 **{period_title}**\n\n"
+        
+        for row in rows:
+            message += ExpenseMessages._row_line(row)
+        
+        return message
+    
     @staticmethod
     def welcome_message(user_name: str) -> str:
         """Mensagem de boas-vindas"""
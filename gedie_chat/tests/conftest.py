@@ -1,23 +1,32 @@
 """
 Fixtures para os testes GEDIE.
-Cria um engine SQLite em memória, monkey-patcha o SessionLocal global
-e gera uma sessão isolada para cada teste.
+Cria um banco SQLite temporário (engine síncrono + assíncrono sobre o
+mesmo arquivo), monkey-patcha as sessions globais e gera uma sessão
+isolada para cada teste.
 """
 
+import os
 import pytest
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+# Sem cache de comprovantes em disco no diretório do projeto durante os testes
+os.environ.setdefault("RECEIPT_CACHE_PATH", "")
 
 # -------------------------------------------------------------------- #
 # Engine + SessionLocal (function-scoped → ok com monkeypatch)
 # -------------------------------------------------------------------- #
 @pytest.fixture(scope="function")
-def _engine_and_session(monkeypatch):
+def _engine_and_session(monkeypatch, tmp_path):
     # Importes tardios (evita efeitos colaterais antes do patch)
     from src.models.base_model import Base
     import src.config.database_config as db_conf
+    # Registrar todos os models (relacionamentos por nome)
+    import models.user_model, models.category_model, models.expense_model  # noqa: F401
 
-    engine = create_engine("sqlite:///:memory:")
+    db_file = tmp_path / "gedie_test.db"
+    engine = create_engine(f"sqlite:///{db_file}")
     TestSessionLocal = sessionmaker(bind=engine)
 
     # Monkey-patch: controllers que importam db_conf usarão esta session
@@ -31,6 +40,21 @@ def _engine_and_session(monkeypatch):
 
     engine.dispose()
 
+# -------------------------------------------------------------------- #
+# Session factory assíncrona sobre o mesmo arquivo SQLite
+# -------------------------------------------------------------------- #
+@pytest.fixture(scope="function")
+async def async_session_factory(_engine_and_session):
+    engine, _ = _engine_and_session
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{engine.url.database}")
+    TestAsyncSessionLocal = async_sessionmaker(
+        bind=async_engine, autoflush=False, expire_on_commit=False
+    )
+
+    yield TestAsyncSessionLocal
+
+    await async_engine.dispose()
+
 # -------------------------------------------------------------------- #
 # Sessão de banco a cada teste
 # -------------------------------------------------------------------- #
@@ -41,3 +65,14 @@ def db_session(_engine_and_session):
     yield session
     session.rollback()
     session.close()
+
+# -------------------------------------------------------------------- #
+# Caches globais começam vazios em cada teste
+# -------------------------------------------------------------------- #
+@pytest.fixture(autouse=True)
+def _clear_caches():
+    from utils.user_cache import user_cache
+    from utils.category_cache import category_cache
+    user_cache.clear()
+    category_cache.clear()
+    yield
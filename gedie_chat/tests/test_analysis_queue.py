@@ -0,0 +1,101 @@
+"""
+Testes da fila de análises (backpressure, retries, posição e cancelamento)
+"""
+
+import asyncio
+from services.analysis_queue import AnalysisQueue, AnalysisJob
+
+OK = {"valor_total": 10.0}
+TRANSIENT = {"erro": True, "transitorio": True, "observacoes": "Erro: sobrecarga"}
+
+def _job(user_id, done, progress=None):
+    async def on_done(result):
+        done.append((user_id, result))
+    
+    async def on_progress(position):
+        progress.append((user_id, position))
+    
+    return AnalysisJob(user_id, b"img", on_done, on_progress if progress is not None else None)
+
+async def test_queue_positions_and_backpressure():
+    release = asyncio.Event()
+    
+    async def analyze(image_data):
+        await release.wait()
+        return OK
+    
+    queue = AnalysisQueue(analyze, workers=1, max_size=2)
+    done, progress = [], []
+    try:
+        assert await queue.submit(_job(1, done, progress)) == 0
+        await asyncio.sleep(0)                    # worker pega o primeiro job
+        assert await queue.submit(_job(2, done, progress)) == 1
+        assert await queue.submit(_job(3, done, progress)) == 2
+        assert await queue.submit(_job(4, done, progress)) is None   # fila cheia
+        
+        release.set()
+        while len(done) < 3:
+            await asyncio.sleep(0.01)
+        
+        assert [user for user, _ in done] == [1, 2, 3]
+        assert (3, 1) in progress and (2, 0) in progress and (3, 0) in progress
+        assert queue.stats()["rejected"] == 1 and queue.stats()["completed"] == 3
+    finally:
+        await queue.stop()
+
+async def test_transient_errors_are_retried_with_backoff():
+    calls = []
+    
+    async def analyze(image_data):
+        calls.append(image_data)
+        return TRANSIENT if len(calls) < 3 else OK
+    
+    queue = AnalysisQueue(analyze, workers=1, max_retries=2, retry_base=0.01)
+    done = []
+    try:
+        await queue.submit(_job(1, done))
+        while not done:
+            await asyncio.sleep(0.01)
+        assert done == [(1, OK)] and len(calls) == 3
+        assert queue.stats()["retries"] == 2
+    finally:
+        await queue.stop()
+
+async def test_cancel_running_and_pending_jobs():
+    started = asyncio.Event()
+    
+    async def analyze(image_data):
+        started.set()
+        await asyncio.sleep(10)
+        return OK
+    
+    queue = AnalysisQueue(analyze, workers=1)
+    done = []
+    try:
+        await queue.submit(_job(1, done))
+        await queue.submit(_job(1, done))
+        await started.wait()
+        
+        assert queue.cancel(1) == 2
+        await asyncio.sleep(0.01)
+        assert done == [] and queue.stats()["cancelled"] == 2
+        assert queue.stats()["running"] == 0 and queue.stats()["pending"] == 0
+        assert queue.cancel(1) == 0
+    finally:
+        await queue.stop()
+
+async def test_analysis_exception_still_calls_on_done():
+    async def analyze(image_data):
+        raise RuntimeError("sem rede")
+    
+    queue = AnalysisQueue(analyze, workers=1)
+    done = []
+    try:
+        await queue.submit(_job(1, done))
+        await queue.submit(_job(2, done))
+        while len(done) < 2:
+            await asyncio.sleep(0.01)
+        assert [user for user, _ in done] == [1, 2]             # worker segue atendendo a fila
+        assert all(result["erro"] and result["observacoes"] for _, result in done)
+    finally:
+        await queue.stop()
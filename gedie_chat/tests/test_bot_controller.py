@@ -15,10 +15,9 @@ class DummyUpdate:
         self.message = DummyMessage()
 
 @pytest.mark.asyncio
-async def test_start_creates_user(monkeypatch, _engine_and_session):
-    _, Sess = _engine_and_session
-    # forçar SessionLocal usado pelo controller
-    monkeypatch.setattr("controllers.user_controller.SessionLocal", Sess)
+async def test_start_creates_user(monkeypatch, async_session_factory):
+    # forçar AsyncSessionLocal usado pela sessão do update
+    monkeypatch.setattr("middlewares.db_session_middleware.AsyncSessionLocal", async_session_factory)
 
     bot = BotController()
     up = DummyUpdate(42)
@@ -0,0 +1,77 @@
+import asyncio
+import datetime
+from sqlalchemy import text, update
+from migrations.migration_runner import run_migrations
+from models.user_model import User
+from models.category_model import Category, TipoCategoria
+from utils.category_cache import category_cache
+from services.category_sync_service import CategorySyncService
+
+async def test_cached_categories_and_invalidation(db_session, async_session_factory):
+    user = User.create_user(db_session, 88, "Hana")
+    Category.create_default_categories(db_session, user.id)
+
+    async with async_session_factory() as db:
+        first = await Category.get_user_categories_cached_async(db, user.id)
+        again = await Category.get_user_categories_cached_async(db, user.id)
+        assert first is again and len(first) == 8
+        assert isinstance(first, tuple)
+
+        found = await Category.find_user_category_async(db, user.id, first[0].id)
+        assert found.nome == first[0].nome
+        assert await Category.find_user_category_async(db, user.id, 9999) is None
+
+    # escrita pelo ORM invalida o cache do usuário
+    Category(nome="Pets", icone="🐶", cor="#fff", user_id=user.id,
+             tipo=TipoCategoria.DESPESA).save(db_session)
+    assert category_cache.get(user.id) is None
+
+    async with async_session_factory() as db:
+        assert len(await Category.get_user_categories_cached_async(db, user.id)) == 9
+
+async def test_sync_service_invalidates_external_changes(db_session, async_session_factory, monkeypatch):
+    monkeypatch.setattr("services.category_sync_service.AsyncSessionLocal", async_session_factory)
+    user = User.create_user(db_session, 89, "Ivo")
+    Category.create_default_categories(db_session, user.id)
+
+    service = CategorySyncService(interval=1)
+    assert await service.sync_once() == 0        # marca ponto de partida
+
+    async with async_session_factory() as db:
+        await Category.get_user_categories_cached_async(db, user.id)
+    assert category_cache.get(user.id) is not None
+
+    # alteração "externa" (SQL direto, como na versão web) sem eventos do ORM
+    later = datetime.datetime.utcnow() + datetime.timedelta(seconds=5)
+    db_session.execute(
+        update(Category.__table__)
+        .where(Category.user_id == user.id, Category.nome == "Roupas")
+        .values(ativo=False, updated_at=later)
+    )
+    db_session.commit()
+
+    assert await service.sync_once() == 1
+    assert category_cache.get(user.id) is None
+
+async def test_sync_service_sees_updates_without_updated_at(db_session, async_session_factory, monkeypatch):
+    monkeypatch.setattr("services.category_sync_service.AsyncSessionLocal", async_session_factory)
+    assert run_migrations(db_session.get_bind())     # updated_at mantido pelo banco
+    user = User.create_user(db_session, 90, "Juno")
+    Category.create_default_categories(db_session, user.id)
+
+    service = CategorySyncService(interval=1)
+    assert await service.sync_once() == 0
+
+    async with async_session_factory() as db:
+        await Category.get_user_categories_cached_async(db, user.id)
+    assert category_cache.get(user.id) is not None
+
+    # UPDATE como o de um painel/SQL manual: sem tocar em updated_at
+    await asyncio.sleep(0.01)
+    db_session.execute(text("UPDATE categories SET nome = 'Vestuário' WHERE user_id = :uid AND nome = 'Roupas'"),
+                       {"uid": user.id})
+    db_session.commit()
+
+    assert await service.sync_once() == 1
+    assert category_cache.get(user.id) is None
+    assert await service.sync_once() == 0
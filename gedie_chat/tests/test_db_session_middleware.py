@@ -0,0 +1,101 @@
+import pytest
+from middlewares.db_session_middleware import with_db_session, db_session_scope
+from models.user_model import User
+
+@pytest.fixture
+def session_factory(monkeypatch, async_session_factory):
+    monkeypatch.setattr("middlewares.db_session_middleware.AsyncSessionLocal", async_session_factory)
+    return async_session_factory
+
+@pytest.mark.asyncio
+async def test_single_session_per_update(session_factory, db_session):
+    sessions = []
+
+    async def handler(update, context):
+        async with db_session_scope() as db:
+            sessions.append(db)
+            await User.create_user_async(db, 501, "Eva")
+        async with db_session_scope() as db:
+            sessions.append(db)
+            # mesmo update → mesma sessão, usuário visível antes do commit
+            assert (await User.get_by_telegram_id_async(db, 501)).nome == "Eva"
+
+    await with_db_session(handler)(None, None)
+
+    assert sessions[0] is sessions[1]
+    assert User.get_by_telegram_id(db_session, 501).nome == "Eva"
+
+@pytest.mark.asyncio
+async def test_rollback_on_error(session_factory, db_session):
+    async def handler(update, context):
+        async with db_session_scope() as db:
+            await User.create_user_async(db, 502, "Fred")
+        raise RuntimeError("falha no handler")
+
+    with pytest.raises(RuntimeError):
+        await with_db_session(handler)(None, None)
+
+    assert User.get_by_telegram_id(db_session, 502) is None
+
+@pytest.mark.asyncio
+async def test_rollback_when_handler_swallows_error(session_factory, db_session):
+    async def handler(update, context):
+        try:
+            async with db_session_scope() as db:
+                await User.create_user_async(db, 503, "Gil")
+                await User.create_user_async(db, 503, "Gil")     # telegram_id duplicado
+        except Exception:
+            return "erro tratado"   # como os controllers: só avisa o usuário
+
+    assert await with_db_session(handler)(None, None) == "erro tratado"
+    assert User.get_by_telegram_id(db_session, 503) is None
+
+@pytest.fixture
+async def replica_factory(monkeypatch, tmp_path, session_factory):
+    from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+    from src.models.base_model import Base
+    from middlewares.db_session_middleware import recent_writers
+
+    # Segundo arquivo SQLite fazendo papel de réplica (sem replicação)
+    replica_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    async with replica_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    factory = async_sessionmaker(bind=replica_engine, autoflush=False, expire_on_commit=False)
+
+    monkeypatch.setattr("middlewares.db_session_middleware.REPLICA_ENABLED", True)
+    monkeypatch.setattr("middlewares.db_session_middleware.AsyncReadSessionLocal", factory)
+    recent_writers.clear()
+    yield factory
+    recent_writers.clear()
+    await replica_engine.dispose()
+
+@pytest.mark.asyncio
+async def test_reads_routed_to_replica_with_stickiness(replica_factory, db_session):
+    from types import SimpleNamespace
+    from middlewares.db_session_middleware import db_read_scope
+    User.create_user(db_session, 601, "Gabi")       # só existe no primário
+
+    async def read(update, context):
+        async with db_read_scope(update.effective_user.id) as db:
+            return await User.get_by_telegram_id_async(db, 601)
+
+    async def write(update, context):
+        async with db_session_scope() as db:
+            await User.create_user_async(db, update.effective_user.id, "Hugo")
+        # mesmo update: lê a própria escrita no primário
+        async with db_read_scope(update.effective_user.id) as db:
+            return await User.get_by_telegram_id_async(db, update.effective_user.id)
+
+    reader = SimpleNamespace(effective_user=SimpleNamespace(id=601))
+    writer = SimpleNamespace(effective_user=SimpleNamespace(id=602))
+
+    assert await with_db_session(read)(reader, None) is None        # réplica
+    assert (await with_db_session(write)(writer, None)).nome == "Hugo"
+
+    async def read_own(update, context):
+        async with db_read_scope(update.effective_user.id) as db:
+            return await User.get_by_telegram_id_async(db, 602)
+
+    # logo após a escrita o usuário continua no primário
+    assert (await with_db_session(read_own)(writer, None)).nome == "Hugo"
+    assert await with_db_session(read_own)(reader, None) is None
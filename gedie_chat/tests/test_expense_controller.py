@@ -5,9 +5,8 @@ from models.user_model import User
 from models.category_model import Category, TipoCategoria
 
 @pytest.fixture
-def controller(monkeypatch, _engine_and_session):
-    _, TestSessionLocal = _engine_and_session
-    monkeypatch.setattr("controllers.expense_controller.SessionLocal", TestSessionLocal)
+def controller(monkeypatch, async_session_factory):
+    monkeypatch.setattr("middlewares.db_session_middleware.AsyncSessionLocal", async_session_factory)
     return ExpenseController()
 
 @pytest.mark.asyncio
@@ -6,7 +6,7 @@ no ambiente ou em um .env carregado pela aplicação.
 
 import io, pytest
 from PIL import Image, ImageDraw
-from services.gemini_service import gemini_service
+from services.gemini_service import GeminiService
 
 pytestmark = pytest.mark.asyncio
 
@@ -24,21 +24,20 @@ def _dummy_receipt_bytes() -> bytes:
     img.save(buf, format="PNG")
     return buf.getvalue()
 
-def _skip_if_no_key():
+def _gemini() -> GeminiService:
+    gemini_service = GeminiService()
     if not gemini_service.api_key or gemini_service.api_key.startswith("fake"):
         pytest.skip("GEMINI_API_KEY não configurada")
+    return gemini_service
 
 # --------------------------------------------------------------------------- #
 # Testes
 # --------------------------------------------------------------------------- #
 async def test_gemini_connection():
-    _skip_if_no_key()
-    assert gemini_service.test_connection() is True
+    assert _gemini().test_connection() is True
 
 async def test_gemini_analyze_receipt():
-    _skip_if_no_key()
-
-    result = await gemini_service.analyze_receipt(_dummy_receipt_bytes())
+    result = await _gemini().analyze_receipt(_dummy_receipt_bytes())
 
     # Estrutura mínima esperada
     assert isinstance(result, dict)
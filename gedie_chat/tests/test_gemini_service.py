@@ -0,0 +1,167 @@
+"""
+Testes do GeminiService sem rede (modelo falso)
+"""
+
+import asyncio
+import io
+import json
+from types import SimpleNamespace
+from PIL import Image
+from services.gemini_service import GeminiService
+
+def _png() -> bytes:
+    buf = io.BytesIO()
+    Image.new("RGB", (2000, 1000), "white").save(buf, format="PNG")
+    return buf.getvalue()
+
+class FakeModel:
+    def __init__(self, delay=0.05):
+        self.delay = delay
+        self.active = 0
+        self.peak = 0
+
+    async def generate_content_async(self, parts, generation_config=None):
+        prompt, blob = parts
+        image = Image.open(io.BytesIO(blob["data"]))
+        assert max(image.size) <= 1024 and image.mode == "L"   # pré-processada antes do envio
+        assert generation_config.response_schema["type"] == "object"
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.active -= 1
+        return SimpleNamespace(text=json.dumps({
+            "valor_total": "12,50", "estabelecimento": "Padaria", "categoria_sugerida": "alimentacao",
+            "itens_principais": ["pão"], "confianca": 0.9, "observacoes": None
+        }))
+
+def _service(model, concurrency=2, timeout=5, cache=None):
+    service = GeminiService()
+    service.cache = cache
+    service.model = model
+    service.timeout = timeout
+    service._semaphore = asyncio.Semaphore(concurrency)
+    return service
+
+async def test_concurrency_limit_and_event_loop_free():
+    model = FakeModel()
+    service = _service(model, concurrency=2)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.005)
+
+    tick_task = asyncio.create_task(ticker())
+    results = await asyncio.gather(*(service.analyze_receipt(_png()) for _ in range(5)))
+    tick_task.cancel()
+
+    assert all(r["valor_total"] == 12.5 for r in results)
+    assert model.peak == 2
+    assert ticks > 10                              # loop continuou atendendo outras tasks
+
+async def test_timeout_and_cancellation():
+    service = _service(FakeModel(delay=1), timeout=0.05)
+    result = await service.analyze_receipt(_png())
+    assert result["erro"] and "demorou" in result["observacoes"]
+
+    service.timeout = 5
+    task = asyncio.create_task(service.analyze_receipt(_png()))
+    await asyncio.sleep(0.1)
+    task.cancel()
+    try:
+        await task
+        assert False, "deveria ter sido cancelada"
+    except asyncio.CancelledError:
+        pass
+    assert service.model.active == 0
+
+async def test_receipt_cache_hits_and_bypass(tmp_path):
+    from services.receipt_cache import ReceiptCache
+    cache = ReceiptCache(str(tmp_path / "receipts.db"), max_entries=1, near_duplicates=True)
+    model = FakeModel()
+    calls = []
+    original = model.generate_content_async
+
+    async def counting(parts, **kwargs):
+        calls.append(1)
+        return await original(parts, **kwargs)
+    model.generate_content_async = counting
+    service = _service(model, cache=cache)
+
+    png = _png()
+    first = await service.analyze_receipt(png)
+    again = await service.analyze_receipt(png)
+    assert again == first and len(calls) == 1
+
+    # mesma imagem em outro formato: mesmo conteúdo normalizado
+    bmp = io.BytesIO()
+    Image.new("RGB", (2000, 1000), "white").save(bmp, format="BMP")
+    await service.analyze_receipt(bmp.getvalue())
+    assert len(calls) == 1
+
+    # quase igual (um pixel diferente) só via hash perceptual
+    tweaked = Image.new("RGB", (2000, 1000), "white")
+    tweaked.putpixel((0, 0), (0, 0, 0))
+    buf = io.BytesIO()
+    tweaked.save(buf, format="PNG")
+    await service.analyze_receipt(buf.getvalue())
+    assert len(calls) == 1
+
+    await service.analyze_receipt(png, use_cache=False)
+    assert len(calls) == 2
+    assert cache.stats() == {
+        'name': 'receipts', 'size': 1, 'max_size': 1, 'hits': 2, 'near_hits': 1, 'misses': 1,
+        'hit_rate': 0.75
+    }
+
+async def test_album_analyzed_in_one_call(tmp_path):
+    from services.receipt_cache import ReceiptCache
+    from services.gemini_service import generation_config
+    generation_config_single = generation_config()
+    cache = ReceiptCache(str(tmp_path / "receipts.db"), max_entries=10)
+    calls = []
+
+    class BatchModel:
+        async def generate_content_async(self, parts, generation_config=None):
+            assert generation_config.response_schema["type"] == "array"
+            assert generation_config.max_output_tokens == 2 * generation_config_single.max_output_tokens
+            calls.append(len(parts) - 1)
+            return SimpleNamespace(text=json.dumps([
+                {"valor_total": 10 + i, "estabelecimento": f"Loja {i}", "categoria_sugerida": "lazer",
+                 "confianca": 0.8} for i in range(len(parts) - 1)
+            ]))
+
+    service = _service(BatchModel(), cache=cache)
+    single = FakeModel()
+    images = []
+    for color in ("white", "black", "gray"):
+        buf = io.BytesIO()
+        Image.new("RGB", (800, 600), color).save(buf, format="PNG")
+        images.append(buf.getvalue())
+
+    # primeira imagem já no cache: só as outras duas vão para o modelo
+    service.model = single
+    await service.analyze_receipt(images[0])
+    service.model = BatchModel()
+    result = await service.analyze_receipts(images)
+
+    assert calls == [2]
+    assert [r["valor_total"] for r in result["comprovantes"]] == [12.5, 10.0, 11.0]
+    assert result["comprovantes"][1]["categoria_sugerida"] == "lazer"
+
+async def test_response_outside_schema_is_an_error():
+    class BadModel:
+        def __init__(self, text):
+            self.text = text
+
+        async def generate_content_async(self, parts, generation_config=None):
+            return SimpleNamespace(text=self.text)
+
+    for text in ("não é json", '[{"valor_total": 1}]'):
+        result = await _service(BadModel(text)).analyze_receipt(_png())
+        assert result["erro"] and not result["transitorio"]
+        assert "formato inválido" in result["observacoes"]
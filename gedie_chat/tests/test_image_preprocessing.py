@@ -0,0 +1,42 @@
+"""
+Testes do pré-processamento de comprovantes
+"""
+
+import io
+from PIL import Image
+from services.image_preprocessing import preprocess_receipt
+
+def _photo(size, orientation=None) -> bytes:
+    image = Image.effect_noise(size, 60).convert("RGB")
+    buf = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    image.save(buf, format="JPEG", quality=95, exif=exif.tobytes())
+    return buf.getvalue()
+
+def test_preprocess_grayscale_within_budget():
+    data = _photo((3000, 2000))
+    out = preprocess_receipt(data, max_side=1024, budget=60 * 1024)
+    image = Image.open(io.BytesIO(out))
+    
+    assert image.format == "JPEG" and image.mode == "L"
+    assert max(image.size) <= 1024
+    assert len(out) <= 60 * 1024 < len(data)
+
+def test_preprocess_applies_exif_orientation():
+    # Orientação 6: foto de celular deitada, deve sair em pé
+    out = preprocess_receipt(_photo((1200, 600), orientation=6), max_side=1024)
+    width, height = Image.open(io.BytesIO(out)).size
+    assert height > width
+
+async def test_process_pool_is_not_forked(monkeypatch):
+    import services.image_preprocessing as ip
+    monkeypatch.setattr(ip, "WORKERS", 1)
+    monkeypatch.setattr(ip, "_pool", None)
+    data = _photo((400, 300))
+    try:
+        assert await ip.preprocess_receipt_async(data) == preprocess_receipt(data)
+        assert ip._pool._mp_context.get_start_method() != "fork"
+    finally:
+        ip.shutdown_pool()
@@ -0,0 +1,51 @@
+import asyncio
+import json
+from services.introspection_service import IntrospectionServer
+from utils.state_manager import StateManager, ConversationState
+
+async def _request(path, payload):
+    reader, writer = await asyncio.open_unix_connection(path)
+    writer.write(json.dumps(payload).encode() + b"\n")
+    await writer.drain()
+    return reader, writer
+
+async def test_watch_pushes_state_changes(tmp_path):
+    manager = StateManager()
+    path = str(tmp_path / "bot.sock")
+    server = IntrospectionServer(path, manager=manager)
+    await server.start()
+    try:
+        reader, writer = await _request(path, {"cmd": "watch", "user_id": 10})
+        initial = json.loads(await reader.readline())
+        assert initial["state"] is None
+
+        manager.select_category(11, 2)             # outro usuário: filtrado
+        manager.select_category(10, 5)
+        event = json.loads(await asyncio.wait_for(reader.readline(), 1))
+        assert (event["user_id"], event["state"], event["data"]) == (10, "waiting_amount", {"category_id": 5})
+
+        writer.close()
+        await asyncio.sleep(0.05)
+        assert manager._listeners == []            # cliente desconectado libera o listener
+
+        reader, writer = await _request(path, {"cmd": "stats"})
+        stats = json.loads(await reader.readline())
+        writer.close()
+        assert stats["states"]["size"] == 2
+        assert [cache["name"] for cache in stats["caches"]] == ["users", "categories"]
+    finally:
+        await server.stop()
+
+async def test_simulate_runs_in_bot_process(tmp_path):
+    manager = StateManager()
+    path = str(tmp_path / "bot.sock")
+    server = IntrospectionServer(path, manager=manager)
+    await server.start()
+    try:
+        reader, writer = await _request(path, {"cmd": "simulate", "user_id": 20, "category_id": 3, "amount": 12.5})
+        event = json.loads(await reader.readline())
+        writer.close()
+        assert (event["state"], event["data"]) == ("confirming_expense", {"category_id": 3, "amount": 12.5})
+        assert manager.get_state(20) == ConversationState.CONFIRMING_EXPENSE
+    finally:
+        await server.stop()
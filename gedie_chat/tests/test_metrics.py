@@ -0,0 +1,56 @@
+"""
+Testes das métricas de análises de comprovantes
+"""
+
+import io
+import json
+from types import SimpleNamespace
+from PIL import Image
+from services.metrics_service import ReceiptMetrics, AnalysisCall
+from tests.test_gemini_service import _service, _png
+
+class UsageModel:
+    async def generate_content_async(self, parts, generation_config=None):
+        return SimpleNamespace(
+            text=json.dumps({"valor_total": 9.9, "estabelecimento": "Loja", "categoria_sugerida": "casa",
+                             "confianca": 0.7}),
+            usage_metadata=SimpleNamespace(prompt_token_count=320, candidates_token_count=45)
+        )
+
+def test_histograms_and_daily_counters():
+    metrics = ReceiptMetrics(days=2)
+    call = AnalysisCall(user_id=1, images=2)
+    call.model_seconds, call.upload_bytes, call.prompt_tokens, call.response_tokens = 1.5, 120_000, 600, 90
+    call.confidences = [0.9, 0.5]
+    metrics.record(call)
+    metrics.record(AnalysisCall(user_id=1))     # do cache, sem chamada ao modelo
+    
+    snapshot = metrics.snapshot()
+    assert snapshot["tokens"] == {"prompt": 600, "response": 90}
+    assert snapshot["histograms"]["model_seconds"] == {"count": 1, "avg": 1.5, "p50": 2, "p95": 2}
+    assert snapshot["histograms"]["confidence"]["count"] == 2
+    
+    (day, counters), = metrics.snapshot(user_id=1)["days"].items()
+    assert counters["calls"] == 2 and counters["model_calls"] == 1 and counters["images"] == 3
+    
+    text = metrics.prometheus()
+    assert 'gedie_receipt_model_seconds_bucket{le="2"} 1' in text
+    assert 'gedie_receipt_model_seconds_bucket{le="+Inf"} 1' in text
+    assert 'gedie_receipt_analyses_total{outcome="ok"} 2' in text
+    assert 'gedie_receipt_tokens_total{kind="prompt"} 600' in text
+
+async def test_gemini_service_records_each_call(monkeypatch):
+    metrics = ReceiptMetrics()
+    monkeypatch.setattr("services.receipt_provider.receipt_metrics", metrics)
+    service = _service(UsageModel())
+    
+    await service.analyze_receipt(_png(), user_id=42)
+    service.model = SimpleNamespace(generate_content_async=None)   # falha: não chamável
+    await service.analyze_receipt(_png(), user_id=42)
+    
+    assert metrics.outcomes == {"ok": 1, "error": 1}
+    assert metrics.prompt_tokens == 320 and metrics.response_tokens == 45
+    assert metrics.histograms["preprocess_seconds"].count == 2
+    assert 0 < metrics.histograms["upload_bytes"].sum < len(_png()) * 2
+    counters = metrics.snapshot(user_id=42)["days"]
+    assert list(counters.values())[0]["prompt_tokens"] == 320
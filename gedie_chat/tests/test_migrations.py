@@ -0,0 +1,47 @@
+from sqlalchemy import create_engine, event, inspect, text
+from migrations.migration_runner import run_migrations, LATEST_VERSION
+
+def test_fresh_database_reaches_latest_version(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+
+    assert run_migrations(engine)
+    assert run_migrations(engine)          # segunda execução: nada pendente
+
+    with engine.connect() as conn:
+        versions = conn.execute(text("SELECT version FROM schema_version")).scalars().all()
+    assert sorted(versions) == list(range(1, LATEST_VERSION + 1))
+
+    indexes = {ix["name"] for ix in inspect(engine).get_indexes("expenses")}
+    assert "ix_expenses_user_data_created" in indexes
+    engine.dispose()
+
+def test_legacy_database_gets_indexes(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    # banco antigo: tabelas criadas por create_all, sem os índices novos
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, telegram_id BIGINT)"))
+        conn.execute(text("CREATE TABLE categories (id INTEGER PRIMARY KEY, user_id INTEGER, "
+                          "ativo BOOLEAN, nome VARCHAR(50), updated_at DATETIME)"))
+        conn.execute(text("CREATE TABLE expenses (id INTEGER PRIMARY KEY, user_id INTEGER, "
+                          "data_gasto DATE, created_at DATETIME)"))
+
+    assert run_migrations(engine)
+
+    indexes = {ix["name"] for ix in inspect(engine).get_indexes("categories")}
+    assert {"ix_categories_user_ativo_nome", "ix_categories_updated_at"} <= indexes
+    engine.dispose()
+
+def test_migration_aborts_when_lock_not_acquired(tmp_path, monkeypatch):
+    engine = create_engine(f"sqlite:///{tmp_path / 'locked.db'}")
+
+    @event.listens_for(engine, "connect")
+    def _get_lock(dbapi_connection, record):
+        # GET_LOCK do MySQL esgotando o tempo (outro processo migrando)
+        dbapi_connection.create_function("GET_LOCK", 2, lambda name, timeout: 0)
+
+    monkeypatch.setattr(engine.dialect, "name", "mysql")
+    assert not run_migrations(engine)
+    monkeypatch.undo()
+
+    assert "schema_version" not in inspect(engine).get_table_names()
+    engine.dispose()
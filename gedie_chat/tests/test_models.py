@@ -28,3 +28,109 @@ def test_expense_crud(db_session):
 
     total_mes = Expense.get_month_total(db_session, user.id, today.month, today.year)
     assert total_mes == 19.9
+
+async def test_expense_async_crud(db_session, async_session_factory):
+    user = User.create_user(db_session, 4, "Dan")
+    cat = Category(nome="Mercado", icone="🛒", cor="#fff", user_id=user.id,
+                   tipo=TipoCategoria.DESPESA).save(db_session)
+
+    async with async_session_factory() as db:
+        found = await User.get_by_telegram_id_async(db, 4)
+        assert found.id == user.id
+
+        categories = await Category.get_user_categories_async(db, user.id)
+        assert [c.nome for c in categories] == ["Mercado"]
+
+        exp = await Expense.create_expense_async(db, user.id, cat.id, 7.5, "Pão")
+        assert float(exp.valor) == 7.5
+
+        today = datetime.date.today()
+        expenses = await Expense.get_user_expenses_async(db, user.id, today, today)
+
+    # categoria carregada junto: acessível sem sessão aberta
+    assert [e.category.nome for e in expenses] == ["Mercado"]
+
+async def test_create_expenses_batch(db_session, async_session_factory):
+    user = User.create_user(db_session, 5, "Eva")
+    cat = Category(nome="Mercado", icone="🛒", cor="#fff", user_id=user.id,
+                   tipo=TipoCategoria.DESPESA).save(db_session)
+
+    async with async_session_factory() as db:
+        created = await Expense.create_expenses_async(
+            db, user.id, [(cat.id, 10, "📷 A"), (cat.id, 2.5, "📷 B")]
+        )
+        await db.commit()
+
+    assert [e.descricao for e in created] == ["📷 A", "📷 B"]
+    assert Expense.get_period_total(db_session, user.id) == 12.5
+
+def test_period_aggregates(db_session):
+    user = User.create_user(db_session, 5, "Eli")
+    food = Category(nome="Comida", icone="🍔", cor="#fff", user_id=user.id,
+                    tipo=TipoCategoria.DESPESA).save(db_session)
+    bus = Category(nome="Ônibus", icone="🚌", cor="#fff", user_id=user.id,
+                   tipo=TipoCategoria.DESPESA).save(db_session)
+
+    d1 = datetime.date(2024, 1, 31)
+    d2 = datetime.date(2024, 2, 1)      # primeiro dia do mês seguinte
+    Expense.create_expense(db_session, user.id, food.id, 10, data_gasto=d1)
+    Expense.create_expense(db_session, user.id, food.id, 20, data_gasto=d1)
+    Expense.create_expense(db_session, user.id, bus.id, 5, data_gasto=d1)
+    Expense.create_expense(db_session, user.id, bus.id, 100, data_gasto=d2)
+
+    # o dia 1º do mês seguinte não entra no total de janeiro
+    assert Expense.get_month_total(db_session, user.id, 1, 2024) == 35.0
+    assert Expense.get_period_total(db_session, user.id, d1, d2) == 135.0
+
+    totals = Expense.get_category_totals(db_session, user.id, d1, d1)
+    assert totals == [(food.id, "Comida", "🍔", 30.0, 2), (bus.id, "Ônibus", "🚌", 5.0, 1)]
+
+    assert Expense.get_daily_totals(db_session, user.id, d1, d2) == [(d1, 35.0), (d2, 100.0)]
+
+    stats = Expense.get_period_stats(db_session, user.id, d1, d1)
+    assert (stats.count, stats.total, stats.maximum) == (3, 35.0, 20.0)
+    assert round(stats.average, 2) == 11.67
+
+    empty = Expense.get_period_stats(db_session, user.id, d2 + datetime.timedelta(days=1))
+    assert empty.count == 0 and empty.total == 0.0
+
+async def test_list_rows_projection(db_session, async_session_factory):
+    user = User.create_user(db_session, 6, "Fia")
+    cat = Category(nome="Café", icone="☕", cor="#fff", user_id=user.id,
+                   tipo=TipoCategoria.DESPESA).save(db_session)
+    today = datetime.date.today()
+    for i in range(15):
+        Expense.create_expense(db_session, user.id, cat.id, i + 1, f"n{i}")
+
+    async with async_session_factory() as db:
+        rows = await Expense.list_rows_async(db, user.id, today, today, limit=10)
+        stats = await Expense.get_period_stats_async(db, user.id, today, today)
+
+    assert len(rows) == 10 and stats.count == 15 and stats.total == 120.0
+    assert rows[0].descricao == "n14"            # mais recente primeiro
+    assert (rows[0].category_nome, rows[0].category_icone) == ("Café", "☕")
+    assert isinstance(rows[0].valor, float)
+
+async def test_list_rows_keyset_pages(db_session, async_session_factory):
+    from utils.pagination import encode_expense_cursor, decode_expense_cursor
+    user = User.create_user(db_session, 7, "Gil")
+    cat = Category(nome="Café", icone="☕", cor="#fff", user_id=user.id,
+                   tipo=TipoCategoria.DESPESA).save(db_session)
+    base = datetime.date(2024, 3, 1)
+    for i in range(7):
+        # dois gastos por dia: desempate por created_at/id
+        Expense.create_expense(db_session, user.id, cat.id, i + 1, f"n{i}",
+                               data_gasto=base + datetime.timedelta(days=i // 2))
+
+    async with async_session_factory() as db:
+        first = await Expense.list_rows_async(db, user.id, limit=3)
+        cursor = decode_expense_cursor(encode_expense_cursor(first[-1]))
+        second = await Expense.list_rows_async(db, user.id, limit=3, after=cursor)
+        rest = await Expense.list_rows_async(db, user.id, limit=3,
+                                             after=decode_expense_cursor(encode_expense_cursor(second[-1])))
+        back = await Expense.list_rows_async(db, user.id, limit=3,
+                                             before=decode_expense_cursor(encode_expense_cursor(second[0])))
+
+    assert [r.descricao for r in first + second + rest] == [f"n{i}" for i in reversed(range(7))]
+    assert back == first
+    assert decode_expense_cursor("not-a-cursor") is None
@@ -0,0 +1,38 @@
+"""
+Testes da leitura do QR Code de NFC-e / CF-e SAT
+"""
+
+from services.nfce_service import parse_receipt_qr, qr_analysis_result, valid_access_key
+
+NFCE_KEY = "35240612345678000190650010000123451123456784"
+SAT_KEY = "35240612345678000190590010000123451123456786"
+
+def test_access_key_check_digit():
+    assert valid_access_key(NFCE_KEY)
+    assert not valid_access_key(NFCE_KEY[:-1] + "5")
+    assert not valid_access_key(NFCE_KEY[:-1])
+
+def test_parse_nfce_v1_with_total():
+    info = parse_receipt_qr(
+        f"https://www.nfce.fazenda.sp.gov.br/qrcode?chNFe={NFCE_KEY}&nVersao=100&tpAmb=1&vNF=27.90&cIdToken=000001"
+    )
+    assert info == {"chave": NFCE_KEY, "cnpj": "12345678000190", "modelo": "NFC-e", "valor_total": 27.90}
+
+def test_parse_nfce_v2_total_only_offline():
+    online = parse_receipt_qr(f"https://sefaz.rs.gov.br/NFCE/NFCE-COM.aspx?p={NFCE_KEY}|2|1|1|ABCDEF0123")
+    offline = parse_receipt_qr(f"https://sefaz.rs.gov.br/NFCE/NFCE-COM.aspx?p={NFCE_KEY}|2|1|05|43.10|6d7a|1|ABCDEF0123")
+    
+    assert online["valor_total"] is None          # sem valor: segue para a IA
+    assert offline["valor_total"] == 43.10
+
+def test_parse_sat_and_result_format():
+    info = parse_receipt_qr(f"{SAT_KEY}|20240612123000|15.00||assinatura")
+    result = qr_analysis_result(info)
+    
+    assert info["modelo"] == "CF-e SAT"
+    assert result["valor_total"] == 15.00 and result["confianca"] == 1.0
+    assert result["estabelecimento"] == "CNPJ 12.345.678/0001-90"
+
+def test_parse_rejects_other_qr_codes():
+    assert parse_receipt_qr("https://example.com/menu") is None
+    assert parse_receipt_qr(f"https://x/qrcode?chNFe={NFCE_KEY[:-1]}0&vNF=1.00") is None
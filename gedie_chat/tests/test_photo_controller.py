@@ -0,0 +1,64 @@
+import asyncio
+import pytest
+from controllers.photo_controller import PhotoController
+
+class FakeQueue:
+    """Fila que responde na hora com o resultado configurado"""
+
+    def __init__(self, result):
+        self.result = result
+
+    async def submit(self, job):
+        await job.on_done(self.result)
+        return 0
+
+class DummyMessage:
+    async def edit_text(self, text, **_):
+        self.text = text
+
+async def _analyze_album(monkeypatch, result, images):
+    monkeypatch.setattr("controllers.photo_controller.analysis_queue", FakeQueue(result))
+    monkeypatch.setattr("controllers.photo_controller.read_receipt_qr", lambda image: asyncio.sleep(0))
+    controller = PhotoController()
+    finished = []
+
+    async def finish(message, analysis_result, user_id):
+        finished.append(analysis_result)
+
+    monkeypatch.setattr(controller, "_finish_analysis", finish)
+    await controller._start_analysis(DummyMessage(), 7, images)
+    return finished
+
+@pytest.mark.asyncio
+async def test_album_result_count_mismatch_becomes_error(monkeypatch):
+    finished = await _analyze_album(monkeypatch, {"comprovantes": [{"valor_total": 1.0}]}, [b"a", b"b"])
+    assert finished[0]["erro"] and "cada foto" in finished[0]["observacoes"]
+
+    ok = [{"valor_total": 1.0}, {"valor_total": 2.0}]
+    assert await _analyze_album(monkeypatch, {"comprovantes": ok}, [b"a", b"b"]) == [{"comprovantes": ok}]
+
+@pytest.mark.asyncio
+async def test_stop_cancels_pending_album_flush(monkeypatch):
+    controller = PhotoController()
+    flush_started = asyncio.Event()
+
+    async def flush(media_group_id):
+        flush_started.set()
+        await asyncio.sleep(10)
+
+    monkeypatch.setattr(controller, "_flush_media_group", flush)
+
+    class Update:
+        effective_user = type("U", (), {"id": 7})
+        message = type("M", (), {"reply_text": staticmethod(lambda *a, **k: asyncio.sleep(0, DummyMessage()))})
+
+    async def download(update):
+        return b"img"
+
+    monkeypatch.setattr(controller, "_download_photo", download)
+    await controller._collect_media_group(Update(), "g1")
+    await flush_started.wait()
+
+    (task,) = controller._flush_tasks
+    await controller.stop()
+    assert task.cancelled() and not controller._flush_tasks
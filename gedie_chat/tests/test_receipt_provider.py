@@ -0,0 +1,75 @@
+"""
+Testes do provedor de análise (criação tardia e provedor fake)
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import pytest
+from services.receipt_provider import ReceiptProvider, FakeReceiptProvider, get_receipt_provider, set_receipt_provider
+from services.analysis_queue import AnalysisQueue, AnalysisJob
+from tests.test_gemini_service import _png
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_controllers_import_without_gemini_sdk():
+    env = dict(os.environ, RECEIPT_PROVIDER="gemini")
+    env.pop("GEMINI_API_KEY", None)
+    code = (
+        "import sys; sys.path.insert(0, 'src'); import controllers.bot_controller; "
+        "assert 'google.generativeai' not in sys.modules"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, check=True, capture_output=True)
+
+async def test_fake_provider_is_deterministic_with_latency():
+    provider = FakeReceiptProvider(latency=0.05, result={"confianca": 0.5})
+    png = _png()
+    
+    started = time.perf_counter()
+    first = await provider.analyze_receipt(png)
+    assert time.perf_counter() - started >= 0.05
+    
+    batch = await provider.analyze_receipts([png, png])
+    assert batch["comprovantes"] == [first, first]
+    assert first["valor_total"] > 0 and first["confianca"] == 0.5
+
+def test_incomplete_provider_fails_on_creation():
+    class SingleOnly(ReceiptProvider):
+        async def analyze_receipt(self, image_data, use_cache=True, user_id=None):
+            return {}
+    
+    with pytest.raises(TypeError):
+        SingleOnly()
+
+async def test_fake_provider_failures_become_error_results(monkeypatch):
+    async def broken(image):
+        raise OSError("imagem corrompida")
+    
+    monkeypatch.setattr("services.receipt_provider.preprocess_receipt_async", broken)
+    provider = FakeReceiptProvider(latency=0)
+    
+    single = await provider.analyze_receipt(b"x")
+    batch = await provider.analyze_receipts([b"x", b"y"])
+    assert single["erro"] and batch["erro"] and not batch["transitorio"]
+    assert "imagem corrompida" in single["observacoes"]
+
+async def test_queue_uses_configured_provider():
+    set_receipt_provider(FakeReceiptProvider(latency=0))
+    queue = AnalysisQueue(workers=2)
+    done = []
+    
+    async def on_done(result):
+        done.append(result)
+    
+    try:
+        assert isinstance(get_receipt_provider(create=False), FakeReceiptProvider)
+        await queue.submit(AnalysisJob(1, _png(), on_done))
+        await queue.submit(AnalysisJob(1, [_png(), _png()], on_done))
+        while len(done) < 2:
+            await asyncio.sleep(0.01)
+        assert "valor_total" in done[0] and len(done[1]["comprovantes"]) == 2
+    finally:
+        await queue.stop()
+        set_receipt_provider(None)
@@ -0,0 +1,248 @@
+import pytest
+from utils.state_backends import MemoryStateBackend, SQLiteStateBackend, RedisStateBackend
+from utils.state_manager import StateManager, ConversationState
+
+class FakeRedis:
+    """Cliente mínimo no estilo redis-py que conta idas ao servidor"""
+
+    def __init__(self):
+        self.store = {}
+        self.round_trips = 0
+
+    def mget(self, keys):
+        self.round_trips += 1
+        return [self.store.get(key.decode() if isinstance(key, bytes) else key) for key in keys]
+
+    def scan_iter(self, match):
+        prefix = match.rstrip("*")
+        return [key.encode() for key in self.store if key.startswith(prefix)]
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def set(self, key, value, ex=None):
+        self.commands.append(("set", key, value))
+
+    def delete(self, key):
+        self.commands.append(("delete", key, None))
+
+    def execute(self):
+        self.client.round_trips += 1
+        for op, key, value in self.commands:
+            if op == "set":
+                self.client.store[key] = value.encode()
+            else:
+                self.client.store.pop(key, None)
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return MemoryStateBackend()
+    if request.param == "sqlite":
+        return SQLiteStateBackend(str(tmp_path / "states.db"))
+    return RedisStateBackend(FakeRedis())
+
+def test_backend_roundtrip(backend):
+    manager = StateManager(backend)
+    manager.set_state(10, ConversationState.WAITING_AMOUNT, {"category_id": 3})
+    manager.update_data(10, "amount", 12.5)
+
+    assert manager.get_state(10) == ConversationState.WAITING_AMOUNT
+    assert manager.get_data(10) == {"category_id": 3, "amount": 12.5}
+    assert list(manager.list_all_states()) == [10]
+
+    manager.clear_state(10)
+    assert manager.get_state(10) == ConversationState.IDLE
+    assert manager.list_all_states() == {}
+
+def test_sqlite_survives_restart(tmp_path):
+    path = str(tmp_path / "states.db")
+    StateManager(SQLiteStateBackend(path)).set_state(
+        20, ConversationState.CONFIRMING_EXPENSE, {"photo_analysis": {"valor": 9.9}, "source": "photo"}
+    )
+
+    restarted = StateManager(SQLiteStateBackend(path))
+    assert restarted.get_state(20) == ConversationState.CONFIRMING_EXPENSE
+    assert restarted.get_data(20)["photo_analysis"] == {"valor": 9.9}
+
+@pytest.mark.asyncio
+async def test_update_scope_single_round_trip_each_way():
+    client = FakeRedis()
+    manager = StateManager(RedisStateBackend(client))
+
+    async with manager.update_scope(30):
+        manager.set_state(30, ConversationState.WAITING_AMOUNT, {"category_id": 1})
+        manager.update_data(30, "amount", 5)
+        assert manager.get_data(30) == {"category_id": 1, "amount": 5}
+        assert client.round_trips == 1          # só a leitura inicial
+
+    assert client.round_trips == 2              # uma escrita em lote no final
+
+    async with manager.update_scope(30):
+        assert manager.get_state(30) == ConversationState.WAITING_AMOUNT
+    assert client.round_trips == 3              # update só de leitura: nada a gravar
+
+@pytest.mark.asyncio
+async def test_update_scope_discards_on_error(tmp_path):
+    manager = StateManager(SQLiteStateBackend(str(tmp_path / "states.db")))
+
+    with pytest.raises(RuntimeError):
+        async with manager.update_scope(40):
+            manager.set_state(40, ConversationState.WAITING_AMOUNT)
+            raise RuntimeError("falha no handler")
+
+    assert manager.get_state(40) == ConversationState.IDLE
+
+@pytest.mark.asyncio
+async def test_async_access_outside_update_scope(tmp_path, monkeypatch):
+    import asyncio
+    import contextvars
+    import threading
+    manager = StateManager(SQLiteStateBackend(str(tmp_path / "states.db")))
+    manager.set_state(50, ConversationState.WAITING_AMOUNT)
+
+    threads = []
+    load = manager.backend.load_many
+    monkeypatch.setattr(manager.backend, "load_many",
+                        lambda ids: threads.append(threading.current_thread()) or load(ids))
+
+    record = await manager.get_record_async(50)
+    assert record.state == ConversationState.WAITING_AMOUNT
+    assert threads[-1] is not threading.main_thread()     # fora do event loop
+
+    # clear (vindo de outra task, como a introspecção) espera o update do usuário terminar
+    async with manager.update_scope(50):
+        clearing = asyncio.get_running_loop().create_task(
+            manager.clear_state_async(50), context=contextvars.Context()
+        )
+        await asyncio.sleep(0.01)
+        assert not clearing.done()
+        manager.update_data(50, "amount", 7)
+    await clearing
+    assert await manager.get_record_async(50) is None
+
+    async with manager.update_scope(50):
+        with pytest.raises(RuntimeError):
+            manager.get_state(51)                           # usuário não declarado no escopo
+
+def test_memory_backend_expiry_and_lru(monkeypatch):
+    import utils.state_manager as sm
+    clock = [1000.0]
+    monkeypatch.setattr("time.time", lambda: clock[0])
+    monkeypatch.setitem(sm.STATE_TTLS, ConversationState.WAITING_AMOUNT, 60)
+    manager = StateManager(MemoryStateBackend(max_entries=2))
+
+    manager.set_state(1, ConversationState.WAITING_AMOUNT)
+    clock[0] += 30
+    manager.set_state(2, ConversationState.WAITING_AMOUNT)
+    clock[0] += 40                                     # 1 venceu, 2 ainda não
+    assert manager.get_state(1) == ConversationState.IDLE
+    assert manager.get_state(2) == ConversationState.WAITING_AMOUNT
+
+    manager.set_state(3, ConversationState.WAITING_AMOUNT)
+    manager.set_state(4, ConversationState.WAITING_AMOUNT)   # 2 é o menos usado
+    assert sorted(manager.list_all_states()) == [3, 4]
+    assert manager.stats() == {
+        'backend': 'MemoryStateBackend', 'size': 2, 'max_entries': 2, 'expired': 1, 'evicted': 1,
+        'active_locks': 0
+    }
+
+@pytest.mark.asyncio
+async def test_failed_update_keeps_memory_expiry_and_skips_listeners(monkeypatch):
+    import utils.state_manager as sm
+    clock = [1000.0]
+    monkeypatch.setattr("time.time", lambda: clock[0])
+    monkeypatch.setitem(sm.STATE_TTLS, ConversationState.WAITING_AMOUNT, 60)
+    manager = StateManager(MemoryStateBackend())
+    events = []
+    manager.add_listener(lambda user_id, record: events.append((user_id, record.state)))
+
+    manager.set_state(6, ConversationState.WAITING_AMOUNT)
+    clock[0] += 30
+    with pytest.raises(RuntimeError):
+        async with manager.update_scope(6):
+            manager.update_data(6, "amount", 3)             # novo prazo só no registro
+            raise RuntimeError("falha no handler")
+
+    assert manager.get_record(6).expires_at == 1060        # prazo que está no heap
+    assert events == [(6, ConversationState.WAITING_AMOUNT)]
+    clock[0] += 31
+    assert manager.get_record(6) is None                  # vence no prazo original
+
+    async with manager.update_scope(7):
+        manager.set_state(7, ConversationState.WAITING_AMOUNT)
+        assert len(events) == 1                             # só depois de gravar
+    assert events[-1] == (7, ConversationState.WAITING_AMOUNT)
+
+def test_sqlite_backend_expiry(tmp_path, monkeypatch):
+    import utils.state_manager as sm
+    clock = [1000.0]
+    monkeypatch.setattr("time.time", lambda: clock[0])
+    monkeypatch.setitem(sm.STATE_TTLS, ConversationState.CONFIRMING_EXPENSE, 60)
+    manager = StateManager(SQLiteStateBackend(str(tmp_path / "states.db")))
+
+    manager.set_state(5, ConversationState.CONFIRMING_EXPENSE, {"photo_analysis": {"valor": 1}})
+    clock[0] += 61
+    assert manager.get_state(5) == ConversationState.IDLE
+    manager.set_state(6, ConversationState.IDLE)       # escrita remove os vencidos
+    assert manager.stats()['expired'] == 1
+
+def test_snapshot_restore_drops_expired(tmp_path, monkeypatch):
+    import utils.state_manager as sm
+    from services.state_snapshot_service import StateSnapshotService
+    clock = [1000.0]
+    monkeypatch.setattr("time.time", lambda: clock[0])
+    monkeypatch.setitem(sm.STATE_TTLS, ConversationState.WAITING_AMOUNT, 60)
+    monkeypatch.setitem(sm.STATE_TTLS, ConversationState.CONFIRMING_EXPENSE, 600)
+
+    before = StateManager(MemoryStateBackend())
+    before.select_category(1, 7)                                   # vence em 1060
+    before.set_photo_analysis(2, {"valor": 42.5, "itens": ["café"]}, 3)
+    path = str(tmp_path / "states.bin")
+    assert StateSnapshotService(path, manager=before).write() == 2
+
+    clock[0] += 120
+    after = StateManager(MemoryStateBackend())
+    assert StateSnapshotService(path, manager=after).restore() == 1
+    assert after.get_state(1) == ConversationState.IDLE
+    assert after.get_record(2).photo_analysis == {"valor": 42.5, "itens": ["café"]}
+    assert after.get_data(2)["category_id"] == 3
+
+@pytest.mark.asyncio
+async def test_snapshot_loop_reads_memory_backend_on_event_loop(tmp_path, monkeypatch):
+    import asyncio
+    import os
+    import threading
+    from services.state_snapshot_service import StateSnapshotService
+    manager = StateManager(MemoryStateBackend())
+    manager.select_category(1, 7)
+    threads = []
+    items = manager.backend.items
+    monkeypatch.setattr(manager.backend, "items", lambda: threads.append(threading.current_thread()) or items())
+
+    path = str(tmp_path / "states.bin")
+    task = asyncio.ensure_future(StateSnapshotService(path, interval=0.01, manager=manager).run())
+    try:
+        while not os.path.exists(path):
+            await asyncio.sleep(0.01)
+    finally:
+        task.cancel()
+    assert threads and all(thread is threading.main_thread() for thread in threads)
+
+def test_incomplete_backend_fails_on_creation():
+    from utils.state_backends import StateBackend
+
+    class NoItems(StateBackend):
+        def load_many(self, user_ids):
+            return {}
+
+        def save_many(self, records):
+            pass
+
+    with pytest.raises(TypeError):
+        NoItems()
@@ -16,3 +16,44 @@ def test_clear_state():
     state_manager.clear_state(uid)
     assert state_manager.get_state(uid) == ConversationState.IDLE
     assert state_manager.get_data(uid) == {}
+
+def test_record_transitions_without_copy():
+    import pytest
+    uid = 888
+    state_manager.select_category(uid, 4)
+    record = state_manager.get_record(uid)
+
+    state_manager.set_amount(uid, 12.0)
+    state_manager.request_description(uid)
+
+    # mesmo objeto em todas as transições, dados preservados
+    assert state_manager.get_record(uid) is record
+    assert record.state == ConversationState.WAITING_DESCRIPTION
+    assert dict(state_manager.get_data(uid)) == {"category_id": 4, "amount": 12.0}
+
+    # visão somente leitura, campos fixos
+    with pytest.raises(TypeError):
+        state_manager.get_data(uid)["amount"] = 1
+    with pytest.raises(KeyError):
+        state_manager.update_data(uid, "unknown", 1)
+    assert not hasattr(record, "__dict__")
+    state_manager.clear_state(uid)
+
+async def test_update_scope_serializes_same_user():
+    import asyncio
+    from utils.state_manager import StateManager
+    manager = StateManager()
+    events = []
+
+    async def update(user_id, name, delay):
+        async with manager.update_scope(user_id):
+            events.append(f"{name}:start")
+            await asyncio.sleep(delay)
+            events.append(f"{name}:end")
+
+    await asyncio.gather(update(1, "a1", 0.05), update(1, "a2", 0), update(2, "b", 0))
+
+    # mesmo usuário em ordem; outro usuário não espera
+    assert events.index("a1:end") < events.index("a2:start")
+    assert events.index("b:end") < events.index("a1:end")
+    assert len(manager.locks) == 0                 # locks ociosos descartados
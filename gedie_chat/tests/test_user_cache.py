@@ -0,0 +1,37 @@
+from models.user_model import User
+from utils.ttl_cache import TTLCache
+from utils.user_cache import CachedUser, user_cache
+
+def _cached(uid):
+    return CachedUser(id=uid, nome="X", ativo=True, timezone="America/Sao_Paulo", has_code=False)
+
+def test_lru_and_ttl():
+    cache = TTLCache('test', max_size=2, ttl=60)
+    cache.set(1, _cached(1))
+    cache.set(2, _cached(2))
+    cache.get(1)                       # 1 passa a ser o mais recente
+    cache.set(3, _cached(3))           # remove o 2
+    assert cache.get(2) is None
+    assert cache.get(1).id == 1
+
+    cache.ttl = -1
+    cache.set(4, _cached(4))
+    assert cache.get(4) is None        # já expirado
+
+    stats = cache.stats()
+    assert stats["hits"] == 2 and stats["misses"] == 2
+
+async def test_get_cached_and_invalidation(db_session, async_session_factory):
+    user = User.create_user(db_session, 77, "Gil")
+
+    async with async_session_factory() as db:
+        first = await User.get_cached_async(db, 77)
+        again = await User.get_cached_async(db, 77)
+        assert first == again and first.id == user.id and not first.has_code
+        assert user_cache.stats()["hits"] == 1
+
+        await User.update_access_code_async(db, user.id, "123456")
+        await db.commit()
+        assert user_cache.get(77) is None
+
+        assert (await User.get_cached_async(db, 77)).has_code
@@ -1,11 +1,12 @@
 import pytest
 from controllers.user_controller import UserController
 from models.user_model import User
+from models.category_model import Category
 
 @pytest.mark.asyncio
-async def test_get_or_create_user(monkeypatch, _engine_and_session):
+async def test_get_or_create_user(monkeypatch, _engine_and_session, async_session_factory):
     _, TestSessionLocal = _engine_and_session
-    monkeypatch.setattr("controllers.user_controller.SessionLocal", TestSessionLocal)
+    monkeypatch.setattr("middlewares.db_session_middleware.AsyncSessionLocal", async_session_factory)
 
     uc = UserController()
     await uc.get_or_create_user(telegram_id=999, name="Tester")
@@ -13,3 +14,77 @@ async def test_get_or_create_user(monkeypatch, _engine_and_session):
     with TestSessionLocal() as s:
         reloaded = User.get_by_telegram_id(s, 999)
         assert reloaded.nome == "Tester"
+
+@pytest.mark.asyncio
+async def test_onboarding_is_idempotent(monkeypatch, _engine_and_session, async_session_factory):
+    _, TestSessionLocal = _engine_and_session
+    monkeypatch.setattr("middlewares.db_session_middleware.AsyncSessionLocal", async_session_factory)
+
+    uc = UserController()
+    first = await uc.get_or_create_user(telegram_id=1000, name="Race")
+
+    # segundo /start que "perdeu a corrida": cache vazio, usuário já existe
+    from utils.user_cache import user_cache
+    user_cache.clear()
+    async with async_session_factory() as db:
+        user_id, created = await User.insert_if_absent_async(db, 1000, "Race")
+        assert (user_id, created) == (first.id, False)
+
+    second = await uc.get_or_create_user(telegram_id=1000, name="Race")
+    assert second.id == first.id
+
+    with TestSessionLocal() as s:
+        assert len(Category.get_user_categories(s, first.id)) == 8
+
+@pytest.mark.asyncio
+async def test_concurrent_start_uses_user_created_by_other_session(monkeypatch, _engine_and_session,
+                                                                    async_session_factory):
+    _, TestSessionLocal = _engine_and_session
+    monkeypatch.setattr("middlewares.db_session_middleware.AsyncSessionLocal", async_session_factory)
+    from middlewares.db_session_middleware import _current_session
+    from utils.user_cache import user_cache
+    uc = UserController()
+
+    async with async_session_factory() as db_a:
+        # Sessão A: /start que começou antes e ainda não encontrou o usuário
+        assert await User.get_cached_async(db_a, 1001) is None
+
+        # Sessão B: outro /start cria o usuário e commita no meio do caminho
+        other = await uc.get_or_create_user(telegram_id=1001, name="Duplo")
+        user_cache.clear()
+
+        # A continua na própria sessão: INSERT ignorado, usa o usuário de B
+        token = _current_session.set(db_a)
+        try:
+            user = await uc.get_or_create_user(telegram_id=1001, name="Duplo")
+            await db_a.commit()
+        finally:
+            _current_session.reset(token)
+
+    assert user is not None and user.id == other.id
+    with TestSessionLocal() as s:
+        assert len(Category.get_user_categories(s, other.id)) == 8
+
+@pytest.mark.asyncio
+async def test_user_cached_only_after_commit(monkeypatch, _engine_and_session, async_session_factory):
+    _, TestSessionLocal = _engine_and_session
+    monkeypatch.setattr("middlewares.db_session_middleware.AsyncSessionLocal", async_session_factory)
+    from middlewares.db_session_middleware import with_db_session
+    from utils.user_cache import user_cache
+    uc = UserController()
+
+    async def failing(update, context):
+        assert await uc.get_or_create_user(telegram_id=1002, name="Volta") is not None
+        raise RuntimeError("falha depois de criar o usuário")
+
+    with pytest.raises(RuntimeError):
+        await with_db_session(failing)(None, None)
+    assert user_cache.get(1002) is None
+    with TestSessionLocal() as s:
+        assert User.get_by_telegram_id(s, 1002) is None
+
+    async def ok(update, context):
+        return await uc.get_or_create_user(telegram_id=1002, name="Volta")
+
+    user = await with_db_session(ok)(None, None)
+    assert user_cache.get(1002) is user
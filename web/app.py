@@ -4,11 +4,12 @@ GEDIE Web Application
 Sistema de Gestão de Despesas Inteligente - Frontend Web
 """
 
-from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, has_request_context
 from werkzeug.security import generate_password_hash, check_password_hash
 import mysql.connector
 from mysql.connector import Error
 import os
+import time
 from datetime import datetime, timedelta
 from functools import wraps
 
@@ -25,14 +26,35 @@ DB_CONFIG = {
     'charset': 'utf8mb4'
 }
 
+# Réplica de leitura (opcional): consultas do dashboard saem do primário
+DB_REPLICA_CONFIG = (
+    dict(DB_CONFIG, host=os.environ['MYSQL_REPLICA_HOST'],
+         port=int(os.environ.get('MYSQL_REPLICA_PORT', DB_CONFIG['port'])))
+    if os.environ.get('MYSQL_REPLICA_HOST') else None
+)
+
+# Após uma escrita, o usuário lê do primário por esta janela (read-your-writes)
+READ_STICKINESS_SECONDS = float(os.environ.get('READ_STICKINESS_SECONDS', 5))
+
 class DatabaseManager:
     """Gerenciador de conexões com o banco de dados"""
     
     @staticmethod
-    def get_connection():
-        """Criar conexão com o banco"""
+    def _use_replica():
+        """Leituras vão para a réplica, salvo logo após uma escrita do usuário"""
+        if DB_REPLICA_CONFIG is None:
+            return False
+        if has_request_context():
+            last_write = session.get('last_write_at', 0)
+            return time.time() - last_write > READ_STICKINESS_SECONDS
+        return True
+    
+    @staticmethod
+    def get_connection(read_only=False):
+        """Criar conexão com o banco (réplica para leituras, se configurada)"""
+        db_config = DB_REPLICA_CONFIG if read_only and DatabaseManager._use_replica() else DB_CONFIG
         try:
-            connection = mysql.connector.connect(**DB_CONFIG)
+            connection = mysql.connector.connect(**db_config)
             return connection
         except Error as e:
             print(f"Erro ao conectar com MySQL: {e}")
@@ -41,7 +63,7 @@ class DatabaseManager:
     @staticmethod
     def execute_query(query, params=None, fetch=False):
         """Executar query no banco"""
-        connection = DatabaseManager.get_connection()
+        connection = DatabaseManager.get_connection(read_only=bool(fetch))
         if not connection:
             return None
         
@@ -54,6 +76,8 @@ class DatabaseManager:
             else:
                 connection.commit()
                 result = cursor.rowcount
+                if has_request_context():
+                    session['last_write_at'] = time.time()
             
             return result
         except Error as e: